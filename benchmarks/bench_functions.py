@@ -0,0 +1,121 @@
+"""
+Micro-benchmarks for pure-Python functions that are on the path of most commands, using large inputs to catch
+poor scaling. They require pytest-benchmark and are run with "tox -e bench", which compares each run (without saving
+it) to the fixed baseline in benchmarks/.baselines and fails if the mean time regresses by more than the threshold set
+in tox.ini. The baseline is saved on a machine with "tox -e bench-baseline" first, and again only on purpose.
+"""
+import os
+
+import pytest
+
+from workspace.commands import test as wst_test
+from workspace.commands.commit import Commit
+from workspace.commands.helpers import ToxIni, expand_product_groups
+from workspace.scm import all_branches, extract_commit_msgs
+
+
+@pytest.fixture()
+def git_log():
+    """ Git log output with 100k lines """
+    entries = []
+    for i in range(10000):
+        entries.append('commit {:040x}\nAuthor: Dev <dev@example.com>\nDate:   Mon Oct 19 07:46:32 2026 +0000\n\n'
+                       '    Change {} to something\n\n    More details about the change\n    spanning lines\n'.format(i, i))
+    return '\n'.join(entries)
+
+
+def test_extract_commit_msgs(benchmark, git_log):
+    msgs = benchmark(extract_commit_msgs, git_log)
+    assert len(msgs) == 10000
+
+
+@pytest.mark.parametrize('verbose', [False, True])
+def test_all_branches(benchmark, monkeypatch, verbose):
+    lines = ['* master                 1234567 [upstream/master] Latest change']
+    for i in range(20000):
+        if i % 2:
+            lines.append('  feature-{0}@master     1234567 [origin/feature-{0}@master: ahead 1] Change {0}'.format(i))
+        else:
+            lines.append('  release-{0}            1234567 [upstream/release-{0}] Change {0}'.format(i))
+    if not verbose:
+        lines = ['* master'] + [line.split()[0] for line in lines[1:]]
+    branch_output = '\n'.join(lines)
+
+    def silent_run(cmd, **kwargs):
+        return 'origin\nupstream' if cmd == 'git remote' else branch_output
+
+    monkeypatch.setattr('workspace.scm.silent_run', silent_run)
+
+    branches = benchmark(all_branches.__wrapped__, verbose=verbose)  # Without memoization to measure parsing
+    assert len(branches) == 20001
+
+
+def test_expand_product_groups(benchmark, monkeypatch):
+    levels, width, size = 4, 5, 20
+    groups = {}
+    for level in range(levels):
+        for group in range(width):
+            name = 'group-{}-{}'.format(level, group)
+            groups[name] = ['product-{}-{}-{}'.format(level, group, p) for p in range(size)]
+            if level < levels - 1:
+                groups[name].extend('group-{}-{}'.format(level + 1, g) for g in range(width))
+                groups[name].append('-product-{}-0-0'.format(level + 1))
+
+    monkeypatch.setattr('workspace.commands.helpers.product_groups', lambda: groups)
+
+    products = benchmark(expand_product_groups, ['group-0-0', 'group-1-1', 'extra-product'])
+    assert 'product-1-0-0' not in products
+    assert len(products) == 1 + size + (levels - 1) * (width * size - 1)
+
+
+@pytest.fixture()
+def tox_ini(tmp_path):
+    envs = ['env{}'.format(i) for i in range(200)]
+    content = ['[tox]', 'envlist = ' + ', '.join(envs), '', '[testenv]',
+               'envdir = {homedir}/.virtualenvs/{envname}', 'commands =', '    pytest {env:PYTESTARGS:}', '']
+    for env in envs:
+        content.extend(['[testenv:{}]'.format(env), 'commands =',
+                        '    pytest {env:PYTESTARGS:} --cov {toxinidir} \\',
+                        '           --cov-report=html', '    flake8 {toxinidir} --config {toxinidir}/tox.ini', ''])
+    path = tmp_path / 'tox.ini'
+    path.write_text('\n'.join(content))
+    return str(path)
+
+
+def test_tox_ini_commands(benchmark, tox_ini):
+    def commands():
+        tox = ToxIni(tox_ini=tox_ini)  # Not ToxIni.load() as that caches the expanded values
+        return [tox.commands(env) for env in tox.envlist] + [tox.envdir(env) for env in tox.envlist]
+
+    results = benchmark(commands)
+    assert len(results) == 400
+
+
+def test_tox_ini_expand_vars(benchmark, tox_ini):
+    tox = ToxIni(tox_ini=tox_ini)
+    values = ['{homedir}/.virtualenvs/{envname}/{inidir}/%d' % i for i in range(10000)]
+
+    expanded = benchmark(lambda: [tox.expand_vars(v, {'envname': 'test'}) for v in values])
+    assert expanded[0] == os.path.expanduser('~') + '/.virtualenvs/test/' + os.path.dirname(tox_ini) + '/0'
+
+
+def test_branch_for_msg(benchmark):
+    branches = ['fix-bug-{}@master'.format(i) for i in range(20000)]
+    msg = 'Fix a big bad bug in the parser that causes ' + ' '.join('word{}'.format(i) for i in range(500))
+
+    branch = benchmark(Commit._branch_for_msg, msg, words=3, branches=branches, current_branch='master')
+    assert branch == 'fix-a-big-bad@master'
+
+
+@pytest.mark.parametrize('result', ['passed', 'failed'])
+def test_summarize(benchmark, result):
+    lines = ['============================= test session starts ==============================']
+    lines.extend('tests/test_module_{}.py::test_function_{} PASSED                  [ 50%]'.format(i, i)
+                 for i in range(60000))
+    lines.append('=============== 60000 {} in 12.34 seconds ==============='.format(result))
+    output = '\n'.join(lines)
+    assert len(output) > 4 * 1024 * 1024
+
+    success, summary = benchmark(wst_test.Test.summarize, output)
+    assert success == (result == 'passed')
+    assert summary == '60000 {} in 12.34 seconds'.format(result)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+End to end benchmark of wst commands against a generated workspace.
+
+It generates a workspace of N repos, each with local bare "origin" / "upstream" remotes, a history of C commits,
+and M branches (a mix of parent branches like 1.0.x and child branches like feature-1@master), then times wst
+commands from a separate process (so startup is included) and writes the results as JSON.
+
+To compare versions, run it with each version's wst and compare the results::
+
+    python benchmarks/bench_workspace.py --repos 100 --output new.json
+    python benchmarks/bench_workspace.py --repos 100 --wst ~/.virtualenvs/wst-old/bin/wst --compare new.json
+
+The "test" benchmark requires tox. The workspace is generated in a temp dir unless --dir is given, which can be
+reused across runs with --reuse to skip generation.
+"""
+import argparse
+from contextlib import contextmanager
+import json
+from multiprocessing import Pool
+import os
+import platform
+import shutil
+from statistics import mean, median
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, time
+
+
+PARENT_BRANCHES = ['1.0.x', '2.0.x']
+MERGE_BRANCHES = ' '.join(PARENT_BRANCHES + ['master'])
+BASE_REPO = 'repo-0'
+
+TOX_INI = """\
+[tox]
+envlist = py
+skipsdist = True
+
+[testenv]
+commands =
+    python bench_test.py
+"""
+BENCH_TEST_PY = """\
+print('============================= test session starts ==============================')
+print('============================== 1 passed in 0.01 seconds ========================')
+"""
+
+#: Benchmarks as (name, working dir relative to workspace, wst args, untimed setup git args, untimed teardown git args)
+BENCHMARKS = [
+    ('status', '.', ['status'], None, None),
+    ('update', '.', ['update'], None, None),
+    ('diff', '.', ['diff'], None, None),
+    ('checkout', BASE_REPO, ['checkout', PARENT_BRANCHES[-1]], None, ['checkout', 'master']),
+    ('clean', BASE_REPO, ['clean'], None, None),
+    ('merge', BASE_REPO, ['merge', '--downstreams', '-n', '--merge-branches', MERGE_BRANCHES],
+     ['checkout', PARENT_BRANCHES[0]], ['checkout', 'master']),
+    ('test', BASE_REPO, ['test', '--test-dependents'], None, None),
+]
+
+
+def git(*args, **kwargs):
+    kwargs.setdefault('stdout', subprocess.DEVNULL)
+    kwargs.setdefault('stderr', subprocess.DEVNULL)
+    return subprocess.run(['git'] + list(args), check=True, **kwargs)
+
+
+def history_stream(name, commits, files, branches, depends_on_base):
+    """ Returns a git fast-import stream with the given number of commits and branches """
+    stream = []
+    now = int(time()) - commits * 60
+
+    def data(content):
+        content = content.encode()
+        stream.append(b'data %d\n%s\n' % (len(content), content))
+
+    def commit(ref, mark, parent, msg, changes):
+        stream.append(b'commit %s\nmark :%d\n' % (ref.encode(), mark))
+        stream.append(b'committer Bench <bench@example.com> %d +0000\n' % (now + mark * 60))
+        data(msg)
+        if parent:
+            stream.append(b'from :%d\n' % parent)
+        for path, content in changes:
+            stream.append(b'M 644 inline %s\n' % path.encode())
+            data(content)
+
+    initial = [('README.rst', name + '\n'), ('tox.ini', TOX_INI), ('bench_test.py', BENCH_TEST_PY),
+               ('requirements.txt', BASE_REPO + '\n' if depends_on_base else '')]
+    initial.extend(('src/module_%d.py' % f, 'value = 0\n') for f in range(files))
+    commit('refs/heads/master', 1, None, 'Initial commit', initial)
+
+    for mark in range(2, commits + 1):
+        module = 'src/module_%d.py' % (mark % files)
+        commit('refs/heads/master', mark, mark - 1, 'Change %d in %s' % (mark, module), [(module, 'value = %d\n' % mark)])
+
+    mark = commits
+    for i, branch in enumerate(branches):
+        mark += 1
+        start = max(1, commits * (i + 1) // (len(branches) + 1))
+        module = 'src/%s.py' % branch.split('@')[0].replace('.', '_')
+        commit('refs/heads/' + branch, mark, start, 'Change on ' + branch, [(module, 'branch = %r\n' % branch)])
+
+    return b''.join(stream)
+
+
+def branch_names(num_branches):
+    """ Parent branches used for merge plus child branches (with @) for the rest """
+    parents = PARENT_BRANCHES[:num_branches]
+    return parents + ['feature-%d@master' % i for i in range(num_branches - len(parents))]
+
+
+def create_repo(args):
+    workspace, index, commits, files, num_branches, dependents = args
+    name = 'repo-%d' % index
+    remotes = os.path.join(os.path.dirname(workspace), 'remotes')
+    upstream = os.path.join(remotes, 'upstream', name + '.git')
+    origin = os.path.join(remotes, 'origin', name + '.git')
+    repo = os.path.join(workspace, name)
+    branches = branch_names(num_branches)
+
+    git('init', '--bare', upstream)
+    git('fast-import', '--quiet', cwd=upstream,
+        input=history_stream(name, commits, files, branches, depends_on_base=0 < index <= dependents))
+    git('clone', '--bare', upstream, origin)
+
+    git('clone', upstream, repo, '--origin', 'upstream')
+    git('remote', 'add', 'origin', origin, cwd=repo)
+    git('fetch', 'origin', cwd=repo)
+    git('branch', '--set-upstream-to', 'upstream/master', cwd=repo)
+    for branch in branches:
+        remote = 'origin' if '@' in branch else 'upstream'
+        git('branch', '--track', branch, '{}/{}'.format(remote, branch), cwd=repo)
+
+    return name
+
+
+def generate_workspace(path, repos, commits, files, branches, dependents):
+    """ Generate a workspace with the given number of repos in path/workspace and their remotes in path/remotes """
+    workspace = os.path.join(path, 'workspace')
+    os.makedirs(workspace)
+
+    with Pool() as pool:
+        pool.map(create_repo, [(workspace, i, commits, files, branches, dependents) for i in range(repos)])
+
+    return workspace
+
+
+def run_wst(wst, args, cwd, env):
+    start = perf_counter()
+    p = subprocess.run([wst] + args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return perf_counter() - start, p.returncode, p.stderr.decode(errors='replace')
+
+
+def benchmark(wst, workspace, names, repeat, env):
+    results = {}
+
+    for name, cwd, args, setup, teardown in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        cwd = os.path.normpath(os.path.join(workspace, cwd))
+        times = []
+        exit_code = error = None
+
+        for i in range(repeat + 1):  # First run is a warm-up
+            if setup:
+                git(*setup, cwd=cwd)
+            elapsed, exit_code, error = run_wst(wst, args, cwd, env)
+            if teardown:
+                git(*teardown, cwd=cwd)
+            if exit_code:
+                break
+            if i:
+                times.append(elapsed)
+
+        results[name] = {
+            'command': ' '.join(['wst'] + args),
+            'exit_code': exit_code,
+            'times': times,
+            'min': min(times) if times else None,
+            'median': median(times) if times else None,
+            'mean': mean(times) if times else None,
+        }
+        if exit_code:
+            results[name]['error'] = error.strip().split('\n')[-1]
+
+        status = '{:.3f}s'.format(results[name]['median']) if times else 'FAILED: ' + results[name]['error']
+        print('{:<10} {}'.format(name, status))
+
+    return results
+
+
+def compare(results, baseline_file):
+    """ Print a comparison of results against the results in baseline_file """
+    with open(baseline_file) as fp:
+        baseline = json.load(fp)['results']
+
+    print('\n{:<10} {:>10} {:>10} {:>8}'.format('Benchmark', 'Baseline', 'Current', 'Change'))
+    for name, result in results.items():
+        old = baseline.get(name, {}).get('median')
+        new = result['median']
+        if old and new:
+            print('{:<10} {:>9.3f}s {:>9.3f}s {:>+7.1f}%'.format(name, old, new, (new - old) * 100 / old))
+        else:
+            print('{:<10} {:>10} {:>10}'.format(name, old and '%.3fs' % old or '-', new and '%.3fs' % new or '-'))
+
+
+@contextmanager
+def benchmark_dir(path, keep):
+    if path:
+        yield path
+    else:
+        path = tempfile.mkdtemp(prefix='wst-bench-')
+        try:
+            yield path
+        finally:
+            if not keep:
+                shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--repos', type=int, default=10, help='Number of repos to generate (default: %(default)s)')
+    parser.add_argument('-b', '--branches', type=int, default=6,
+                        help='Number of branches per repo. The first 2 are parent branches used by merge and the rest '
+                             'are child branches (default: %(default)s)')
+    parser.add_argument('-c', '--commits', type=int, default=500, help='Commits per repo (default: %(default)s)')
+    parser.add_argument('-f', '--files', type=int, default=50, help='Files per repo (default: %(default)s)')
+    parser.add_argument('-d', '--dependents', type=int, default=3,
+                        help='Number of repos that depend on %s for the test benchmark (default: %%(default)s)' % BASE_REPO)
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Times to run each benchmark (default: %(default)s)')
+    parser.add_argument('--benchmarks', nargs='+', choices=[b[0] for b in BENCHMARKS], help='Benchmarks to run')
+    parser.add_argument('--wst', default=shutil.which('wst') or 'wst', help='wst executable to benchmark')
+    parser.add_argument('--dir', help='Directory to generate the workspace in. Defaults to a temp dir.')
+    parser.add_argument('--reuse', action='store_true', help='Reuse the workspace generated in --dir')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated temp dir')
+    parser.add_argument('-o', '--output', help='Write JSON results to file')
+    parser.add_argument('--compare', metavar='FILE', help='Compare results against JSON results from a previous run')
+    args = parser.parse_args()
+
+    with benchmark_dir(args.dir, args.keep) as path:
+        env = dict(os.environ, HOME=path, GIT_AUTHOR_NAME='Bench', GIT_AUTHOR_EMAIL='bench@example.com',
+                   GIT_COMMITTER_NAME='Bench', GIT_COMMITTER_EMAIL='bench@example.com')
+        env.pop('VIRTUAL_ENV', None)
+
+        workspace = os.path.join(path, 'workspace')
+        if not (args.reuse and os.path.exists(workspace)):
+            start = perf_counter()
+            generate_workspace(path, args.repos, args.commits, args.files, args.branches, args.dependents)
+            print('Generated {} repos in {} in {:.1f}s'.format(args.repos, workspace, perf_counter() - start))
+
+        version = subprocess.run([args.wst, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+
+        results = {
+            'version': version.stdout.decode().strip(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: getattr(args, k) for k in ['repos', 'branches', 'commits', 'files', 'dependents', 'repeat']},
+            'results': benchmark(args.wst, workspace, args.benchmarks, args.repeat, env)
+        }
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.compare:
+        compare(results['results'], args.compare)
+
+    return 1 if any(r['exit_code'] for r in results['results'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,12 +3,21 @@ import shlex
 from mock import Mock
 import pytest
 
+from workspace import trace
 from workspace.config import config
 from workspace.controller import Commander
 
 config._last_source = None  # Don't read from user config for tests
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """ Use a temp cache dir so tests don't read or write the user's cache """
+    path = tmp_path_factory.mktemp('cache')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(path))
+    return path
+
+
 @pytest.fixture()
 def wst(monkeypatch):
     def _run(cmd):
@@ -25,3 +34,23 @@ def mock_run(monkeypatch):
     monkeypatch.setattr('workspace.scm.run', r)
     monkeypatch.setattr('workspace.commands.test.run', r)
     return r
+
+
+@pytest.fixture()
+def spawns():
+    """ Count real subprocesses spawned by program name, such as spawns('git'). Use spawns.reset() to start over. """
+    class SpawnCounter(object):
+        mark = 0
+
+        def reset(self):
+            self.mark = len(trace.events())
+
+        def __call__(self, program='git'):
+            return len([e for e in trace.events()[self.mark:]
+                        if e['cat'] == 'subprocess' and e['args']['argv'][0] == program])
+
+    trace.start()
+    try:
+        yield SpawnCounter()
+    finally:
+        trace.stop()
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+
+from workspace.affected import affected_tests, importing_tests, module_name, use_contexts, uses_contexts
+
+
+def write_coverage(repo, contexts):
+    connection = sqlite3.connect(os.path.join(repo, '.coverage'))
+    connection.executescript("""
+        CREATE TABLE file (id INTEGER PRIMARY KEY, path TEXT);
+        CREATE TABLE context (id INTEGER PRIMARY KEY, context TEXT);
+        CREATE TABLE line_bits (file_id INTEGER, context_id INTEGER, numbits BLOB);
+        CREATE TABLE arc (file_id INTEGER, context_id INTEGER, fromno INTEGER, tono INTEGER);
+    """)
+    for file_id, (path, file_contexts) in enumerate(sorted(contexts.items())):
+        connection.execute('INSERT INTO file VALUES (?, ?)', (file_id, os.path.join(repo, path)))
+        for context in file_contexts:
+            row = connection.execute('SELECT id FROM context WHERE context = ?', (context,)).fetchone()
+            context_id = row[0] if row else connection.execute('INSERT INTO context (context) VALUES (?)',
+                                                               (context,)).lastrowid
+            connection.execute('INSERT INTO line_bits VALUES (?, ?, ?)', (file_id, context_id, b''))
+    connection.commit()
+    connection.close()
+    os.utime(os.path.join(repo, '.coverage'), (0, 0))
+
+
+def test_affected_tests(tmp_path):
+    repo = str(tmp_path)
+    for path in ('foo/__init__.py', 'foo/bar.py', 'foo/baz.py', 'foo/new.py', 'tests/test_bar.py'):
+        os.makedirs(os.path.dirname(os.path.join(repo, path)), exist_ok=True)
+        open(os.path.join(repo, path), 'w').close()
+
+    assert affected_tests(repo, ['foo/bar.py']) is None
+
+    write_coverage(repo, {
+        'foo/bar.py': ['tests/test_bar.py::test_bar|run', 'tests/test_bar.py::test_bar|setup', ''],
+        'foo/baz.py': ['tests/test_baz.py::test_baz[1]|run'],
+    })
+
+    assert affected_tests(repo, ['foo/bar.py']) == ['tests/test_bar.py::test_bar']
+    assert affected_tests(repo, ['foo/bar.py', 'foo/baz.py', 'README.rst']) == [
+        'tests/test_bar.py::test_bar', 'tests/test_baz.py::test_baz[1]']
+    assert affected_tests(repo, ['tests/test_bar.py', 'tests/test_removed.py']) == ['tests/test_bar.py']
+    assert affected_tests(repo, ['docs/index.rst']) == []
+    assert affected_tests(repo, ['foo/new.py']) is None
+    assert affected_tests(repo, ['foo/removed.py']) == []
+    assert affected_tests(repo, ['requirements.txt']) is None
+
+
+def test_importing_tests(tmp_path):
+    assert module_name('foo/bar.py') == 'foo.bar'
+    assert module_name('src/foo/__init__.py') == 'foo'
+
+    os.makedirs(str(tmp_path / 'tests'))
+    (tmp_path / 'tests' / 'test_a.py').write_text('import foo.bar\n')
+    (tmp_path / 'tests' / 'test_b.py').write_text('from foo import (baz,\n    bar)\n')
+    (tmp_path / 'tests' / 'test_c.py').write_text('from foo.barn import x\nimport foo\n')
+    (tmp_path / 'tests' / 'helper.py').write_text('import foo.bar\n')
+
+    assert importing_tests(str(tmp_path), ['foo.bar']) == ['tests/test_a.py', 'tests/test_b.py']
+    assert importing_tests(str(tmp_path), []) == []
+
+
+def test_use_contexts(tmp_path, cache_dir):
+    repo = str(tmp_path)
+    assert not uses_contexts(repo)
+
+    use_contexts(repo)
+    assert uses_contexts(repo)
+    assert not uses_contexts(str(tmp_path / 'other'))
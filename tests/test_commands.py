@@ -80,6 +80,42 @@ def test_cleanrun(wst):
         assert sorted(os.listdir()) == ['.git', 'hello.py']
 
 
+def test_doctor(wst, capsys):
+    with temp_dir():
+        with pytest.raises(SystemExit):
+            wst('doctor')
+
+    with temp_git_repo():
+        run('git commit --allow-empty -m Dummy')
+        results = wst('doctor --perf')
+
+        assert len(results) == 1
+        assert set(results[0]['timings']) == {'status', 'branches', 'log'}
+        assert results[0]['stats']['refs'] == 1
+        assert not results[0]['outlier']
+
+        out, _ = capsys.readouterr()
+        assert out.startswith('Product')
+
+
+def test_doctor_causes():
+    from workspace.commands.doctor import rank_repos
+
+    def result(name, total, **stats):
+        repo_stats = dict(loose_objects=0, objects=0, packs=1, refs=10, index_mb=0.1, untracked=0)
+        repo_stats.update(stats)
+        return {'name': name, 'timings': {'status': total / 2, 'branches': total / 4, 'log': total / 4},
+                'stats': repo_stats}
+
+    results = rank_repos([result('fast', 0.1), result('slow', 3, packs=50), result('fast2', 0.2),
+                          result('slow2', 2), result('fast3', 0.3)])
+
+    assert [r['name'] for r in results] == ['slow', 'slow2', 'fast3', 'fast2', 'fast']
+    assert results[0]['causes'] == ['50 pack files -- run "git gc" or "git repack -ad" to consolidate them']
+    assert 'slow status' in results[1]['causes'][0]
+    assert not results[2]['outlier']
+
+
 def test_commit(wst):
     with temp_dir():
         with pytest.raises(SystemExit):
@@ -245,3 +281,23 @@ def test_setup(wst, monkeypatch):
         assert bashrc[2].startswith('source ') and bashrc[2].endswith('.wstrc')
 
         assert 'function ws()' in wstrc
+        assert '_wst __complete $1 -- "$cur"' in wstrc
+
+
+def test_test_durations():
+    from workspace.commands.test import DURATIONS_KEPT, durations_key, expected_duration, record_duration
+
+    assert durations_key(None) == 'default'
+    assert durations_key(['style', 'py3']) == 'py3,style'
+    assert expected_duration('foo', 'default') is None
+    assert expected_duration('foo', 'default', default=float('inf')) == float('inf')
+
+    record_duration('foo', 'default', 10)
+    record_duration('foo', 'default', 20)
+    record_duration('foo', 'style', 1)
+    assert expected_duration('foo', 'default') == 15
+    assert expected_duration('foo', 'style') == 1
+
+    for _ in range(DURATIONS_KEPT):
+        record_duration('foo', 'default', 30)
+    assert expected_duration('foo', 'default') == 30
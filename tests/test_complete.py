@@ -0,0 +1,43 @@
+import os
+
+from utils.process import run
+
+from workspace.commands.complete import completions
+
+from test_stubs import temp_dir, temp_git_repo
+
+
+def test_complete_branches(wst, capsys):
+    with temp_git_repo():
+        run('git commit --allow-empty -m Dummy')
+        run('git branch feature@master')
+
+        wst('__complete branches')
+        assert capsys.readouterr().out == 'feature@master\nmaster\n'
+
+        run('git pack-refs --all')
+        run('git branch fix@master')
+        run('git branch -D feature@master')
+
+        wst('__complete branches -- f')
+        assert capsys.readouterr().out == 'fix@master\n'
+
+
+def test_complete_products_and_envs():
+    with temp_dir() as cwd:
+        for repo in ['repo1', 'repo2']:
+            run('git init ' + repo)
+
+        assert completions('products') == ['repo1', 'repo2']
+
+        run('git init repo3')
+        assert completions('products') == ['repo1', 'repo2', 'repo3']
+
+        path = str(cwd / 'repo1')
+        with open(os.path.join(path, 'tox.ini'), 'w') as fp:
+            fp.write('[tox]\nenvlist = py, style\n\n[testenv:py]\n\n[testenv:style]\n')
+        assert completions('envs', path) == ['style']
+
+        with open(os.path.join(path, 'tox2.ini'), 'w') as fp:
+            fp.write('[testenv:cover]\n')
+        assert completions('envs', path) == ['cover', 'style']
@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+
+from mock import Mock
+import pytest
+
+from workspace.config import WorkspaceConfig, refresh_url_snapshot, url_snapshot
+
+
+@pytest.fixture()
+def config_server():
+    """ Serves a config with an ETag and records the requests made """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.requests.append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == server.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            content = server.content.encode()
+            self.send_response(200)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.content = '[merge]\nbranches = 1.0.x master\n'
+    server.etag = '"v1"'
+    server.url = 'http://127.0.0.1:%d/workspace.cfg' % server.server_port
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+
+
+def test_url_snapshot(config_server, monkeypatch):
+    popen = Mock()
+    monkeypatch.setattr('workspace.config.subprocess.Popen', popen)
+
+    config = WorkspaceConfig(cache_duration=60)
+    config.read(config_server.url)
+    assert config.merge.branches == '1.0.x master'
+    assert config_server.requests == [None]
+
+    config_server.content = '[merge]\nbranches = 2.0.x master\n'
+    assert url_snapshot(config_server.url, refresh_after=60) == '[merge]\nbranches = 1.0.x master\n'
+    assert not popen.called
+
+    assert url_snapshot(config_server.url, refresh_after=-1) == '[merge]\nbranches = 1.0.x master\n'
+    assert popen.call_args[0][0][-1] == config_server.url
+    assert config_server.requests == [None]
+
+    assert refresh_url_snapshot(config_server.url)['content'] == '[merge]\nbranches = 1.0.x master\n'
+    assert config_server.requests == [None, '"v1"']
+
+    config_server.etag = '"v2"'
+    assert refresh_url_snapshot(config_server.url)['content'] == '[merge]\nbranches = 2.0.x master\n'
+    assert url_snapshot(config_server.url, refresh_after=60) == '[merge]\nbranches = 2.0.x master\n'
+
+
+def test_url_snapshot_on_error(config_server):
+    refresh_url_snapshot(config_server.url)
+    config_server.shutdown()
+    config_server.server_close()
+
+    assert refresh_url_snapshot(config_server.url)['content'] == '[merge]\nbranches = 1.0.x master\n'
+
+    with pytest.raises(Exception):
+        refresh_url_snapshot(config_server.url + '.missing')
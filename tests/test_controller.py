@@ -0,0 +1,127 @@
+import subprocess
+import sys
+
+import pytest
+
+from workspace.controller import COMMAND_ALIASES, COMMANDS, Commander, LazyCommands
+
+from test_stubs import temp_git_repo
+
+
+def test_command_registry():
+    commands = Commander.commands()
+
+    assert sorted(commands) == sorted(COMMANDS)
+    for name in COMMANDS:
+        assert commands[name].name() == name
+    assert COMMAND_ALIASES == {c.alias: name for name, c in commands.items() if c.alias}
+
+
+def test_lazy_commands():
+    class Custom(object):
+        alias = 'cu'
+
+    commands = LazyCommands({'status': 'workspace.commands.status:Status'}, {'st': 'status'})
+    commands['custom'] = Custom
+
+    assert commands['custom'] is Custom
+    assert commands['status'].__name__ == 'Status'
+    assert commands.resolve('cu') == 'custom'
+    assert commands.resolve('st') == 'status'
+    assert commands.resolve('unknown') is None
+    assert commands.get('unknown') is None
+
+
+def test_only_selected_command_is_imported():
+    with temp_git_repo():
+        script = ("import sys; sys.argv = ['wst', 'st']; from workspace.controller import Commander; Commander().run(); "
+                  "print(' '.join(m for m in sys.modules if m.startswith('workspace.commands.')))")
+        modules = subprocess.check_output([sys.executable, '-c', script]).decode().split('\n')[-2].split()
+
+        assert sorted(modules) == ['workspace.commands.helpers', 'workspace.commands.status']
+
+
+def test_commands_info(cache_dir, monkeypatch):
+    info = Commander().commands_info()
+
+    assert sorted(info) == sorted(COMMANDS)
+    assert info['status']['alias'] == 'st'
+    assert info['status']['help'] == 'Show status on current product or all products in workspace'
+    assert info['test']['extra_args']
+    assert {'options': ['-k'], 'help': 'Only run tests with method name that matches pattern', 'nargs': None,
+            'choices': None} in info['test']['arguments']
+    assert list(cache_dir.glob('workspace-tools/cli-*.json'))
+
+    parsed = []
+    monkeypatch.setattr('workspace.controller.command_info', lambda command: parsed.append(command) or {})
+    assert Commander().commands_info() == info
+    assert not parsed
+
+    monkeypatch.setattr('workspace.controller.Commander.version', lambda self: 'workspace-tools 0.0.0')
+    Commander().commands_info()  # Version changed, so not cached
+    assert len(parsed) == len(COMMANDS)
+
+
+def test_cached_command_parser_does_not_import_command(cache_dir):
+    script = ("import sys; from workspace.controller import Commander; Commander().setup_parsers(['test', '-k', 'foo']); "
+              "print(' '.join(m for m in sys.modules if m.startswith('workspace.commands.')))")
+
+    assert 'workspace.commands.test' in subprocess.check_output([sys.executable, '-c', script]).decode().split()
+    assert list(cache_dir.glob('workspace-tools/cli/*/test.json'))
+
+    # Nothing is imported or parsed on a cache hit
+    assert subprocess.check_output([sys.executable, '-c', script]).decode().split() == []
+
+
+def test_help_lists_commands(capsys, monkeypatch):
+    monkeypatch.setattr('sys.argv', ['wst', '--help'])
+
+    with pytest.raises(SystemExit):
+        Commander().run()
+
+    output = capsys.readouterr().out
+    assert 'status (st)' in output
+    assert 'Show status on current product' in output
+
+
+def test_version(capsys, monkeypatch):
+    monkeypatch.setattr('sys.argv', ['wst', '--version'])
+
+    with pytest.raises(SystemExit):
+        Commander().run()
+
+    assert capsys.readouterr().out.startswith('workspace-tools ')
+
+
+def test_commands_can_be_a_dict(cache_dir, capsys, monkeypatch):
+    from workspace.commands.status import Status
+
+    class DictCommander(Commander):
+        """ Commander with commands in a dict """
+
+        @classmethod
+        def commands(cls):
+            return {'status': Status}
+
+    status = []
+    monkeypatch.setattr(Status, 'run', lambda self: status.append(self.name()))
+    monkeypatch.setattr('sys.argv', ['wst', 'st'])
+
+    DictCommander().run()
+    assert status == ['status']
+
+    monkeypatch.setattr('sys.argv', ['wst', '--help'])
+    with pytest.raises(SystemExit):
+        DictCommander().run()
+    assert 'status (st)' in capsys.readouterr().out
+
+
+def test_lazy_commands_without_aliases():
+    class Custom(object):
+        alias = 'cu'
+
+    commands = LazyCommands({'custom': Custom, 'status': 'workspace.commands.status:Status'})
+
+    assert commands.resolve('cu') == 'custom'
+    assert commands.resolve('st') == 'status'
+    assert commands.resolve('unknown') is None
@@ -0,0 +1,38 @@
+import os
+
+from workspace.deps import DependencyGraph, workspace_graph
+
+
+def test_dependency_graph():
+    graph = DependencyGraph({'app': ['web', 'db'], 'web': ['core'], 'db': ['core'], 'core': [], 'cli': ['core']})
+
+    assert graph.dependents('core') == [['cli', 'db', 'web'], ['app']]
+    assert graph.dependents('core', depth=1) == [['cli', 'db', 'web']]
+    assert graph.dependents('app') == []
+    assert graph.dependencies_of('app') == [['db', 'web'], ['core']]
+
+
+def test_workspace_graph(tmp_path):
+    products = {
+        'core': ('requirements.txt', 'requests\n'),
+        'web': ('requirements.txt', 'Core>=1.0\n'),
+        'db': ('setup.py', "setup(\n    name='db-lib',\n    install_requires=['core'],\n)\n"),
+        'app': ('pyproject.toml', '[project]\nname = "app"\ndependencies = ["web", "db-lib==2.*"]\n'),
+    }
+    for name, (file_name, content) in products.items():
+        os.makedirs(str(tmp_path / name / '.git'))
+        (tmp_path / name / file_name).write_text(content)
+        os.utime(str(tmp_path / name / file_name), (0, 0))
+    os.utime(str(tmp_path), (0, 0))
+
+    graph = workspace_graph(str(tmp_path))
+    assert graph.dependencies == {'app': ['db', 'web'], 'core': [], 'db': ['core'], 'web': ['core']}
+    assert graph.dependents('core') == [['db', 'web'], ['app']]
+
+    (tmp_path / 'web' / 'requirements.txt').write_text('Cor>=1.0\n\n')
+    os.utime(str(tmp_path / 'web' / 'requirements.txt'), (0, 0))
+    assert workspace_graph(str(tmp_path)).dependencies == graph.dependencies  # Cached as signature is the same
+
+    (tmp_path / 'web' / 'requirements.txt').write_text('')
+    os.utime(str(tmp_path / 'web' / 'requirements.txt'), (0, 0))
+    assert workspace_graph(str(tmp_path)).dependencies['web'] == []
@@ -0,0 +1,258 @@
+import os
+from pathlib import Path
+
+from workspace.commands.helpers import ToxIni
+from workspace.commands import test as wst_test
+from workspace.envs import (FINGERPRINT_FILE, SNAPSHOTS_DIR, dedupe_envs, env_variables, fingerprint, has_snapshot,
+                            incremental_changes, install_command, installed_distributions, known_envdirs,
+                            normalize_requirements, outdated_parts, restore_snapshot, save_fingerprint, save_snapshot,
+                            setup_dependencies)
+from workspace.utils import cache_path
+
+
+def write(path, content, mtime=None):
+    path.write_text(content)
+    if mtime is not None:
+        os.utime(str(path), (mtime, mtime))
+
+
+def test_normalize_requirements(tmp_path):
+    write(tmp_path / 'dev.txt', 'pytest  # For tests\nmock\n')
+
+    assert normalize_requirements('requests >= 2\n# Comment\n\nClick\n-r dev.txt\nmock', str(tmp_path)) == [
+        'click', 'mock', 'pytest', 'requests>=2']
+    assert normalize_requirements('-r missing.txt', str(tmp_path)) == ['-rmissing.txt']
+
+
+def test_setup_dependencies(tmp_path):
+    write(tmp_path / 'setup.py', "setup(\n    name='foo',\n    version='1.0.0',\n    install_requires=['click'],\n)\n")
+    deps = setup_dependencies(str(tmp_path))
+
+    write(tmp_path / 'setup.py', "setup(\n    name='foo',\n    version='1.0.1',\n    install_requires=['click'],\n)\n")
+    assert setup_dependencies(str(tmp_path)) == deps
+
+    write(tmp_path / 'setup.py', "setup(\n    name='foo',\n    version='1.0.1',\n    install_requires=['requests'],\n)\n")
+    assert setup_dependencies(str(tmp_path)) != deps
+
+
+def test_outdated_parts(tmp_path):
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\ndeps = pytest\ncommands = pytest\n')
+    write(tmp_path / 'requirements.txt', 'click\nrequests\n')
+    tox = ToxIni(str(tmp_path))
+    envdir = tmp_path / '.tox' / 'py'
+
+    assert outdated_parts(tox, 'py') == ['interpreter', 'requirements', 'setup', 'tox']
+
+    os.makedirs(str(envdir))
+    save_fingerprint(tox, 'py')
+    assert (envdir / FINGERPRINT_FILE).exists()
+    assert outdated_parts(tox, 'py') == []
+
+    write(tmp_path / 'requirements.txt', '# Same requirements\nrequests\nclick\n')
+    assert outdated_parts(tox, 'py') == []
+
+    write(tmp_path / 'requirements.txt', 'click\nrequests>=2\n')
+    assert outdated_parts(tox, 'py') == ['requirements']
+
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py, style\n\n[testenv]\ndeps = pytest\ncommands = pytest -v\n')
+    assert outdated_parts(ToxIni(str(tmp_path)), 'py') == ['requirements']
+
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\nbasepython = python3\ndeps = pytest\n')
+    assert outdated_parts(ToxIni(str(tmp_path)), 'py') == ['requirements', 'tox']
+
+
+def test_outdated_parts_without_fingerprint(tmp_path):
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n', mtime=100)
+    write(tmp_path / 'requirements.txt', 'click\n', mtime=100)
+    tox = ToxIni(str(tmp_path))
+    envdir = tmp_path / '.tox' / 'py'
+    os.makedirs(str(envdir))
+    os.utime(str(envdir), (50, 50))
+
+    assert outdated_parts(tox, 'py') == sorted(fingerprint(tox, 'py')['parts'])
+    assert not (envdir / FINGERPRINT_FILE).exists()
+
+    os.utime(str(envdir), (200, 200))
+    assert outdated_parts(tox, 'py') == []
+    assert (envdir / FINGERPRINT_FILE).exists()
+
+
+def test_incremental_changes(tmp_path):
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\nusedevelop = True\ndeps = pytest\n')
+    write(tmp_path / 'requirements.txt', 'click==7.0\nrequests\nsix\n')
+    tox = ToxIni(str(tmp_path))
+    site_packages = tmp_path / '.tox' / 'py' / 'lib' / 'python3.9' / 'site-packages'
+    for dist in ('Click-7.0', 'requests-2.25.0', 'six-1.15.0', 'pytest-6.0.0'):
+        os.makedirs(str(site_packages / (dist + '.dist-info')))
+    save_fingerprint(tox, 'py')
+
+    assert installed_distributions(str(tmp_path / '.tox' / 'py')) == {
+        'click': '7.0', 'requests': '2.25.0', 'six': '1.15.0', 'pytest': '6.0.0'}
+    assert incremental_changes(tox, 'py', []) is None
+
+    write(tmp_path / 'requirements.txt', 'click==7.1\nrequests>=2\nmock\n')
+    parts = outdated_parts(tox, 'py')
+    assert parts == ['requirements']
+    assert incremental_changes(tox, 'py', parts) == (['click==7.1', 'mock'], ['six'])
+
+    write(tmp_path / 'requirements.txt', 'click==7.0\nrequests\nsix\n--index-url=https://example.com/simple\n')
+    assert incremental_changes(tox, 'py', outdated_parts(tox, 'py')) is None
+
+    write(tmp_path / 'requirements.txt', 'click==7.0\nrequests\nsix\n')
+    write(tmp_path / 'setup.py', "setup(name='foo', install_requires=['click'])\n")
+    assert incremental_changes(tox, 'py', outdated_parts(tox, 'py')) == (['-e', str(tmp_path)], [])
+
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\nusedevelop = True\ndeps = pytest\nsetenv = A=1\n')
+    tox = ToxIni(str(tmp_path))
+    assert incremental_changes(tox, 'py', outdated_parts(tox, 'py')) is None
+
+
+def test_snapshot(tmp_path):
+    product = tmp_path / 'one' / 'foo'
+    os.makedirs(str(product))
+    write(product / 'tox.ini', '[tox]\nenvlist = py\n')
+    tox = ToxIni(str(product))
+    envdir = product / '.tox' / 'py'
+    site_packages = envdir / 'lib' / 'python3.9' / 'site-packages'
+    os.makedirs(str(envdir / 'bin'))
+    os.makedirs(str(site_packages / 'click'))
+    write(envdir / 'bin' / 'foo', '#!{}/bin/python\n'.format(envdir))
+    write(site_packages / 'foo.pth', str(product) + '\n')
+    write(site_packages / 'click' / '__init__.py', 'VERSION = 1\n')
+    os.symlink('lib', str(envdir / 'lib64'))
+
+    assert not has_snapshot(tox, 'py')
+    assert not restore_snapshot(tox, 'py')
+
+    save_fingerprint(tox, 'py')
+    save_snapshot(tox, 'py')
+    assert has_snapshot(tox, 'py')
+
+    other_product = tmp_path / 'two' / 'foo'
+    os.makedirs(str(other_product))
+    write(other_product / 'tox.ini', '[tox]\nenvlist = py\n')
+    other_tox = ToxIni(str(other_product))
+    other_envdir = other_product / '.tox' / 'py'
+    other_site_packages = other_envdir / 'lib' / 'python3.9' / 'site-packages'
+
+    assert restore_snapshot(other_tox, 'py')
+    assert (other_envdir / 'bin' / 'foo').read_text() == '#!{}/bin/python\n'.format(other_envdir)
+    assert (other_site_packages / 'foo.pth').read_text() == str(other_product) + '\n'
+    assert os.readlink(str(other_envdir / 'lib64')) == 'lib'
+    assert (other_site_packages / 'click' / '__init__.py').read_text() == 'VERSION = 1\n'
+    assert outdated_parts(other_tox, 'py') == []
+
+    # Snapshot is a copy, so modifying files in place does not change it
+    write(site_packages / 'click' / '__init__.py', 'broken')
+    write(other_site_packages / 'click' / '__init__.py', 'broken')
+    assert restore_snapshot(tox, 'py')
+    assert (site_packages / 'click' / '__init__.py').read_text() == 'VERSION = 1\n'
+
+    write(other_product / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\nusedevelop = True\n')
+    assert not has_snapshot(ToxIni(str(other_product)), 'py')
+
+
+def test_dedupe_envs(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    envdirs = []
+    for name in ('foo', 'bar', 'baz'):
+        envdir = tmp_path / '.virtualenvs' / name
+        os.makedirs(str(envdir / 'bin'))
+        os.makedirs(str(envdir / 'lib' / 'python3.9' / 'site-packages' / 'click'))
+        write(envdir / 'pyvenv.cfg', 'home = /usr/bin\n')
+        write(envdir / 'bin' / 'click', 'same script\n')
+        write(envdir / 'lib' / 'python3.9' / 'site-packages' / 'click' / '__init__.py', 'VERSION = 1\n')
+        write(envdir / 'lib' / 'python3.9' / 'site-packages' / 'click' / 'env.py', name)
+        envdirs.append(str(envdir))
+
+    assert known_envdirs() == sorted(envdirs)
+
+    def inode(name, path='lib/python3.9/site-packages/click/__init__.py'):
+        return os.stat(str(tmp_path / '.virtualenvs' / name / path)).st_ino
+
+    assert dedupe_envs(envdirs[:2]) == (1, len('VERSION = 1\n'))
+    assert inode('foo') == inode('bar') != inode('baz')
+    assert inode('foo', 'bin/click') != inode('bar', 'bin/click')
+    assert inode('foo', 'lib/python3.9/site-packages/click/env.py') != inode('bar', 'lib/python3.9/site-packages/click/env.py')
+
+    assert dedupe_envs(envdirs[:2]) == (0, 0)
+    assert dedupe_envs(envdirs[2:]) == (1, len('VERSION = 1\n'))
+    assert inode('foo') == inode('bar') == inode('baz')
+    assert (tmp_path / '.virtualenvs' / 'baz' / 'lib' / 'python3.9' / 'site-packages' / 'click' / 'env.py').read_text() == 'baz'
+
+    snapshot = Path(cache_path(SNAPSHOTS_DIR, 'foo', 'py', 'py'))
+    os.makedirs(str(snapshot / 'lib' / 'python3.9' / 'site-packages' / 'click'))
+    write(snapshot / 'pyvenv.cfg', 'home = /usr/bin\n')
+    write(snapshot / 'lib' / 'python3.9' / 'site-packages' / 'click' / '__init__.py', 'VERSION = 1\n')
+
+    assert known_envdirs() == sorted(envdirs)
+    assert dedupe_envs([str(snapshot)]) == (0, 0)
+
+
+def test_incremental_changes_with_installed_metadata(tmp_path):
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n')
+    write(tmp_path / 'requirements.txt', 'bar\nlib\nsix\nurllib3\n')
+    tox = ToxIni(str(tmp_path))
+    envdir = tmp_path / '.tox' / 'py'
+    site_packages = envdir / 'lib' / 'python3.9' / 'site-packages'
+    lib = tmp_path / 'lib'
+    os.makedirs(str(lib / 'lib.egg-info'))
+    os.makedirs(str(site_packages / 'bar-1.0.dist-info'))
+    os.makedirs(str(site_packages / 'urllib3-1.26.0-py3.9.egg-info'))
+    write(lib / 'lib.egg-info' / 'PKG-INFO', 'Name: lib\nVersion: 2.0.dev0\n')
+    write(lib / 'lib.egg-info' / 'requires.txt', 'six\n\n[test]\nmock\n')
+    write(site_packages / 'lib.egg-link', str(lib) + '\n.')
+    write(site_packages / 'bar-1.0.dist-info' / 'METADATA', 'Name: bar\nRequires-Dist: six (>=1.0)\n')
+    os.makedirs(str(site_packages / 'six-1.15.0.dist-info'))
+    save_fingerprint(tox, 'py')
+
+    assert installed_distributions(str(envdir)) == {'bar': '1.0', 'lib': '2.0.dev0', 'six': '1.15.0', 'urllib3': '1.26.0'}
+
+    # Editable lib is not reinstalled, unchanged bar is not checked, six is kept as bar requires it
+    write(tmp_path / 'requirements.txt', 'bar\nlib>=3\nurllib3<2\n')
+    assert incremental_changes(tox, 'py', outdated_parts(tox, 'py')) == ([], [])
+
+    write(tmp_path / 'requirements.txt', 'lib\nsix\n')
+    assert incremental_changes(tox, 'py', outdated_parts(tox, 'py')) == ([], ['bar', 'urllib3'])
+
+
+def test_update_env_with_install_command(tmp_path, cache_dir, monkeypatch):
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\n'
+          'install_command = python -m pip install -c {toxinidir}/constraints.txt {opts} {packages}\n'
+          'setenv =\n    PIP_INDEX_URL = https://example.com/simple\n    DATA = {envdir}/data\n')
+    write(tmp_path / 'requirements.txt', 'click==7.0\n')
+    tox = ToxIni(str(tmp_path))
+    envdir = tmp_path / '.tox' / 'py'
+    os.makedirs(str(envdir / 'bin'))
+    write(envdir / 'bin' / 'python', '')
+    os.makedirs(str(envdir / 'lib' / 'python3.9' / 'site-packages' / 'click-7.0.dist-info'))
+    save_fingerprint(tox, 'py')
+
+    python = str(envdir / 'bin' / 'python')
+    assert install_command(tox, 'py', ['mock']) == [python, '-m', 'pip', 'install', '-c',
+                                                    str(tmp_path / 'constraints.txt'), 'mock']
+    variables = env_variables(tox, 'py')
+    assert variables['PIP_INDEX_URL'] == 'https://example.com/simple'
+    assert variables['DATA'] == str(envdir / 'data')
+    assert variables['VIRTUAL_ENV'] == str(envdir)
+
+    runs = []
+    monkeypatch.setattr(wst_test, 'run', lambda cmd, **kwargs: runs.append((cmd, kwargs['env'])) or True)
+    monkeypatch.setattr(wst_test, 'wheelhouse_path', lambda: 'wheelhouse')
+    monkeypatch.setattr(wst_test.Test, '_developed', lambda self, tox, env: None)
+
+    write(tmp_path / 'requirements.txt', 'click==7.1\n')
+    assert wst_test.Test(silent=True).update_env(tox, 'py', outdated_parts(tox, 'py'))
+    (cmd, environ), = runs
+    assert cmd == [python, '-m', 'pip', 'install', '-c', str(tmp_path / 'constraints.txt'),
+                   '--find-links', 'wheelhouse', 'click==7.1']
+    assert environ['PIP_INDEX_URL'] == 'https://example.com/simple'
+
+    # Redevelop with tox when the config can only be applied by tox
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\n\n[testenv]\nsetenv = PIP_INDEX_URL = {env:INDEX}\n')
+    tox = ToxIni(str(tmp_path))
+    assert env_variables(tox, 'py') is None
+
+    write(tmp_path / 'tox.ini', '[tox]\nenvlist = py\nindexserver =\n    default = https://example.com/simple\n')
+    tox = ToxIni(str(tmp_path))
+    assert install_command(tox, 'py', ['mock']) is None
@@ -1,4 +1,8 @@
-from workspace.commands.helpers import expand_product_groups
+import os
+
+import pytest
+
+from workspace.commands.helpers import ProductGroups, ToxIni, expand_product_groups
 
 
 def test_expand_product_groups(monkeypatch):
@@ -10,3 +14,47 @@ def test_expand_product_groups(monkeypatch):
     assert expand_product_groups(['ws', 'name2']) == sorted(['workspace-tools', 'clicast', 'localconfig', 'remoteconfig', 'name2'])
     assert expand_product_groups(['ws', '-localconfig']) == sorted(['workspace-tools', 'clicast', 'remoteconfig'])
     assert expand_product_groups(['ws', '-config']) == sorted(['workspace-tools', 'clicast'])
+
+
+def test_product_groups():
+    groups = ProductGroups({'all': ['ws', 'other', '-clicast'],
+                            'ws': ['workspace-tools', 'clicast', 'config'],
+                            'config': ['localconfig', 'remoteconfig'],
+                            'other': ['bumper', '-config']})
+
+    assert groups.closures['all'] == {'workspace-tools', 'localconfig', 'remoteconfig', 'bumper'}
+    assert groups.expand(['all', 'clicast', '-bumper']) == ['clicast', 'localconfig', 'remoteconfig', 'workspace-tools']
+    assert groups.contains('all', 'localconfig')
+    assert not groups.contains('all', 'clicast')
+    assert groups.groups_for('localconfig') == ['all', 'config', 'ws']
+    assert groups.groups_for('unknown') == []
+
+    with pytest.raises(ValueError) as e:
+        ProductGroups({'a': ['b'], 'b': ['c', 'x'], 'c': ['-a']})
+    assert 'a -> b -> c -> a' in str(e.value)
+
+
+def test_tox_ini_load(tmp_path):
+    tox_ini = tmp_path / 'tox.ini'
+    tox_ini.write_text('[tox]\nenvlist = py, style\n\n[testenv]\nenvdir = {homedir}/.virtualenvs/{envname}\n\n'
+                       '[testenv:style]\ncommands = flake8 {toxinidir}\n')
+    os.utime(str(tox_ini), (0, 0))
+
+    tox = ToxIni.load(str(tmp_path))
+    assert tox is ToxIni.load(str(tmp_path))
+    assert tox.envlist == ['py', 'style']
+    assert tox.envdir('style') == os.path.expanduser('~/.virtualenvs/style')
+    assert tox.bindir('style', 'python') == os.path.expanduser('~/.virtualenvs/style/bin/python')
+
+    commands = tox.commands('style')
+    assert commands == ['flake8 ' + str(tmp_path)]
+    commands.append('mutated')
+    assert tox.commands('style') == ['flake8 ' + str(tmp_path)]
+
+    tox_ini.write_text('[tox]\nenvlist = py\n')
+    assert ToxIni.load(str(tmp_path)).envlist == ['py']
+
+    os.utime(str(tox_ini), (1, 1))
+    tox = ToxIni.load(str(tmp_path))
+    assert tox is ToxIni.load(str(tmp_path))
+    assert tox.envdir('py') == str(tmp_path / '.tox' / 'py')
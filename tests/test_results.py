@@ -0,0 +1,134 @@
+import json
+import os
+from time import time
+
+from utils.process import silent_run
+
+from workspace.commands import test as wst_test
+from workspace.envs import FINGERPRINT_FILE
+from workspace.results import (PYTEST_LASTFAILED, cached_result, failures, has_failures, junit_results, junit_summary,
+                               record_failures, remove_old_results, restore_failures, result_key, save_result)
+
+
+def test_result_key(tmp_path):
+    repo = tmp_path / 'foo'
+    lib = tmp_path / 'lib'
+    for path in (repo, lib):
+        os.makedirs(str(path))
+        silent_run(['git', 'init', '-q'], cwd=str(path))
+        (path / 'code.py').write_text('x = 1\n')
+        silent_run(['git', 'add', 'code.py'], cwd=str(path))
+
+    envdir = tmp_path / 'env'
+    site_packages = envdir / 'lib' / 'python3.9' / 'site-packages'
+    os.makedirs(str(site_packages))
+    (envdir / FINGERPRINT_FILE).write_text(json.dumps({'fingerprint': 'abc'}))
+
+    key = result_key(str(repo), str(envdir), 'pytest')
+    assert key == result_key(str(repo), str(envdir), 'pytest')
+    assert key != result_key(str(repo), str(envdir), 'pytest -k test_foo')
+    assert key == result_key(str(repo), str(envdir), 'pytest -n 4') == result_key(str(repo), str(envdir), 'pytest --numprocesses=2')
+    assert result_key(str(repo), str(tmp_path / 'missing'), 'pytest') is None
+
+    def objects():
+        return silent_run(['git', 'count-objects'], cwd=str(repo), return_output=True)
+
+    written_objects = objects()
+    (repo / 'new.py').write_text('')
+    new_key = result_key(str(repo), str(envdir), 'pytest')
+    assert new_key != key
+    assert objects() == written_objects  # Untracked files are not written to the object store
+    assert silent_run(['git', 'status', '--short'], cwd=str(repo), return_output=True).split('\n')[:2] == ['A  code.py', '?? new.py']
+
+    (site_packages / 'lib.egg-link').write_text(str(lib) + '\n.')
+    key = result_key(str(repo), str(envdir), 'pytest')
+    assert key != new_key
+
+    (lib / 'code.py').write_text('x = 2\n')
+    assert result_key(str(repo), str(envdir), 'pytest') != key
+
+    assert cached_result(key) is None
+    save_result(key, 'passed')
+    assert cached_result(key)['output'] == 'passed'
+    save_result(key, True)
+    assert cached_result(key)['output'] is None
+
+    assert remove_old_results(1) == 0
+    assert remove_old_results(-1) == 1
+    assert cached_result(key) is None
+
+
+def test_failures(tmp_path):
+    repo = str(tmp_path / 'foo')
+    lastfailed = os.path.join(repo, PYTEST_LASTFAILED)
+
+    assert not restore_failures(repo, 'py3')
+    assert not os.path.exists(lastfailed)
+
+    since = time()
+    os.makedirs(os.path.dirname(lastfailed))
+    with open(lastfailed, 'w') as fp:
+        json.dump({'tests/test_a.py::test_a': True}, fp)
+    os.utime(lastfailed, (since - 10, since - 10))
+    record_failures(repo, 'py3', since)
+    assert failures('foo', 'py3') is None
+
+    os.utime(lastfailed, None)
+    record_failures(repo, 'py3', since)
+    assert failures('foo', 'py3') == ['tests/test_a.py::test_a']
+    assert has_failures('foo')
+
+    with open(lastfailed, 'w') as fp:
+        json.dump({}, fp)
+    record_failures(repo, 'style', since)
+    assert failures('foo', 'style') == []
+
+    assert not restore_failures(repo, 'style')
+    with open(lastfailed) as fp:
+        assert json.load(fp) == {}
+
+    assert restore_failures(repo, 'py3')
+    with open(lastfailed) as fp:
+        assert json.load(fp) == {'tests/test_a.py::test_a': True}
+
+    record_failures(repo, 'py3', since)
+    with open(lastfailed, 'w') as fp:
+        json.dump({}, fp)
+    record_failures(repo, 'py3', since)
+    assert not has_failures('foo')
+
+
+def test_junit_results(tmp_path):
+    junit_xml = tmp_path / 'junit.xml'
+    assert junit_results(str(junit_xml)) is None
+
+    junit_xml.write_text("""<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" errors="1" failures="1" skipped="1" tests="4" time="1.234">
+<testcase classname="tests.test_a" name="test_pass" time="0.1" />
+<testcase classname="tests.test_a" name="test_fail[1]" time="0.2"><failure message="assert False">...</failure></testcase>
+<testcase classname="tests.test_a" name="test_skip" time="0"><skipped message="skip" /></testcase>
+<testcase classname="tests.test_b" name="test_error" time="0"><error message="fixture">...</error></testcase>
+</testsuite></testsuites>""")
+
+    results = junit_results(str(junit_xml))
+    assert results == {'passed': 1, 'failed': 1, 'errors': 1, 'skipped': 1, 'time': 1.234,
+                       'failures': ['tests.test_a::test_fail[1]', 'tests.test_b::test_error']}
+    assert junit_summary(results) == '1 failed, 1 passed, 1 skipped, 1 error in 1.23s'
+    assert wst_test.Test.summarize({'foo': results}) == (False, [junit_summary(results)])
+
+    results.update(failed=0, errors=0, failures=[])
+    assert wst_test.Test.summarize({'foo': results}) == (True, ['1 passed, 1 skipped in 1.23s'])
+    assert wst_test.Test()._summarize_repo(('foo', 'output', results, True)) == (True, '1 passed, 1 skipped in 1.23s')
+    assert wst_test.Test()._summarize_repo(('foo', 'output', results, False)) == (
+        False, '1 passed, 1 skipped in 1.23s (but the test command failed)')  # Such as --cov-fail-under
+
+    junit_xml.write_text('<testsuites><testsuite name="pytest">')
+    assert junit_results(str(junit_xml)) is None
+
+
+def test_summarize_output():
+    assert wst_test.Test.summarize({'foo': '=== test session starts ===\n=== 2 passed in 0.12s ==='}) == (True, ['2 passed in 0.12s'])
+    assert wst_test.Test.summarize({'foo': '=== test session starts ===\n=== 1 failed, 1 passed in 1.50 seconds ==='}) == (
+        False, ['1 failed, 1 passed in 1.50 seconds'])
+    assert wst_test.Test.summarize({'foo': '.....\n=== 3 passed, 1 xfailed in 2.00s ==='}) == (True, ['3 passed, 1 xfailed in 2.00s'])
+    assert wst_test.Test.summarize({'foo': '=== FAILURES ===\n___ test_fail ___'}) == (False, ['No test summary found in output'])
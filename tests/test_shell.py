@@ -0,0 +1,63 @@
+import os
+
+from utils.process import run
+
+from workspace.config import config
+
+from test_stubs import temp_git_repo
+
+
+def test_shell(wst, capfd, monkeypatch):
+    with temp_git_repo() as cwd:
+        run('git commit --allow-empty -m Dummy')
+        os.makedirs('subdir')
+
+        lines = iter(['', 'st', 'cd subdir', 'di', 'bogus', 'shell', 'log -n 1 --oneline', 'exit', 'st'])
+        monkeypatch.setattr('builtins.input', lambda prompt: next(lines))
+
+        wst('shell')
+
+        out, err = capfd.readouterr()
+        assert out.count('# Branches: master') == 1
+        assert 'invalid choice' in err
+        assert 'Dummy' in out
+        assert os.getcwd() == str(cwd / 'subdir')
+        assert next(lines) == 'st'
+
+
+def test_shell_reloads_config(wst, monkeypatch, tmp_path):
+    user_config = tmp_path / 'workspace.cfg'
+    user_config.write_text('[merge]\nbranches = 1.0.x master\n')
+    os.utime(str(user_config), (0, 0))
+    monkeypatch.setattr(config, '_last_source', str(user_config))
+    monkeypatch.setattr(config, '_sources_read', False)
+
+    branches = []
+
+    def run_command(self, args):
+        config.reload_if_changed()
+        branches.append(config.merge.branches)
+
+    monkeypatch.setattr('workspace.commands.shell.Shell.run_command', run_command)
+
+    lines = iter(['st', 'st', 'st'])
+
+    def input(prompt):
+        line = next(lines, None)
+        if line is None:
+            raise EOFError
+        if len(branches) == 1:
+            user_config.write_text('[merge]\nbranches = 2.0.x master\n')
+            os.utime(str(user_config), (1, 1))
+        return line
+
+    monkeypatch.setattr('builtins.input', input)
+    monkeypatch.setattr('workspace.commands.shell.Shell.setup_readline', lambda self: None)
+
+    wst('shell')
+
+    assert branches == ['1.0.x master', '2.0.x master', '2.0.x master']
+
+    user_config.unlink()
+    assert config.reload_if_changed()
+    assert not config.merge.branches
@@ -0,0 +1,48 @@
+"""
+Upper bounds on the number of git processes spawned by each command. Spawning git is the main cost of most
+commands, so if a change needs more, be sure it is worth it before raising the budget.
+"""
+import pytest
+from utils.process import run
+
+from test_stubs import temp_dir, temp_local_remote_git_repo
+
+
+@pytest.mark.parametrize('setup,command,budget', [
+    ([], 'status', 4),
+    ([], 'diff', 3),
+    ([], 'log -n 1', 1),
+    ([], 'update', 7),
+    (['git branch feature'], 'checkout feature', 3),
+    (['git checkout -b child@master'], 'update', 10),
+    (['touch new_file'], 'commit "Add new file"', 5),
+    (['git checkout -b child@master', 'git commit --allow-empty -m Child'], 'push', 17),
+    (['git branch feature'], 'merge feature', 21),
+    ([], 'clean', 0),
+])
+def test_repo_spawn_budget(wst, spawns, setup, command, budget):
+    with temp_local_remote_git_repo():
+        for cmd in setup:
+            run(cmd, shell=True)
+        spawns.reset()
+
+        wst(command)
+
+        assert spawns('git') <= budget
+
+
+@pytest.mark.parametrize('command,budget_per_repo', [
+    ('status', 3),
+    ('diff', 3),
+])
+def test_workspace_spawn_budget(wst, spawns, command, budget_per_repo):
+    with temp_dir():
+        repos = ['repo1', 'repo2', 'repo3']
+        for repo in repos:
+            run('git init ' + repo)
+            run('git commit --allow-empty -m Initial', cwd=repo)
+        spawns.reset()
+
+        wst(command)
+
+        assert spawns('git') <= budget_per_repo * len(repos)
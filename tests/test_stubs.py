@@ -40,3 +40,16 @@ def temp_remote_git_repo():
         repo_dir = tmpdir / 'remoteconfig'
         os.chdir(repo_dir)
         yield repo_dir
+
+
+@contextmanager
+def temp_local_remote_git_repo(name='product'):
+    """ Repo with a commit that is cloned from a local bare origin remote (no network needed) """
+    with temp_dir() as tmpdir:
+        run('git init --bare origin.git')
+        run(['git', 'clone', str(tmpdir / 'origin.git'), name])
+        repo_dir = tmpdir / name
+        os.chdir(repo_dir)
+        run('git commit --allow-empty -m Initial')
+        run('git push origin master')
+        yield repo_dir
@@ -0,0 +1,45 @@
+import json
+import os
+
+from utils.process import run
+
+from test_stubs import temp_dir, temp_git_repo
+
+
+def test_trace_status(wst):
+    with temp_git_repo() as cwd:
+        run('git commit --allow-empty -m Dummy')
+        trace_file = str(cwd / 'trace.json')
+
+        wst('--trace {} status'.format(trace_file))
+
+        events = json.load(open(trace_file))['traceEvents']
+        phases = [e for e in events if e.get('cat') == 'phase']
+        processes = [e for e in events if e.get('cat') == 'subprocess']
+
+        assert [e['name'] for e in phases] == ['wst status']
+        assert processes and all(e['name'].startswith('git ') for e in processes)
+
+        status = [e for e in processes if e['args']['argv'][:2] == ['git', '-c']][0]
+        assert status['args']['exit_code'] == 0
+        assert status['args']['output_bytes'] > 0
+        assert status['args']['repo'] == cwd.name
+        assert phases[0]['ts'] <= status['ts'] and status['dur'] <= phases[0]['dur']
+
+
+def test_trace_parallel_call(wst):
+    with temp_dir() as cwd:
+        for repo in ['repo1', 'repo2']:
+            run('git init ' + repo)
+            run('git commit --allow-empty -m Dummy', cwd=repo)
+        trace_file = str(cwd / 'trace.json')
+
+        wst('--trace {} update'.format(trace_file))
+
+        events = json.load(open(trace_file))['traceEvents']
+        tasks = [e for e in events if e['name'].startswith('_update_repo ')]
+        processes = [e for e in events if e.get('cat') == 'subprocess']
+
+        assert sorted(os.path.basename(e['name']) for e in tasks) == ['repo1', 'repo2']
+        assert {e['args']['repo'] for e in processes} == {'repo1', 'repo2'}
+        assert {e['pid'] for e in processes} == {e['pid'] for e in tasks}
@@ -1,4 +1,6 @@
-from workspace.utils import shortest_id
+import os
+
+from workspace.utils import cpu_tokens, file_signature, file_tail, memoize_by, run_to_file, shortest_id
 
 
 def test_shortest_id():
@@ -6,3 +8,65 @@ def test_shortest_id():
     assert shortest_id('apple', ['apricot', 'banana']) == 'app'
     assert shortest_id('apple', ['apple seed', 'banana']) == 'apple'
     assert shortest_id('apple', ['apple', 'banana']) == 'a'
+
+
+def test_memoize_by(tmp_path):
+    path = tmp_path / 'file'
+    path.write_text('1')
+    os.utime(str(path), (0, 0))
+    calls = []
+
+    @memoize_by(lambda name: file_signature([str(path)]))
+    def read(name):
+        calls.append(name)
+        return [path.read_text()]
+
+    assert read('a') == ['1']
+    read('a').append('mutated')
+    assert read('a') == ['1']
+    assert calls == ['a']
+
+    path.write_text('2')
+    assert read('a') == ['2']
+    assert read('a') == ['2']
+    assert calls == ['a', 'a', 'a']  # Not memoized as the file changed too recently
+
+    os.utime(str(path), (1, 1))
+    assert read('a') == ['2']
+    assert read('b') == ['2']
+    assert calls == ['a', 'a', 'a', 'a', 'b']
+
+
+def test_cpu_tokens():
+    with cpu_tokens(3, budget=4) as tokens:
+        assert tokens == 3
+
+        with cpu_tokens(3, budget=4) as more_tokens:
+            assert more_tokens == 1
+
+    with cpu_tokens(5, budget=4) as tokens:
+        assert tokens == 4
+
+    with cpu_tokens(5, budget=4, share=3) as tokens:
+        assert tokens == 2
+
+        with cpu_tokens(5, budget=4, share=2) as more_tokens:
+            assert more_tokens == 1
+
+            with cpu_tokens(5, budget=4) as last_tokens:
+                assert last_tokens == 1
+
+
+def test_run_to_file(tmp_path):
+    output_file = str(tmp_path / 'test.out')
+
+    assert run_to_file(['echo', 'hello'], output_file) == ('hello\n', True)
+    assert run_to_file('seq 1000; exit 1', output_file, tail_bytes=10, shell=True) == ('999\n1000\n', False)
+
+    with open(output_file) as fp:
+        assert fp.read() == 'hello\n' + ''.join('%d\n' % i for i in range(1, 1001))
+    assert file_tail(output_file, tail_bytes=10) == '999\n1000\n'
+    assert file_tail(str(tmp_path / 'missing.out')) == ''
+
+    tail, success = run_to_file(['no-such-command'], output_file)
+    assert not success and 'no-such-command' in tail
@@ -0,0 +1,62 @@
+import os
+import stat
+
+from workspace.commands.helpers import ToxIni
+from workspace.wheelhouse import (build_wheels, is_complete, is_pinned, mark_used, missing_wheels, pip_environ,
+                                  remove_unused_wheels, wheelhouse_path)
+
+
+FAKE_PIP = """#!/bin/sh
+echo "$@" >> {log}
+touch {wheelhouse}/click-7.0-py3-none-any.whl
+"""
+
+
+def test_wheelhouse(tmp_path):
+    product = tmp_path / 'foo'
+    envdir = product / '.tox' / 'py'
+    os.makedirs(str(envdir / 'bin'))
+    os.makedirs(str(envdir / 'lib' / 'python3.9' / 'site-packages' / 'click-7.0.dist-info'))
+    (product / 'tox.ini').write_text('[tox]\nenvlist = py\n')
+    (product / 'requirements.txt').write_text('click==7.0\n')
+    (product / 'setup.py').write_text('setup()\n')
+    pip = envdir / 'bin' / 'pip'
+    pip.write_text(FAKE_PIP.format(log=tmp_path / 'pip.log', wheelhouse=wheelhouse_path()))
+    pip.chmod(pip.stat().st_mode | stat.S_IEXEC)
+    tox = ToxIni(str(product))
+
+    assert pip_environ(tox, ['py']) == {'PIP_FIND_LINKS': wheelhouse_path()}
+
+    assert missing_wheels(tox, 'py') == ['click==7.0']
+    assert build_wheels(tox, 'py')
+    assert is_complete(tox, 'py')
+    assert missing_wheels(tox, 'py') == []
+    assert sorted(os.listdir(wheelhouse_path())) == ['.complete', 'click-7.0-py3-none-any.whl']
+    assert pip_environ(tox, ['py']) == {'PIP_FIND_LINKS': wheelhouse_path(), 'PIP_NO_INDEX': '1'}
+
+    (product / 'setup.py').write_text("setup(\n    install_requires=['requests'],\n)\n")
+    assert not is_pinned(tox, 'py')
+    (product / 'requirements.txt').write_text('click==7.0\nrequests==2.0\n')
+    assert is_pinned(tox, 'py')
+    (product / 'requirements.txt').write_text('click>=7.0\nrequests==2.0\n')
+    assert not is_pinned(tox, 'py')
+    (product / 'requirements.txt').write_text('click==7.0\n')
+    (product / 'setup.py').write_text('setup()\n')
+
+    # Only missing wheels are built
+    os.makedirs(str(envdir / 'lib' / 'python3.9' / 'site-packages' / 'six-1.15.0.dist-info'))
+    os.makedirs(str(envdir / 'lib' / 'python3.9' / 'site-packages' / 'foo-1.0.dist-info'))
+    os.remove(wheelhouse_path('.complete', os.listdir(wheelhouse_path('.complete'))[0]))
+    assert build_wheels(tox, 'py')
+    assert (tmp_path / 'pip.log').read_text() == (
+        'wheel -q --no-deps --wheel-dir {0} click==7.0\nwheel -q --no-deps --wheel-dir {0} six==1.15.0\n'.format(
+            wheelhouse_path()))
+
+    wheel = wheelhouse_path('click-7.0-py3-none-any.whl')
+    os.utime(wheel, (0, 0))
+    mark_used(str(envdir))
+    assert remove_unused_wheels(1) == []
+
+    os.utime(wheel, (0, 0))
+    assert remove_unused_wheels(1) == ['click-7.0-py3-none-any.whl']
+    assert not is_complete(tox, 'py')
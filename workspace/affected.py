@@ -0,0 +1,198 @@
+"""
+Test impact analysis to find tests affected by changes since the parent branch.
+
+Tests in the product are selected from per-test coverage contexts recorded by pytest-cov (--cov-context=test) in
+the .coverage data of the last "cover" run. Recording contexts makes coverage slower and its data larger, so they are
+only recorded for products where --affected has been used (see :func:`use_contexts`). Tests in dependents are selected
+by the modules that they import.
+"""
+from __future__ import absolute_import
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+
+from workspace.config import config
+from workspace.scm import current_branch, diff_repo, parent_branch
+from workspace.utils import file_signature, load_cache, save_cache
+
+log = logging.getLogger(__name__)
+
+#: Name of the coverage data file in the product root
+COVERAGE_FILE = '.coverage'
+
+#: Files that affect all tests when changed, in addition to requirement files
+FULL_SUITE_FILES = ['conftest.py', 'setup.py', 'setup.cfg', 'pyproject.toml', 'tox.ini', 'pytest.ini']
+
+#: Dir in the cache dir with a file for each product that needs test contexts, see :func:`use_contexts`
+CONTEXTS_DIR = 'affected-contexts'
+
+TEST_FILE_RE = re.compile(r'(^|/)(test_[^/]*|[^/]*_test)\.py$')
+
+COVERAGE_CONTEXTS_SQL = """
+SELECT DISTINCT file.path, context.context FROM line_bits
+    JOIN file ON file.id = line_bits.file_id JOIN context ON context.id = line_bits.context_id
+UNION
+SELECT DISTINCT file.path, context.context FROM arc
+    JOIN file ON file.id = arc.file_id JOIN context ON context.id = arc.context_id
+"""
+
+
+def _read_coverage_contexts(coverage_file, repo):
+    """ Map of file path (relative to repo) to sorted list of test node IDs that executed it """
+    tests = {}
+    connection = sqlite3.connect('file:{}?mode=ro'.format(coverage_file), uri=True)
+
+    try:
+        for path, context in connection.execute(COVERAGE_CONTEXTS_SQL):
+            node_id = context.rsplit('|', 1)[0]  # Strip the phase, e.g. "|run"
+            if node_id:
+                tests.setdefault(os.path.relpath(path, repo), set()).add(node_id)
+    finally:
+        connection.close()
+
+    return dict((path, sorted(node_ids)) for path, node_ids in tests.items())
+
+
+def coverage_map(repo):
+    """
+    Map of file path (relative to repo) to the test node IDs that executed it from the coverage data of the repo, which
+    is cached until the data changes.
+
+    :param str repo: Path to the repo
+    :return: Dict of path to list of node IDs, or None if there is no coverage data with test contexts.
+    """
+    coverage_file = os.path.join(repo, COVERAGE_FILE)
+    if not os.path.exists(coverage_file):
+        return None
+
+    cache_name = os.path.join('affected', hashlib.sha1(repo.encode('utf-8')).hexdigest() + '.json')
+    key = file_signature([coverage_file])
+    tests = key and load_cache(cache_name, key)
+
+    if tests is None:
+        try:
+            tests = _read_coverage_contexts(coverage_file, repo)
+        except Exception as e:  # Old data file format or no contexts
+            log.debug('Could not read coverage contexts from %s: %s', coverage_file, e)
+            tests = {}
+
+        if key:
+            save_cache(cache_name, key, tests)
+
+    return tests or None
+
+
+def _contexts_cache_name(repo):
+    return os.path.join(CONTEXTS_DIR, hashlib.sha1(repo.encode('utf-8')).hexdigest() + '.json')
+
+
+def use_contexts(repo):
+    """ Record test contexts in cover runs of the repo from now on, as --affected needs them """
+    if not uses_contexts(repo):
+        save_cache(_contexts_cache_name(repo), 1, True)
+
+
+def uses_contexts(repo):
+    """ Check if cover runs of the repo should record test contexts, see :func:`use_contexts` """
+    return bool(load_cache(_contexts_cache_name(repo), 1))
+
+
+def changed_files(repo):
+    """ Files changed (committed or not) since the parent branch of the current branch, or master if there isn't one """
+    branch = current_branch(repo)
+    base = branch and parent_branch(branch) or 'master'
+    output = diff_repo(repo, branch=base, name_only=True, return_output=True) or ''
+    return sorted(f for f in output.split('\n') if f)
+
+
+def is_test_file(path):
+    return bool(TEST_FILE_RE.search(path))
+
+
+def affected_tests(repo, changed=None):
+    """
+    Tests in the repo that are affected by the changed files.
+
+    :param str repo: Path to the repo
+    :param list changed: Changed files relative to repo. Defaults to :func:`changed_files`
+    :return: Sorted list of test node IDs / test files (relative to repo), or None if all tests should run as it can
+             not be determined, such as when there is no coverage data or a changed module was not executed by tests.
+    """
+    changed = changed_files(repo) if changed is None else changed
+    full_suite_files = FULL_SUITE_FILES + config.bump.requirement_files.split()
+
+    full_suite_changes = [f for f in changed if os.path.basename(f) in full_suite_files]
+    if full_suite_changes:
+        log.info('Running all tests as %s changed', ', '.join(full_suite_changes))
+        return None
+
+    tests = coverage_map(repo)
+    if tests is None:
+        log.info('Running all tests as there is no coverage data with test contexts from a previous cover run '
+                 '(they are recorded from now on)')
+        return None
+
+    affected = set()
+
+    for path in changed:
+        if not path.endswith('.py'):
+            continue
+
+        if is_test_file(path):
+            if os.path.exists(os.path.join(repo, path)):
+                affected.add(path)
+
+        elif path in tests:
+            affected.update(tests[path])
+
+        elif os.path.exists(os.path.join(repo, path)):
+            log.info('Running all tests as %s was not executed by any test in the last cover run', path)
+            return None
+
+    return sorted(affected)
+
+
+def module_name(path):
+    """ Dotted module name for the Python file path relative to its repo, e.g. "src/foo/bar.py" => "foo.bar" """
+    parts = path[:-len('.py')].split('/')
+    if parts[0] in ('src', 'lib') and len(parts) > 1:
+        parts = parts[1:]
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return '.'.join(parts)
+
+
+def importing_tests(repo, modules):
+    """
+    Test files in the repo that import any of the modules (directly or via "from package import module").
+
+    :param str repo: Path to the repo
+    :param list modules: Dotted module names
+    :return: Sorted list of test file paths relative to repo
+    """
+    patterns = []
+    for module in modules:
+        package, _, name = module.rpartition('.')
+        patterns.append(r'^\s*import\s+{}\b'.format(re.escape(module)))
+        patterns.append(r'^\s*from\s+{}(\s|\.)'.format(re.escape(module)))
+        if package:
+            patterns.append(r'^\s*from\s+{}\s+import\s+(\([^)]*\b|.*\b){}\b'.format(re.escape(package), re.escape(name)))
+    if not patterns:
+        return []
+
+    import_re = re.compile('|'.join(patterns), re.MULTILINE)
+    tests = []
+
+    for root, dirs, files in os.walk(repo):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('build', 'dist', 'node_modules')]
+
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), repo).replace(os.sep, '/')
+            if is_test_file(path):
+                with open(os.path.join(root, name), errors='replace') as fp:
+                    if import_re.search(fp.read()):
+                        tests.append(path)
+
+    return sorted(tests)
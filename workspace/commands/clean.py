@@ -10,7 +10,10 @@ from utils.process import silent_run
 from workspace.commands import AbstractCommand
 from workspace.commands.helpers import expand_product_groups
 from workspace.config import config
+from workspace.envs import dedupe_envs, known_envdirs
+from workspace.results import remove_old_results
 from workspace.scm import workspace_path, product_name, repos, stat_repo, all_branches, repo_path
+from workspace.wheelhouse import remove_unused_wheels, wheelhouse_path
 
 log = logging.getLogger(__name__)
 
@@ -20,16 +23,25 @@ class Clean(AbstractCommand):
     Clean workspace by removing build, dist, and .pyc files
 
     :param bool force: Remove untracked files too.
+    :param bool dedupe_envs: Hard link identical files across test environments (in ~/.virtualenvs and .tox dirs of
+                             products in the workspace) to save disk space instead.
     """
 
     @classmethod
     def arguments(cls):
         _, docs = cls.docs()
         return [
-          cls.make_args('-f', '--force', action='store_true', help=docs['force'])
+          cls.make_args('-f', '--force', action='store_true', help=docs['force']),
+          cls.make_args('--dedupe-envs', action='store_true', help=docs['dedupe_envs'])
         ]
 
     def run(self):
+        if self.dedupe_envs:
+            envdirs = known_envdirs(workspace_path())
+            click.echo('Deduplicating files in {} test environments'.format(len(envdirs)))
+            linked, saved = dedupe_envs(envdirs, prune=True)
+            click.echo('Hard linked {} files to save {:.1f} MB'.format(linked, saved / 1024.0 / 1024))
+            return
 
         repo = repo_path()
         if repo:
@@ -48,6 +60,18 @@ class Clean(AbstractCommand):
             path = workspace_path()
             click.echo('Cleaning {}'.format(path))
 
+            if config.clean.remove_wheels_unused_for_days:
+                removed_wheels = remove_unused_wheels(config.clean.remove_wheels_unused_for_days)
+                if removed_wheels:
+                    click.echo('Removed {} wheels unused for {} days from {}'.format(
+                        len(removed_wheels), config.clean.remove_wheels_unused_for_days, wheelhouse_path()))
+
+            if config.clean.remove_test_results_older_than_days:
+                removed_results = remove_old_results(config.clean.remove_test_results_older_than_days)
+                if removed_results:
+                    click.echo('Removed {} cached test results older than {} days'.format(
+                        removed_results, config.clean.remove_test_results_older_than_days))
+
             if config.clean.remove_products_older_than_days or config.clean.remove_all_products_except:
                 keep_time = 0
                 keep_products = []
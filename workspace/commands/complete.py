@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+from glob import glob
+import hashlib
+import logging
+import os
+import re
+
+from workspace.commands import AbstractCommand
+from workspace.config import product_groups
+from workspace.scm import product_name, repo_path, repos
+from workspace.utils import load_cache, save_cache
+
+log = logging.getLogger(__name__)
+
+TESTENV_RE = re.compile(r'^\[testenv:(.+)]', re.MULTILINE)
+
+#: Tox envs that are not completed as they are implied
+SKIP_ENVS = ('py', 'pydev')
+
+
+class Complete(AbstractCommand):
+    """
+      Print completions for the shell completers installed by "wst setup", one per line.
+
+      Completions are answered from an index in the cache dir that is refreshed when the refs, workspace dir or tox ini
+      files change, so it is fast in repos with thousands of branches.
+
+      :param str kind: Kind of completion
+      :param str prefix: Only print completions that start with the prefix
+    """
+    #: Map of completion kind to function that returns a tuple of (key, completer) for the current dir, where key is
+    #: used to invalidate the index and completer returns the list of completions when the key changes.
+    KINDS = {}
+
+    @classmethod
+    def name(cls):
+        return '__complete'
+
+    @classmethod
+    def arguments(cls):
+        _, docs = cls.docs()
+        return [
+          cls.make_args('kind', choices=sorted(cls.KINDS), help=docs['kind']),
+          cls.make_args('prefix', nargs='?', default='', help=docs['prefix'])
+        ]
+
+    def run(self):
+        for completion in completions(self.kind):
+            if completion.startswith(self.prefix):
+                print(completion)
+
+
+def completions(kind, path=None):
+    """
+      Completions of the given kind for the path from the index, which is updated if its key changed.
+
+      :param str kind: One of :attr:`Complete.KINDS`
+      :param str path: Path to complete for. Defaults to current dir.
+      :return: Sorted list of completions
+    """
+    path = path or os.getcwd()
+    index_key, completer = Complete.KINDS[kind](path)
+    if index_key is None:
+        return []
+
+    name = os.path.join('complete', hashlib.sha1('{}:{}'.format(kind, path).encode('utf-8')).hexdigest() + '.json')
+    result = load_cache(name, index_key)
+
+    if result is None:
+        result = sorted(set(completer()))
+        save_cache(name, index_key, result)
+
+    return result
+
+
+def _mtimes(paths):
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append([path, os.stat(path).st_mtime])
+        except OSError:
+            pass
+    return mtimes
+
+
+def _ref_dirs(git_dir, prefix):
+    return [root for root, _, _ in os.walk(os.path.join(git_dir, prefix))]
+
+
+def _refs(git_dir, prefix):
+    """ Names of refs (without prefix) in the loose refs dir and packed-refs file """
+    refs = set()
+    ref_path = os.path.join(git_dir, prefix)
+
+    for root, _, files in os.walk(ref_path):
+        for file in files:
+            refs.add(os.path.relpath(os.path.join(root, file), ref_path))
+
+    try:
+        with open(os.path.join(git_dir, 'packed-refs')) as fp:
+            for line in fp:
+                ref = line.rstrip('\n').split(' ', 1)[-1]
+                if ref.startswith(prefix + '/'):
+                    refs.add(ref[len(prefix) + 1:])
+    except IOError:
+        pass
+
+    return [r for r in refs if not r.endswith('HEAD')]
+
+
+def _refs_completion(prefix):
+    def index(path):
+        repo = repo_path(path)
+        if not repo:
+            return None, None
+
+        git_dir = os.path.join(repo, '.git')
+        key = _mtimes(_ref_dirs(git_dir, prefix) + [os.path.join(git_dir, 'packed-refs')])
+        return key, lambda: _refs(git_dir, prefix)
+
+    return index
+
+
+def _products_completion(path):
+    repo = repo_path(path)
+    workspace = os.path.dirname(repo) if repo else path
+    return _mtimes([workspace]), lambda: [product_name(r) for r in repos(workspace)]
+
+
+def _groups_completion(path):
+    groups = sorted(product_groups())
+    return groups, lambda: groups
+
+
+def _envs_completion(path):
+    ini_files = sorted(glob(os.path.join(path, 'tox*.ini')) + glob(os.path.join(path, '.tox*.ini')))
+
+    def envs():
+        envs = []
+        for ini_file in ini_files:
+            with open(ini_file) as fp:
+                envs.extend(e for e in TESTENV_RE.findall(fp.read()) if e not in SKIP_ENVS)
+        return envs
+
+    return _mtimes([path] + ini_files), envs
+
+
+Complete.KINDS.update({
+    'branches': _refs_completion('refs/heads'),
+    'remote-branches': _refs_completion('refs/remotes'),
+    'products': _products_completion,
+    'groups': _groups_completion,
+    'envs': _envs_completion,
+})
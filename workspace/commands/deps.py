@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+import logging
+import sys
+
+import click
+
+from workspace.commands import AbstractCommand
+from workspace.deps import workspace_graph
+from workspace.scm import product_name, repo_path, workspace_path
+
+log = logging.getLogger(__name__)
+
+
+class Deps(AbstractCommand):
+    """
+      Show dependencies between products checked out in the workspace based on their requirement files and setup
+      metadata.
+
+      :param str action: What to show: "graph" shows each product with the products that it depends on,
+                         "dependents" shows products that depend on the product (by level), and "dependencies"
+                         shows products that the product depends on (by level).
+      :param str product: Product to show dependents / dependencies for. Defaults to current product.
+      :param int depth: Number of levels of dependents / dependencies to show. Defaults to all levels.
+    """
+    ACTIONS = ['graph', 'dependents', 'dependencies']
+
+    @classmethod
+    def arguments(cls):
+        _, docs = cls.docs()
+        return [
+          cls.make_args('action', choices=cls.ACTIONS, help=docs['action']),
+          cls.make_args('product', nargs='?', help=docs['product']),
+          cls.make_args('--depth', type=int, help=docs['depth'])
+        ]
+
+    def run(self):
+        graph = workspace_graph(workspace_path())
+
+        if self.action == 'graph':
+            for name, dependencies in sorted(graph.dependencies.items()):
+                click.echo('{} -> {}'.format(name, ', '.join(dependencies)) if dependencies else name)
+            return graph.dependencies
+
+        product = self.product or (repo_path() and product_name(repo_path()))
+        if not product:
+            log.error('Please specify a product or run from a product repo')
+            sys.exit(1)
+
+        if self.action == 'dependents':
+            levels = graph.dependents(product, self.depth)
+        else:
+            levels = graph.dependencies_of(product, self.depth)
+
+        for level, names in enumerate(levels, 1):
+            click.echo('{}: {}'.format(level, ' '.join(names)))
+
+        return levels
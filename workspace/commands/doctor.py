@@ -0,0 +1,188 @@
+from __future__ import absolute_import
+import logging
+import os
+from statistics import median
+import sys
+from time import time
+
+import click
+from utils.process import silent_run
+
+from workspace.commands import AbstractCommand
+from workspace.commands.helpers import expand_product_groups
+from workspace.scm import all_branches, all_remotes, commit_logs, product_name, repos, stat_repo, upstream_remote
+from workspace.utils import parallel_call
+
+log = logging.getLogger(__name__)
+
+#: Operations timed for each repo, in the order they are shown
+PERF_OPERATIONS = ['status', 'branches', 'log', 'fetch']
+
+#: Repo characteristics that commonly make git slow, mapped to (threshold, cause)
+PERF_CAUSES = [
+    ('loose_objects', 5000, '{} loose objects -- run "git gc" to pack them'),
+    ('packs', 20, '{} pack files -- run "git gc" or "git repack -ad" to consolidate them'),
+    ('refs', 2000, '{} refs -- remove merged branches and run "git fetch --prune" / "git pack-refs --all"'),
+    ('index_mb', 25, '{:.1f} MB index -- too many tracked files, consider sparse-checkout or core.fsmonitor'),
+    ('untracked', 1000, '{} untracked files -- add them to .gitignore or remove them'),
+]
+
+#: A repo is an outlier when its total time is this many times the median and above the minimum seconds.
+OUTLIER_FACTOR = 2
+OUTLIER_MIN_SECONDS = 0.5
+
+
+class Doctor(AbstractCommand):
+    """
+      Diagnose common workspace issues.
+
+      :param list products: Only check these products or product groups
+      :param bool perf: Time common operations (status, branch listing, log, fetch dry run) in each repo, inspect
+                        repo characteristics, and rank the repos from slowest to fastest with the likely cause of
+                        each outlier.
+    """
+
+    @classmethod
+    def arguments(cls):
+        _, docs = cls.docs()
+        return [
+          cls.make_args('products', nargs='*', help=docs['products']),
+          cls.make_args('--perf', action='store_true', help=docs['perf']),
+        ]
+
+    def run(self):
+        if not self.perf:
+            log.error('Please select a diagnostic to run, such as --perf. See -h for options.')
+            sys.exit(1)
+
+        products = self.products and expand_product_groups(self.products)
+        select_repos = [repo for repo in repos() if not products or product_name(repo) in products]
+
+        if not select_repos:
+            click.echo('No product found')
+            return []
+
+        if len(select_repos) == 1:
+            results = [measure_repo(select_repos[0])]
+        else:
+            results = list(parallel_call(measure_repo, select_repos, show_progress=True,
+                                         progress_title='Measuring').values())
+
+        failed = [r for r in results if not isinstance(r, dict)]
+        for error in failed:
+            log.error(error)
+
+        results = rank_repos([r for r in results if isinstance(r, dict)])
+        self.show_report(results)
+
+        return results
+
+    def show_report(self, results):
+        """ Print the ranked timings table followed by the causes for each outlier """
+        name_width = max([len(r['name']) for r in results] + [7])
+        header = '{:<{}}  {:>7}  '.format('Product', name_width, 'Total') + '  '.join(
+            '{:>8}'.format(op) for op in PERF_OPERATIONS)
+        header += '  {:>8}  {:>5}  {:>6}  {:>8}  {:>9}'.format('Objects', 'Packs', 'Refs', 'Index', 'Untracked')
+
+        click.echo(header)
+        for result in results:
+            timings, stats = result['timings'], result['stats']
+            line = '{:<{}}  {:>6.2f}s  '.format(result['name'], name_width, result['total']) + '  '.join(
+                '{:>7.2f}s'.format(timings[op]) if op in timings else '{:>8}'.format('-') for op in PERF_OPERATIONS)
+            line += '  {:>8}  {:>5}  {:>6}  {:>6.1f}MB  {:>9}'.format(
+                stats['objects'], stats['packs'], stats['refs'], stats['index_mb'], stats['untracked'])
+            click.secho(line, fg='red' if result['outlier'] else None)
+
+        outliers = [r for r in results if r['outlier']]
+        if outliers:
+            click.echo('')
+            for result in outliers:
+                click.echo('{}:'.format(result['name']))
+                for cause in result['causes']:
+                    click.echo('  - ' + cause)
+
+
+def measure_repo(repo):
+    """
+    Time common operations in the repo and gather characteristics that affect git performance.
+
+    :param str repo: Path to the repo
+    :return: Dict with name, path, timings (operation to seconds), and stats
+    """
+    timings = {}
+
+    def timed(op, call, *args, **kwargs):
+        start = time()
+        call(*args, **kwargs)
+        timings[op] = time() - start
+
+    timed('status', stat_repo, repo, return_output=True)
+    timed('branches', all_branches, repo, verbose=True)
+    timed('log', commit_logs, limit=100, repo=repo)
+
+    remotes = all_remotes(repo=repo)
+    if remotes:
+        timed('fetch', silent_run, ['git', 'fetch', '--dry-run', upstream_remote(repo=repo, remotes=remotes)],
+              cwd=repo, raises=False)
+
+    return {
+        'name': product_name(repo),
+        'path': repo,
+        'timings': timings,
+        'stats': repo_stats(repo)
+    }
+
+
+def repo_stats(repo):
+    """ Returns a dict of repo characteristics that affect git performance """
+    objects = {}
+    output = silent_run(['git', 'count-objects', '-v'], cwd=repo, return_output=True)
+    for line in output.split('\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            objects[key.strip()] = value.strip()
+
+    refs = silent_run(['git', 'for-each-ref', '--format=%(refname)'], cwd=repo, return_output=True)
+    untracked = silent_run(['git', 'ls-files', '--others', '--exclude-standard'], cwd=repo, return_output=True)
+    index_path = os.path.join(repo, '.git', 'index')
+
+    return {
+        'loose_objects': int(objects.get('count', 0)),
+        'objects': int(objects.get('count', 0)) + int(objects.get('in-pack', 0)),
+        'packs': int(objects.get('packs', 0)),
+        'refs': len([_f for _f in refs.split('\n') if _f]),
+        'index_mb': os.path.getsize(index_path) / 1024.0 / 1024 if os.path.exists(index_path) else 0,
+        'untracked': len([_f for _f in untracked.split('\n') if _f])
+    }
+
+
+def perf_causes(result):
+    """ Returns a list of likely causes for slowness based on the repo's stats and timings """
+    stats, timings = result['stats'], result['timings']
+    causes = [cause.format(stats[stat]) for stat, threshold, cause in PERF_CAUSES if stats[stat] > threshold]
+
+    slowest_op = max(timings, key=timings.get)
+    if slowest_op == 'fetch' and not causes:
+        causes.append('slow fetch ({:.1f}s) -- check network or remote server'.format(timings['fetch']))
+    elif slowest_op == 'log' and not causes:
+        causes.append('slow log ({:.1f}s) -- run "git commit-graph write --reachable"'.format(timings['log']))
+    elif not causes:
+        causes.append('slow {} ({:.1f}s) -- consider enabling core.untrackedCache and core.fsmonitor'.format(
+            slowest_op, timings[slowest_op]))
+
+    return causes
+
+
+def rank_repos(results):
+    """ Sort results from slowest to fastest and flag outliers with their likely causes """
+    for result in results:
+        result['total'] = sum(result['timings'].values())
+
+    results = sorted(results, key=lambda r: r['total'], reverse=True)
+    median_total = median(r['total'] for r in results) if results else 0
+
+    for result in results:
+        result['outlier'] = result['total'] >= max(median_total * OUTLIER_FACTOR, OUTLIER_MIN_SECONDS)
+        result['causes'] = perf_causes(result) if result['outlier'] else []
+
+    return results
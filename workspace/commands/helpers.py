@@ -7,15 +7,19 @@ from localconfig import LocalConfig
 
 from workspace.config import product_groups
 from workspace.scm import project_path
+from workspace.utils import file_signature
 
 log = logging.getLogger(__name__)
 
 
 class ToxIni(LocalConfig):
-    """ Represents tox.ini """
+    """ Represents tox.ini. Use :meth:`load` to get a cached instance. """
 
     VAR_RE = re.compile(r'{(\w+)}')
 
+    #: Map of (tox_ini, path) to (file signature, ToxIni) for :meth:`load`
+    _instances = {}
+
     def __init__(self, path=None, tox_ini=None):
         """
         :param str path: The path to load tox*.ini from.
@@ -30,6 +34,32 @@ class ToxIni(LocalConfig):
         self.tox_ini = tox_ini
         self.path = path or os.path.dirname(tox_ini)
 
+        #: Expanded values per env
+        self._envdirs = {}
+        self._commands = {}
+
+    @classmethod
+    def load(cls, path=None, tox_ini=None):
+        """
+        Get a ToxIni that is shared in the process and only parsed again when the tox ini file changes.
+
+        :param str path: The path to load tox*.ini from.
+        :param str tox_ini: Path to tox ini file. Defaults to tox.ini in path root.
+        """
+        if not tox_ini:
+            tox_ini = cls.find_tox_ini(path)
+
+        key = (os.path.abspath(tox_ini), path)
+        signature = file_signature([tox_ini])
+
+        if signature is None:  # Changed too recently to know if it changes again
+            return cls(path, tox_ini)
+
+        if key not in cls._instances or cls._instances[key][0] != signature:
+            cls._instances[key] = (signature, cls(path, tox_ini))
+
+        return cls._instances[key][1]
+
     @classmethod
     def find_tox_ini(cls, path):
         """
@@ -72,6 +102,11 @@ class ToxIni(LocalConfig):
         return os.path.expanduser('~')
 
     def envdir(self, env):
+        if env not in self._envdirs:
+            self._envdirs[env] = self._envdir(env)
+        return self._envdirs[env]
+
+    def _envdir(self, env):
         default_envdir = os.path.join('{toxworkdir}', env)
         default_envsection = self.envsection()
         default_envdir = self.get(default_envsection, 'env_dir', self.get(default_envsection, 'envdir', default_envdir))
@@ -86,10 +121,12 @@ class ToxIni(LocalConfig):
         return dir
 
     def commands(self, env):
-        envsection = self.envsection(env)
-        commands = self.get(envsection, 'commands', self.get('testenv', 'commands', 'pytest {env:PYTESTARGS:}'))
-        commands = commands.replace('\\\n', '')
-        return [_f for _f in self.expand_vars(commands).split('\n') if _f]
+        if env not in self._commands:
+            envsection = self.envsection(env)
+            commands = self.get(envsection, 'commands', self.get('testenv', 'commands', 'pytest {env:PYTESTARGS:}'))
+            commands = commands.replace('\\\n', '')
+            self._commands[env] = [_f for _f in self.expand_vars(commands).split('\n') if _f]
+        return list(self._commands[env])
 
     def expand_vars(self, value, extra_vars={}):
         if '{' in value:
@@ -142,19 +179,88 @@ def create_pager(highlight_text=None):
     return pager
 
 
-def expand_product_groups(names):
-    """ Expand product groups found in the given list of names to produce a sorted list of unique names. """
-    unique_names = set(names)
-    exclude_names = set()
+class ProductGroups(object):
+    """ Product groups with the transitive closure of each group computed once """
+
+    def __init__(self, groups):
+        """
+        :param dict groups: Map of group name to list of names in the group, which can be products, groups, or names
+                            prefixed with "-" to exclude (also products or groups).
+        :raise ValueError: if a group contains itself directly or via other groups
+        """
+        self.groups = groups
+        self.closures = {}
+        self._groups_for = None
 
-    for name in list(unique_names):
-        if name.startswith('-'):
-            unique_names.remove(name)
-            exclude_names.update(expand_product_groups([name.lstrip('-')]))
+        for group in groups:
+            self._closure(group, [])
 
-    for group, names in list(product_groups().items()):
-        if group in unique_names:
-            unique_names.remove(group)
-            unique_names.update(expand_product_groups(names))
+    def _closure(self, group, path):
+        if group in self.closures:
+            return self.closures[group]
 
-    return sorted(list(unique_names - exclude_names))
+        if group in path:
+            raise ValueError('Product group "{}" contains itself: {}'.format(group, ' -> '.join(path[path.index(group):] + [group])))
+
+        path = path + [group]
+        names = set()
+        exclude_names = set()
+
+        for name in self.groups[group]:
+            target = exclude_names if name.startswith('-') else names
+            name = name.lstrip('-')
+            target.update(self._closure(name, path) if name in self.groups else [name])
+
+        self.closures[group] = frozenset(names - exclude_names)
+        return self.closures[group]
+
+    def expand(self, names):
+        """ Expand product groups found in the given list of names to produce a sorted list of unique names. """
+        unique_names = set()
+        exclude_names = set()
+
+        for name in names:
+            target = exclude_names if name.startswith('-') else unique_names
+            name = name.lstrip('-')
+            target.update(self.closures.get(name, [name]))
+
+        return sorted(unique_names - exclude_names)
+
+    def contains(self, group, name):
+        """ Check if the group contains the product name directly or via other groups """
+        return name in self.closures.get(group, ())
+
+    def groups_for(self, name):
+        """ Sorted list of groups that contain the product name directly or via other groups """
+        if self._groups_for is None:
+            self._groups_for = {}
+            for group, closure in self.closures.items():
+                for product in closure:
+                    self._groups_for.setdefault(product, []).append(group)
+
+        return sorted(self._groups_for.get(name, []))
+
+
+_product_groups_cache = (None, None)
+
+
+def all_product_groups():
+    """
+    :class:`ProductGroups` for the product groups in config, which is only recomputed when the groups change.
+
+    :raise ValueError: if a group contains itself
+    """
+    global _product_groups_cache
+
+    groups = product_groups()
+    key = sorted((group, tuple(names)) for group, names in groups.items())
+
+    if _product_groups_cache[0] != key:
+        _product_groups_cache = (key, ProductGroups(groups))
+
+    return _product_groups_cache[1]
+
+
+def expand_product_groups(names):
+    """ Expand product groups found in the given list of names to produce a sorted list of unique names. """
+    return all_product_groups().expand(names)
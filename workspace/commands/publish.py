@@ -95,7 +95,7 @@ class Publish(AbstractCommand):
 
         changelog_file = self.update_changelog(new_version, changes, self.minor or self.major)
 
-        tox = ToxIni()
+        tox = ToxIni.load()
         envs = [e for e in tox.envlist if e != 'style']
 
         if envs:
@@ -129,32 +129,26 @@ COMMANDS = {
   '_te': 'test',
 }
 AUTO_COMPLETE_TEMPLATE = r"""
-function _branch_file_completer() {
+function _wst_completer() {
   local cur=${COMP_WORDS[COMP_CWORD]}
-
-  if git status &> /dev/null; then
-    branches=`git branch`
-  else
-    branches=
-  fi
-
-  if [ ! -z "$branches" ]; then
-    COMPREPLY=( $( compgen -W "$branches" -- $cur ) )
-  fi
+  local IFS=$'\n'
+  COMPREPLY=( $( _wst __complete $1 -- "$cur" 2>/dev/null ) )
+}
+function _branch_file_completer() {
+  _wst_completer branches
 }
 function _env_file_completer() {
-  local cur=${COMP_WORDS[COMP_CWORD]}
-
-  if ls tox*.ini &>/dev/null || ls .tox*.ini &>/dev/null; then
-    envs=`grep -h '^\[testenv:' .tox*.ini tox*.ini 2>/dev/null | sed -E 's/^\[testenv:(.+)]/\\1/' | grep -vE '^(py|pydev)$'`
-    COMPREPLY=( $( compgen -W "$envs" -- $cur ) )
-  fi
+  _wst_completer envs
+}
+function _product_completer() {
+  _wst_completer products
 }
 
 complete -o default -F _branch_file_completer co
 complete -o default -F _branch_file_completer checkout
 complete -o default -F _env_file_completer test
 complete -F _branch_file_completer push
+complete -F _product_completer up
 
 complete -o default log
 complete -o default di
@@ -202,8 +196,8 @@ commands =
 basepython = python3.6
 envdir = {homedir}/.virtualenvs/{name}
 commands =
-    pytest {env:PYTESTARGS:} --cov . --cov-report=xml --cov-report=html --cov-report=term --cov-report=annotate:textcov \\
-                             --cov-fail-under=80
+    pytest {env:PYTESTARGS:} --cov . --cov-context=test --cov-report=xml --cov-report=html --cov-report=term \\
+                             --cov-report=annotate:textcov --cov-fail-under=80
 
 [flake8]
 exclude = .git,.tox,.eggs,__pycache__,docs,build,dist
@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+import logging
+import os
+import shlex
+import signal
+import sys
+
+from workspace.commands import AbstractCommand
+from workspace.commands.complete import completions
+from workspace.config import config
+from workspace.utils import cache_path
+
+log = logging.getLogger(__name__)
+
+EXIT_COMMANDS = ('exit', 'quit')
+HISTORY_FILE = 'shell_history'
+HISTORY_LENGTH = 1000
+
+
+class Shell(AbstractCommand):
+    """
+      Run wst commands interactively in one process, which keeps imported modules, config and repo state (such as
+      branches and remotes) warm between commands so they start instantly.
+
+      Enter commands without "wst", such as "st" or "ci Fix bug". Use "cd" to change dir and "exit" or Ctrl-D to quit.
+      Config is reloaded when it changes, and repo state is refreshed when the repo's refs or config change.
+    """
+
+    def run(self):
+        self.setup_readline()
+
+        while True:
+            try:
+                line = input('wst {}> '.format(os.path.basename(os.getcwd())))
+            except EOFError:
+                print()
+                break
+            except KeyboardInterrupt:
+                print()
+                continue
+
+            try:
+                args = shlex.split(line)
+            except ValueError as e:
+                log.error(e)
+                continue
+
+            if not args:
+                continue
+
+            if args[0] in EXIT_COMMANDS:
+                break
+
+            if args[0] == 'cd':
+                self.change_dir(args[1] if len(args) > 1 else '~')
+
+            elif args[0] == self.name():
+                log.error('Already in wst shell')
+
+            else:
+                self.run_command(args)
+
+        self.save_history()
+
+    def run_command(self, args):
+        """ Run the wst command for the given args, e.g. ['status'] """
+        config.reload_if_changed()
+
+        argv = sys.argv
+        cwd = os.getcwd()
+        sigint_handler = signal.getsignal(signal.SIGINT)
+        sys.argv = [argv[0]] + (['--debug'] if self.debug else []) + args
+
+        try:
+            type(self.commander)().run()
+        except SystemExit:
+            pass
+        except KeyboardInterrupt:
+            print()
+        except Exception as e:
+            log.error(e)
+        finally:
+            sys.argv = argv
+            signal.signal(signal.SIGINT, sigint_handler)
+            if os.path.isdir(cwd):
+                os.chdir(cwd)
+
+    def change_dir(self, path):
+        try:
+            os.chdir(os.path.expanduser(path))
+        except OSError as e:
+            log.error(e)
+
+    def setup_readline(self):
+        try:
+            import readline
+        except ImportError:
+            return
+
+        try:
+            readline.read_history_file(cache_path(HISTORY_FILE))
+        except (IOError, OSError):
+            pass
+
+        readline.set_history_length(HISTORY_LENGTH)
+        readline.set_completer_delims(' \t\n')
+        readline.set_completer(self.complete)
+        readline.parse_and_bind('tab: complete')
+
+    def save_history(self):
+        try:
+            import readline
+            os.makedirs(os.path.dirname(cache_path(HISTORY_FILE)), exist_ok=True)
+            readline.write_history_file(cache_path(HISTORY_FILE))
+        except Exception as e:
+            log.debug('Could not save history: %s', e)
+
+    def complete(self, text, state):
+        """ Readline completer for command names / aliases as the first word and branches for the rest """
+        import readline
+
+        if readline.get_line_buffer()[:readline.get_begidx()].strip():
+            candidates = completions('branches')
+        else:
+            info = self.commander.commands_info()
+            candidates = sorted([n for n in info if not n.startswith('_')] + [i['alias'] for i in info.values() if i['alias']]
+                                + list(EXIT_COMMANDS) + ['cd'])
+
+        matches = [c for c in candidates if c.startswith(text)]
+        return matches[state] if state < len(matches) else None
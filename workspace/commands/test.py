@@ -1,12 +1,15 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import argparse
+from datetime import datetime
 import logging
 import os
-import pkg_resources
 import re
+import shlex
+import shutil
 import sys
 import tempfile
+from time import time
 
 import click
 import json
@@ -14,16 +17,42 @@ from utils_core.process import run
 
 from workspace.commands import AbstractCommand
 from workspace.commands.helpers import expand_product_groups, ToxIni
+from workspace.affected import (affected_tests, changed_files, importing_tests, is_test_file, module_name, use_contexts,
+                                uses_contexts)
 from workspace.config import config
-from workspace.scm import (product_name, repo_path, product_repos, product_path, repos,
+from workspace.deps import workspace_graph
+from workspace.envs import (dedupe_envs, env_variables, has_snapshot, incremental_changes, install_command,
+                            installed_distributions, outdated_parts, restore_snapshot, save_fingerprint, save_snapshot,
+                            snapshot_dir)
+from workspace.results import (cached_result, has_failures, junit_results, junit_summary, record_failures,
+                               restore_failures, result_key, save_result)
+from workspace.scm import (product_name, repo_path, product_repos, product_path,
                            workspace_path, current_branch, project_path)
-from workspace.utils import log_exception, parallel_call
+from workspace.utils import cpu_tokens, file_tail, load_cache, log_exception, parallel_call, run_to_file, save_cache
+from workspace.wheelhouse import build_wheels, mark_used, pip_environ, wheelhouse_path
 
 log = logging.getLogger(__name__)
 
-TEST_RE = re.compile(r'\d+ (?:passed|error|failed|xfailed).* in [\d\.]+ seconds')
+TEST_RE = re.compile(r'\d+ (?:passed|error|failed|xfailed).* in [\d\.]+ ?s(?:econds)?')
 BUILD_RE = re.compile('BUILD SUCCESSFUL')
 
+#: Dir in the cache dir for recent test durations of each product, which are used to schedule the longest first
+DURATIONS_DIR = 'test-durations'
+DURATIONS_VERSION = 1
+
+#: Number of products to test in parallel, such as dependents with -t
+TEST_WORKERS = 10
+
+#: Output of products that were skipped as tests failed in another product with fail fast
+SKIPPED_OUTPUT = 'Skipped as tests failed in another product'
+
+#: Number of recent durations kept per product and envs
+DURATIONS_KEPT = 5
+
+#: Max length of affected test node IDs passed to pytest, beyond which their test files are passed instead to keep the
+#: command line well under ARG_MAX
+AFFECTED_ARGS_MAX_LENGTH = 32 * 1024
+
 
 class Test(AbstractCommand):
     """
@@ -39,15 +68,35 @@ class Test(AbstractCommand):
       :param bool test_dependents: Run tests in this product and in checked out products that depends on this product.
                                    This product must be installed as editable in its dependents for the results to be useful.
                                    Most args are ignored when this is used.
+                                   Use -tt to also test products that depend on it transitively.
+      :param int depth: Modifier for -tt. Number of levels of dependents to test, e.g. 2 to test dependents of dependents.
+      :param bool affected: Only run tests affected by changes since the parent branch. Tests are selected using per-test
+                            coverage contexts from the last cover env run, and all tests run when that can not be
+                            determined. Contexts are recorded (with pytest-cov 2.8+) in cover env runs of products
+                            where this has been used, which makes them slower. With -t, only tests in dependents that
+                            import the changed modules are run.
+      :param bool fail_fast: Stop on the first failed test. Tests that failed in the last run of an env (tracked per product
+                             and env) always run first, so this quickly shows if they still fail. With -t, tests of
+                             products that have not started are skipped after a product fails.
+      :param bool no_cache: Run tests even if they passed before for the same code (working tree of the product and its
+                            editable workspace dependencies), env, and test command.
       :param bool redevelop: Redevelop the test environment by installing on top of existing one.
                              This is implied if test environment does not exist, or whenever requirements.txt or
                              pinned.txt is modified after the environment was last updated.
                              Use -ro to do redevelop only without running tests.
-                             Use -rr to remove the test environment first before redevelop (recreate).
+                             Use -rr to remove the test environment first before redevelop (recreate). The environment
+                             is cloned from a snapshot saved after it was last created if nothing it depends on changed.
+                             Use -rrr to recreate with tox regardless.
       :param bool install_only: Modifier for redevelop. Perform install only without running test.
       :param bool match_test: Only run tests with method name that matches pattern
       :param bool return_output: Return test output instead of printing to stdout
+      :param str output_file: Modifier for return_output. Write the output to this file as it is produced and only
+                              return its tail, so memory use does not grow with the output. False is returned when
+                              the command fails, and the output is only in the file.
       :param str num_processes: Number of processes to use when running tests in parallel
+      :param int workers: Number of xdist workers to run pytest with (-n) in envs with pytest-xdist when num_processes is
+                          not given, such as from the CPU budget when testing dependents. Unlike num_processes, this
+                          does not change which envs are tested.
       :param list tox_cmd: Alternative tox command to run.
                            If env is passed in (from env_or_file), '-e env' will be appended as well.
       :param str tox_ini: Path to tox_ini file.
@@ -58,6 +107,8 @@ class Test(AbstractCommand):
       :param bool debug: Turn on debug logging
       :param list install_editable: List of products or product groups to install in editable mode.
       :param list extra_args: Extra args from argparse to be passed to pytest
+      :param str junit_xml: Path for pytest to write JUnit XML results to, which are used to summarize the results
+                            instead of the output.
       :return: Dict of env to commands ran on success. If return_output is True, return a string output.
                If test_dependents is True, return a mapping of product name to the mentioned results.
     """
@@ -76,7 +127,11 @@ class Test(AbstractCommand):
           cls.make_args('-n', metavar='NUM_PROCESSES', type=int, dest='num_processes', help=docs['num_processes']),
           cls.make_args('-d', '--show-dependencies', metavar='FILTER', action='store', nargs='?', help=docs['show_dependencies'],
                         const=True),
-          cls.make_args('-t', '--test-dependents', action='store_true', help=docs['test_dependents']),
+          cls.make_args('-t', '--test-dependents', action='count', help=docs['test_dependents']),
+          cls.make_args('--depth', type=int, help=docs['depth']),
+          cls.make_args('--affected', action='store_true', help=docs['affected']),
+          cls.make_args('--no-cache', action='store_true', help=docs['no_cache']),
+          cls.make_args('-x', '--fail-fast', action='store_true', help=docs['fail_fast']),
           cls.make_args('-r', '--redevelop', action='count', help=docs['redevelop']),
           cls.make_args('-o', action='store_true', dest='install_only', help=argparse.SUPPRESS),
           cls.make_args('-e', '--install-editable', nargs='+', help=docs['install_editable']),
@@ -87,7 +142,7 @@ class Test(AbstractCommand):
         try:
             if not repo:
                 repo = project_path()
-            tox = ToxIni(repo)
+            tox = ToxIni.load(repo)
             return 'testenv:style' in tox
 
         except Exception as e:
@@ -101,6 +156,8 @@ class Test(AbstractCommand):
           Summarize the test results
 
           :param dict|str tests: Map of product name to test result, or the test result of the current prod.
+                                 A test result is the output, or results from :func:`junit_results` (preferred as
+                                 they do not depend on the output format).
           :param bool include_no_tests: Include "No tests" results when there are no tests found.
           :return: A tuple of (success, list(summaries)) where success is True if all tests pass and summaries
                    is a list of passed/failed summary of each test or just str if 'tests' param is str.
@@ -130,6 +187,12 @@ class Test(AbstractCommand):
             elif product_tests[name] is True:
                 append_summary('Test successful / No output', name)
 
+            elif isinstance(product_tests[name], dict):
+                results = product_tests[name]
+                append_summary(junit_summary(results), name)
+                if results['failed'] or results['errors']:
+                    success = False
+
             elif 'collected 0 items' in product_tests[name] and 'error' not in product_tests[name]:
                 append_summary('No tests')
 
@@ -144,15 +207,17 @@ class Test(AbstractCommand):
                 else:
                     append_summary('No test summary found in output', name)
 
-                summary_lines = [line for line in product_tests[name].replace('xfailed', '').split('\n')
+                # Only the last summary line is checked as the output may be the tail of the full output
+                summary_lines = [line for line in product_tests[name].split('\n')
                                  if line.startswith('===') and 'warnings summary' not in line]
-                if not len(summary_lines) == 2 or 'failed' in summary_lines[-1] or 'error' in summary_lines[-1]:
+                last_line = summary_lines[-1] if summary_lines else ''
+                if not TEST_RE.search(last_line) or 'failed' in last_line.replace('xfailed', '') or 'error' in last_line:
                     success = False
 
         return success, summaries if isinstance(tests, dict) else summaries[0]
 
     def run(self):
-        if self.test_dependents:
+        if self.test_dependents or self.depth:
             name = product_name()
 
             # Convert None to list for tuple([])
@@ -167,31 +232,79 @@ class Test(AbstractCommand):
               ('num_processes', self.num_processes),
               ('silent', True),
               ('debug', self.debug),
-              ('extra_args', tuple(self.extra_args))
+              ('extra_args', tuple(self.extra_args)),
+              ('fail_fast', self.fail_fast)
             )
 
-            test_repos = [repo_path()]
-            test_repos.extend(r for r in repos(workspace_path()) if self.product_depends_on(r, name) and r not in test_repos)
-            test_args = [(r, test_args, self.__class__) for r in test_repos]
+            depth = self.depth or (None if self.test_dependents and self.test_dependents > 1 else 1)
+            dependents = workspace_graph(workspace_path()).dependents(name, depth)
+
+            # Current product starts first, then dependents with failed tests in their last run so failures show up
+            # early, and then the longest expected duration first so they don't dominate wall time by starting last.
+            # Products without history are assumed to be long.
+            env_key = durations_key(self.env_or_file)
+            dependents = sorted((d for level in dependents for d in level),
+                                key=lambda d: (not has_failures(d), -expected_duration(d, env_key, default=float('inf'))))
+            test_repos = [repo_path()] + [product_path(d) for d in dependents]
+            repo_test_args = dict((r, test_args) for r in test_repos)
+
+            if self.affected:
+                repo_test_args[repo_path()] = test_args + (('affected', True),)
+                modules = [module_name(f) for f in changed_files(repo_path()) if f.endswith('.py') and not is_test_file(f)]
+
+                for repo in test_repos[1:]:
+                    tests = importing_tests(repo, modules)
+                    if tests:
+                        # Envs are given explicitly to test the same envs as without --affected, as test files
+                        # would otherwise replace cover and drop style from the default envs.
+                        envs = tuple(self.env_or_file) or tuple(ToxIni.load(repo).envlist)
+                        env_or_file = envs + tuple(os.path.join(repo, t) for t in tests)
+                        repo_test_args[repo] = tuple(dict(test_args, env_or_file=env_or_file).items())
+                    else:
+                        log.debug('Skipping %s as none of its tests import the changed modules', product_name(repo))
+                        del repo_test_args[repo]
+
+                test_repos = [r for r in test_repos if r in repo_test_args]
+
+            run_dir = tempfile.mkdtemp()
+
+            # Share the CPU budget between products running in parallel for their xdist workers unless -n is given.
+            # Each product gets its part of the tokens that are free when it starts, so products that start after
+            # others finished use the CPUs they freed up.
+            pending_dir = None
+            if self.num_processes is None:
+                pending_dir = os.path.join(run_dir, 'pending')
+                os.mkdir(pending_dir)
+                for repo in test_repos:
+                    open(os.path.join(pending_dir, product_name(repo)), 'w').close()
+
+            # Products that have not started are skipped once this file exists with fail fast
+            stop_file = os.path.join(run_dir, 'stop') if self.fail_fast else None
+            test_args = [(r, repo_test_args[r], self.__class__, pending_dir, stop_file) for r in test_repos]
 
             def test_done(result):
-                name, output = result
-                success, summary = self.summarize(output)
+                name, output, results, _ = result
+                success, summary = self._summarize_repo(result)
 
-                if success:
+                if output == SKIPPED_OUTPUT:
+                    click.echo('{}: {}'.format(name, output))
+
+                elif success:
                     click.echo('{}: {}'.format(name, summary))
 
+                    if os.path.exists(output_path(name)):
+                        os.remove(output_path(name))
+
                 else:
-                    temp_output_file = os.path.join(tempfile.gettempdir(), 'test-%s.out' % name)
-                    with open(temp_output_file, 'w') as fp:
-                        fp.write(output)
-                    temp_output_file = 'See ' + temp_output_file
+                    failures = ['Failed: ' + f for f in (results or {}).get('failures', [])]
+                    log.error('%s: %s', name, '\n\t'.join([summary] + failures + ['See ' + output_path(name)]))
 
-                    log.error('%s: %s', name, '\n\t'.join([summary, temp_output_file]))
+                    if stop_file:
+                        open(stop_file, 'w').close()
 
             def show_remaining(completed, all_args):
-                completed_repos = set(product_name(r) for r, _, _ in completed)
-                all_repos = set(product_name(r) for r, _, _ in all_args)
+                completed_repos = set(product_name(args[0]) for args in completed)
+                all_repos = set(product_name(args[0]) for args in all_args)
                 remaining_repos = sorted(list(all_repos - completed_repos))
                 if len(remaining_repos):
                     repo = remaining_repos.pop()
@@ -200,16 +313,25 @@ class Test(AbstractCommand):
                 else:
                     return 'None'
 
-            repo_results = parallel_call(test_repo, test_args, callback=test_done, show_progress=show_remaining, progress_title='Remaining')
+            repo_results = parallel_call(test_repo, test_args, callback=test_done, workers=TEST_WORKERS, show_progress=show_remaining,
+                                         progress_title='Remaining')
+
+            shutil.rmtree(run_dir, ignore_errors=True)
 
-            for result in list(repo_results.values()):
-                if isinstance(result, tuple):
-                    _, result = result
-                success, _ = self.summarize(result)
+            repo_outputs = {}
+
+            for args, result in repo_results.items():
+                if not isinstance(result, tuple):  # Error from test_repo
+                    result = (product_name(args[0]), result, None, False)
+                name, output, _, _ = result
+
+                success, _ = self._summarize_repo(result)
                 if not (success or self.return_output):
                     sys.exit(1)
 
-            return dict(list(repo_results.values()))
+                repo_outputs[name] = output
+
+            return repo_outputs
 
         if not self.repo:
             self.repo = project_path()
@@ -231,6 +353,20 @@ class Test(AbstractCommand):
                 else:
                     envs.append(ef)
 
+        if self.affected and not files and not self.redevelop:
+            use_contexts(self.repo)
+            tests = affected_tests(self.repo)
+            if tests == []:
+                click.echo('No tests are affected by changes since the parent branch')
+                return True if self.return_output else {}
+            elif tests:
+                if len(' '.join(tests)) > AFFECTED_ARGS_MAX_LENGTH:
+                    tests = sorted(set(t.split('::')[0] for t in tests))
+                if len(' '.join(tests)) > AFFECTED_ARGS_MAX_LENGTH:
+                    log.info('Running all tests as too many tests are affected')
+                else:
+                    files.extend(os.path.join(self.repo, t) for t in tests)
+
         pytest_args = ''
         if self.match_test or self.num_processes is not None or files or self.extra_args:
             pytest_args = []
@@ -243,11 +379,11 @@ class Test(AbstractCommand):
             if self.extra_args:
                 pytest_args.extend(self.extra_args)
             if files:
-                pytest_args.extend(files)
+                pytest_args.extend(shlex.quote(f) for f in files)  # Node IDs may have spaces / brackets
             pytest_args = ' '.join(pytest_args)
             os.environ['PYTESTARGS'] = pytest_args
 
-        tox = ToxIni(self.repo, self.tox_ini)
+        tox = ToxIni.load(self.repo, self.tox_ini)
 
         if not envs:
             envs = tox.envlist
@@ -283,6 +419,28 @@ class Test(AbstractCommand):
                     print(env + ':')
                 self.install_editable_dependencies(tox, env, editable_products=self.install_editable)
 
+        elif self.redevelop == 2 and not self.tox_cmd and envs and all(has_snapshot(tox, env) for env in envs):
+            for env in envs:
+                if not self.silent or self.debug:
+                    click.echo('{}: Recreating from snapshot in {}'.format(env, snapshot_dir(tox, env)))
+                if not restore_snapshot(tox, env):
+                    log.error('Failed to recreate %s from snapshot. Please run with -rr again to recreate with tox.', env)
+                    sys.exit(1)
+                env_commands[env] = 'restore snapshot'
+
+            if self.install_only:
+                return True if self.return_output else env_commands
+
+            # Test the recreated envs with the same options, but without cached results as the restored envs have
+            # the same fingerprint as before.
+            return self.commander.run('test', env_or_file=self.env_or_file, repo=self.repo, tox_cmd=self.tox_cmd,
+                                      tox_ini=self.tox_ini, tox_commands=self.tox_commands, match_test=self.match_test,
+                                      num_processes=self.num_processes, silent=self.silent,
+                                      debug=self.debug, extra_args=self.extra_args,
+                                      return_output=self.return_output, junit_xml=self.junit_xml,
+                                      output_file=self.output_file, workers=self.workers, fail_fast=self.fail_fast,
+                                      affected=self.affected, no_cache=True)
+
         elif self.redevelop:
             if self.tox_cmd:
                 cmd = self.tox_cmd
@@ -298,8 +456,17 @@ class Test(AbstractCommand):
             if self.install_only:
                 cmd.append('--notest')
 
-            output = run(cmd, cwd=self.repo, raises=not self.return_output, silent=self.silent,
-                         return_output=self.return_output, env=environ)
+            if config.test.wheelhouse:
+                environ.update(pip_environ(tox, envs))
+
+            created_envs = [env for env in envs if self.redevelop > 1 or not os.path.exists(tox.envdir(env))]
+
+            if self.return_output and self.output_file:
+                output, success = run_to_file(cmd, self.output_file, cwd=self.repo, env=environ)
+                output = success and (output or True)
+            else:
+                output = run(cmd, cwd=self.repo, raises=not self.return_output, silent=self.silent,
+                             return_output=self.return_output, env=environ)
 
             if not output:
                 if self.return_output:
@@ -310,13 +477,7 @@ class Test(AbstractCommand):
             for env in envs:
                 env_commands[env] = ' '.join(cmd)
 
-                # Touch envdir
-                envdir = tox.envdir(env)
-                if os.path.exists(envdir):
-                    os.utime(envdir, None)
-
-                # Strip entry version
-                self._strip_version_from_entry_scripts(tox, env)
+                self._developed(tox, env, created=env in created_envs)
 
             if self.return_output:
                 return output
@@ -325,26 +486,35 @@ class Test(AbstractCommand):
             for env in envs:
                 envdir = tox.envdir(env)
 
-                def requirements_updated():
-                    req_mtime = 0
-                    requirements_files = ['requirements.txt', 'pinned.txt', 'tox.ini']
-                    for req_file in requirements_files:
-                        req_path = os.path.join(self.repo, req_file)
-                        if os.path.exists(req_path):
-                            req_mtime = max(req_mtime, os.stat(req_path).st_mtime)
-                    return req_mtime > os.stat(envdir).st_mtime
-
-                if not os.path.exists(envdir) or requirements_updated():
-                    env_commands.update(
-                        self.commander.run('test', env_or_file=[env], repo=self.repo, redevelop=True, tox_cmd=self.tox_cmd,
-                                           tox_ini=self.tox_ini, tox_commands=self.tox_commands, match_test=self.match_test,
-                                           num_processes=self.num_processes, silent=self.silent,
-                                           debug=self.debug, extra_args=self.extra_args))
+                parts = outdated_parts(tox, env)
+
+                if parts and not self.update_env(tox, env, parts):
+                    result = self.commander.run('test', env_or_file=[env], repo=self.repo, redevelop=True, tox_cmd=self.tox_cmd,
+                                                tox_ini=self.tox_ini, tox_commands=self.tox_commands, match_test=self.match_test,
+                                                num_processes=self.num_processes, silent=self.silent,
+                                                debug=self.debug, extra_args=self.extra_args,
+                                                return_output=self.return_output, junit_xml=self.junit_xml,
+                                                output_file=self.output_file, workers=self.workers)
+                    if self.return_output:
+                        return result
+                    env_commands.update(result)
                     continue
 
                 commands = self.tox_commands.get(env) or tox.commands(env)
                 env_commands[env] = '\n'.join(commands)
 
+                key = None
+                if config.test.cache_results and not self.no_cache:
+                    key = result_key(self.repo, envdir, '\n'.join(commands + [pytest_args]))
+                    result = cached_result(key)
+                    if result:
+                        if not self.silent:
+                            click.secho('{}: OK (passed for the same code and env at {}, use --no-cache to run again)'.format(
+                                env, datetime.fromtimestamp(result['time']).strftime('%H:%M:%S')), fg='green')
+                        if self.return_output:
+                            return result['output'] or True
+                        continue
+
                 for command in commands:
                     full_command = os.path.join(envdir, 'bin', command)
 
@@ -355,9 +525,36 @@ class Test(AbstractCommand):
                                 full_command = full_command.replace('{env:PYTESTARGS:}', pytest_args)
                             else:
                                 full_command += ' ' + pytest_args
+                            if ('--cov' in full_command and '--cov-context' not in full_command and uses_contexts(self.repo)
+                                    and supports_cov_context(envdir)):
+                                full_command += ' --cov-context=test'  # For --affected
+                            if (self.workers is not None and self.num_processes is None
+                                    and 'pytest-xdist' in installed_distributions(envdir)):
+                                full_command += ' -n ' + str(self.workers)
+                            if self.fail_fast:
+                                full_command += ' -x'
+                            if self.junit_xml and '--junitxml' not in full_command and '--junit-xml' not in full_command:
+                                full_command += ' --junitxml=' + self.junit_xml
+                            restore_time = time()
+                            if restore_failures(self.repo, env):
+                                full_command += ' --ff'
+                        else:
+                            restore_time = None
+
                         activate = '. ' + os.path.join(envdir, 'bin', 'activate')
-                        output = run(activate + '; ' + full_command, shell=True, cwd=self.repo, raises=False, silent=self.silent,
-                                     return_output=self.return_output, env=environ)
+                        if self.return_output and self.output_file:
+                            output, success = run_to_file(activate + '; ' + full_command, self.output_file, shell=True,
+                                                          cwd=self.repo, env=environ)
+                            output = success and (output or True)  # Output is in output_file on failure
+                        elif self.return_output:
+                            output, success = run(activate + '; ' + full_command, shell=True, cwd=self.repo, raises=False,
+                                                  silent=self.silent, return_output=2, env=environ)
+                        else:
+                            output = success = run(activate + '; ' + full_command, shell=True, cwd=self.repo, raises=False,
+                                                   silent=self.silent, env=environ)
+                        if restore_time:
+                            record_failures(self.repo, env, restore_time)
+
                         if not output:
                             if self.return_output:
                                 return False
@@ -368,6 +565,8 @@ class Test(AbstractCommand):
                             click.secho(f'{env}: OK', fg='green')
 
                         if self.return_output:
+                            if success:
+                                save_result(key, output)
                             return output
                     else:
                         log.error('%s does not exist', command_path)
@@ -376,8 +575,87 @@ class Test(AbstractCommand):
                         else:
                             sys.exit(1)
 
+                save_result(key)
+
         return env_commands
 
+    def _summarize_repo(self, result):
+        """ Tuple of (success, summary) for the result from :func:`test_repo` """
+        name, output, results, exited_ok = result
+        success, (summary,) = self.summarize({name: results or output})
+
+        if success and not exited_ok:  # Such as --cov-fail-under or an error after the tests
+            return False, summary + ' (but the test command failed)'
+
+        return success, summary
+
+    def update_env(self, tox, env, parts):
+        """
+        Update the env with one pip call that installs only the changed requirements (and removes dropped ones).
+
+        :param ToxIni tox: Tox config for the product
+        :param str env: Name of the tox env
+        :param list parts: Outdated parts of the env's fingerprint
+        :return: True if updated, or False if a full redevelop is needed
+        """
+        changes = incremental_changes(tox, env, parts)
+        if changes is None:
+            return False
+
+        install, uninstall = changes
+
+        if install and config.test.wheelhouse:
+            install = ['--find-links', wheelhouse_path()] + install
+
+        # Install the same way as tox, so the index and constraints from its config are used
+        variables = env_variables(tox, env)
+        install_cmd = install_command(tox, env, install)
+        if variables is None or install_cmd is None:
+            log.debug('Redeveloping %s as its install command or setenv can not be used outside of tox', env)
+            return False
+
+        environ = dict(os.environ, **variables)
+
+        if not self.silent or self.debug:
+            click.echo('{}: Updating {} (install: {}, uninstall: {})'.format(
+                env, ' and '.join(parts), ' '.join(install) or '-', ' '.join(uninstall) or '-'))
+
+        uninstall_cmd = [tox.bindir(env, 'python'), '-m', 'pip', 'uninstall', '-y'] + uninstall
+        if uninstall and not run(uninstall_cmd, cwd=self.repo, raises=False, silent=not self.debug, env=environ):
+            return False
+
+        if install and not run(install_cmd, cwd=self.repo, raises=False, silent=not self.debug, env=environ):
+            return False
+
+        self._developed(tox, env)
+
+        return True
+
+    def _developed(self, tox, env, created=False):
+        """
+        Finish up after the env was developed
+
+        :param ToxIni tox: Tox config for the product
+        :param str env: Name of the tox env
+        :param bool created: The env was created from scratch by tox, so a snapshot is saved for -rr.
+        """
+        save_fingerprint(tox, env)
+
+        # Strip entry version
+        self._strip_version_from_entry_scripts(tox, env)
+
+        if config.clean.dedupe_envs_after_develop:
+            with log_exception('Failed to dedupe files in {}'.format(tox.envdir(env))):
+                dedupe_envs([tox.envdir(env)])
+
+        if config.test.wheelhouse:
+            with log_exception('Failed to build wheels for {} into the wheelhouse'.format(env)):
+                if build_wheels(tox, env, silent=not self.debug):
+                    mark_used(tox.envdir(env))
+
+        if created and config.test.env_snapshots and not has_snapshot(tox, env):
+            save_snapshot(tox, env)
+
     def _strip_version_from_entry_scripts(self, tox, env):
         """ Strip out version spec "==1.2.3" from entry scripts as they require re-develop when version is changed in develop mode. """
         name = product_name(tox.path)
@@ -523,25 +801,112 @@ else:
                     lib_path = os.path.join(lib_path, lib)
                 run([pip, 'install', '--editable', lib_path], silent=not self.debug)
 
-    def product_depends_on(self, path, name):
-        for req_file in config.bump.requirement_files.split():
-            req_path = os.path.join(path, req_file)
-            if os.path.exists(req_path):
-                with open(req_path) as fp:
-                    try:
-                        reqs = pkg_resources.parse_requirements(fp.read())
-                        if name in [r.project_name for r in reqs]:
-                            return True
-                    except Exception:
-                        pass
-        return False
-
 
-def test_repo(repo, test_args, test_class):
+def test_repo(repo, test_args, test_class, pending_dir=None, stop_file=None):
+    """
+    Test the repo with the test class and args. The full output is written to :func:`output_path` for the product.
+
+    :param str pending_dir: Dir with a file named after each product that has not started yet. When given, CPU tokens
+                            from :func:`cpu_budget` are used for xdist workers, where the tokens that are free are
+                            shared with the products that start at the same time. Repos without xdist use one token.
+                            Defaults to not using the budget.
+    :param str stop_file: Skip testing if this file exists, such as when tests failed in another repo with fail fast.
+    :return: Tuple of (product name, tail of the test output, results from :func:`junit_results` or None if pytest did
+             not write any, True if the test commands exited with 0)
+    """
     name = product_name(repo)
 
+    if stop_file and os.path.exists(stop_file):
+        if pending_dir:
+            os.remove(os.path.join(pending_dir, name))
+        return name, SKIPPED_OUTPUT, None, False
+
     branch = current_branch(repo)
     on_branch = '#' + branch if branch != 'master' and branch is not None else ''
     click.echo('Testing {} {}'.format(name, on_branch))
 
-    return name, test_class(repo=repo, **dict(test_args)).run()
+    from workspace.controller import Commander  # Commander isn't picklable, so create one for redevelop if needed.
+
+    junit_dir = tempfile.mkdtemp()
+    test_args = dict(test_args, junit_xml=os.path.join(junit_dir, 'junit.xml'), output_file=output_path(name))
+    open(test_args['output_file'], 'w').close()
+    start_time = time()
+
+    try:
+        if pending_dir:
+            # Runs without xdist use one CPU. Products that have not started could start now when workers are free.
+            starting = min(len(os.listdir(pending_dir)), TEST_WORKERS)
+            with cpu_tokens(cpu_budget() if uses_xdist(repo) else 1, cpu_budget(), share=starting) as tokens:
+                os.remove(os.path.join(pending_dir, name))
+                test_args['workers'] = tokens if tokens > 1 else 0  # 0 runs in process without xdist overhead
+                output = test_class(repo=repo, commander=Commander(), **test_args).run()
+        else:
+            output = test_class(repo=repo, commander=Commander(), **test_args).run()
+
+        results = junit_results(test_args['junit_xml']) if os.path.exists(test_args['junit_xml']) else None
+
+    finally:
+        shutil.rmtree(junit_dir, ignore_errors=True)
+
+    record_duration(name, durations_key(test_args.get('env_or_file')), time() - start_time)
+
+    success = output is not False
+    if not success:
+        output = file_tail(test_args['output_file']) or False
+
+    return name, output, results, success
+
+
+def output_path(name):
+    """ Path of the file with the test output of the product when testing dependents """
+    return os.path.join(tempfile.gettempdir(), 'test-%s.out' % name)
+
+
+def supports_cov_context(envdir):
+    """ Check if pytest-cov installed in the env supports --cov-context (2.8+) """
+    version = installed_distributions(envdir).get('pytest-cov', '')
+    try:
+        return tuple(int(v) for v in version.split('.')[:2]) >= (2, 8)
+    except ValueError:
+        return False
+
+
+def cpu_budget():
+    """ Number of CPUs shared by tests of products that run in parallel """
+    return config.test.cpu_budget or os.cpu_count() or 1
+
+
+def uses_xdist(repo):
+    """ Check if pytest-xdist is installed in any env of the repo, so pytest accepts -n """
+    try:
+        tox = ToxIni.load(repo)
+        return any('pytest-xdist' in installed_distributions(tox.envdir(env)) for env in tox.envlist)
+    except Exception as e:
+        log.debug('Could not check if %s uses pytest-xdist: %s', repo, e)
+        return False
+
+
+def durations_key(env_or_file):
+    """ Key for the test durations of the given envs / files """
+    return ','.join(sorted(env_or_file or [])) or 'default'
+
+
+def expected_duration(name, key, default=None):
+    """
+    Expected test duration of the product based on its recent durations recorded by :func:`record_duration`.
+
+    :param str name: Product name
+    :param str key: Key from :func:`durations_key`
+    :param default: Value to return if there are no recorded durations
+    :return: Average of recent durations in seconds or default
+    """
+    durations = (load_cache(os.path.join(DURATIONS_DIR, name + '.json'), DURATIONS_VERSION) or {}).get(key)
+    return sum(durations) / len(durations) if durations else default
+
+
+def record_duration(name, key, duration):
+    """ Record the test duration (in seconds) of the product. Each product has its own file for parallel runs. """
+    cache_name = os.path.join(DURATIONS_DIR, name + '.json')
+    durations = load_cache(cache_name, DURATIONS_VERSION) or {}
+    durations[key] = (durations.get(key, []) + [round(duration, 3)])[-DURATIONS_KEPT:]
+    save_cache(cache_name, DURATIONS_VERSION, durations)
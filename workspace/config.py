@@ -49,6 +49,16 @@
   # Remove all products except for these ones (product or group)
   remove_all_products_except =
 
+  # Hard link identical files in a test environment to files in other environments after it is developed
+  # (see wst clean --dedupe-envs). Linked files are shared, so a file modified in place changes in all environments.
+  dedupe_envs_after_develop = false
+
+  # Remove wheels in the wheelhouse that have not been used by any test environment for given days
+  remove_wheels_unused_for_days = 30
+
+  # Remove cached results of tests that passed more than given days ago (see wst test --no-cache)
+  remove_test_results_older_than_days = 7
+
   ###########################################################################################################
   # Settings for commit command
   ###########################################################################################################
@@ -62,6 +72,33 @@
   commit_branch_indicator = @
 
 
+  ###########################################################################################################
+  # Settings for test command
+  ###########################################################################################################
+  [test]
+
+  # Build wheels that are missing from a wheelhouse shared by all products for what is installed in a test environment
+  # after it is developed, and install from it when developing test environments.
+  wheelhouse = true
+
+  # Install only from the wheelhouse without checking the index for new releases of unpinned requirements when it has
+  # wheels for all requirements of a test environment. The index is skipped regardless when all requirements are pinned.
+  wheelhouse_offline = false
+
+  # Save a copy of a test environment in the cache dir after it is created by tox, so recreating it with the same
+  # requirements (wst test -rr) clones the copy instead of running tox. The copy uses as much disk space as the
+  # environment unless the file system supports reflinks (e.g. Btrfs or XFS on Linux).
+  env_snapshots = true
+
+  # Number of CPUs shared by tests of products that run in parallel (such as dependents with -t), where each product
+  # gets a share of the CPUs that are free when it starts for pytest-xdist workers (-n) when it does not specify -n.
+  # Defaults to number of CPUs.
+  cpu_budget =
+
+  # Skip running tests that passed before for the same code, test environment and test command (see wst test --no-cache)
+  cache_results = true
+
+
   ###########################################################################################################
   # Settings for merge command
   ###########################################################################################################
@@ -72,20 +109,181 @@
 """
 from __future__ import absolute_import
 
+import hashlib
 import logging
 import os
+import subprocess
+import sys
+from time import time
+
+from configparser import ConfigParser
+from io import IOBase
+
+from localconfig import LocalConfig
 
-from remoteconfig import RemoteConfig
+from workspace.utils import file_signature, load_cache, save_cache
 
 
 CONFIG_FILE = 'workspace.cfg'
 USER_CONFIG_FILE = os.path.join('~', '.config', CONFIG_FILE)
 
+#: Timeout in seconds to download a URL config source
+URL_TIMEOUT = 5
+
 log = logging.getLogger()
-config = RemoteConfig(USER_CONFIG_FILE, cache_duration=60)
+
+
+class WorkspaceConfig(LocalConfig):
+    """
+      :class:`localconfig.LocalConfig` that can also read URL (http/https) sources from a local snapshot.
+
+      The snapshot is used immediately and refreshed in a background process once it is older than the refresh interval,
+      so the network is only on the critical path the first time a URL is read.
+    """
+
+    def __init__(self, last_source=None, cache_duration=None, **localconfig_kwargs):
+        """
+          :param file/str last_source: Last config source, file or URL. This source is only read when an attempt to read a
+                                       config value is made (delayed reading, hence "last") if it exists.
+          :param int cache_duration: Refresh the snapshot of URL sources in the background when it is older than the given
+                                     duration (seconds). Defaults to always.
+          :param dict localconfig_kwargs: Additional keyword args to be passed to :meth:`LocalConfig.__init__`
+        """
+        self._cache_duration = cache_duration
+
+        #: All sources read so far to re-read them on :meth:`reload_if_changed`
+        self._all_sources = []
+
+        #: Signature of the last source when it was read
+        self._last_source_signature = None
+
+        super(WorkspaceConfig, self).__init__(last_source, **localconfig_kwargs)
+
+    def read(self, sources, cache_duration=None):
+        """
+          Queues the config sources to be read later (when config is accessed), or reads immediately if config has already been
+          accessed.
+
+          :param file/str/list sources: Config source URL (http/https), source string, file name, or file pointer, or list
+                                        of the other sources. If file source does not exist, it is ignored.
+          :param int cache_duration: Refresh interval for URL sources. This sets the default for all reads now and subsequent reads.
+          :return: True if all sources were successfully read or will be read, otherwise False
+        """
+        if cache_duration is not None:
+            self._cache_duration = cache_duration
+
+        sources = [s.read() if isinstance(s, IOBase) else s for s in (sources if isinstance(sources, list) else [sources])]
+        self._all_sources.extend(sources)
+
+        return super(WorkspaceConfig, self).read(sources)
+
+    def _read_sources(self):
+        if not self._sources_read and self._last_source:
+            self._last_source_signature = file_signature([self._last_source])
+
+        super(WorkspaceConfig, self)._read_sources()
+
+    def reload_if_changed(self):
+        """
+          Re-read all sources if the last source (user config) changed since it was read, such as between commands in a
+          long running process.
+
+          :return: True if config was reloaded
+        """
+        if not self._sources_read or not self._last_source:
+            return False
+
+        signature = file_signature([self._last_source])
+        if signature is not None and signature == self._last_source_signature:
+            return False
+
+        self._parser = ConfigParser(interpolation=None)
+        self._comments = {}
+        self._dot_keys = {}
+        self._value_cache = {}
+        self._sources = list(self._all_sources)
+        self._sources_read = False
+
+        return True
+
+    def _read(self, source):
+        if isinstance(source, str) and (source.startswith('http://') or source.startswith('https://')):
+            source = url_snapshot(source, refresh_after=self._cache_duration)
+
+        return super(WorkspaceConfig, self)._read(source)
+
+
+def _snapshot_name(url):
+    return os.path.join('config', hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def url_snapshot(url, refresh_after=None):
+    """
+      Content of the URL from its local snapshot. The snapshot is refreshed in a background process when it is older than
+      refresh_after seconds, or downloaded now if there isn't one yet.
+
+      :param str url: URL to get content for
+      :param int refresh_after: Seconds after the last check to refresh the snapshot
+      :return: Content of the URL
+    """
+    snapshot = load_cache(_snapshot_name(url), url)
+
+    if not snapshot:
+        return refresh_url_snapshot(url)['content']
+
+    if not refresh_after or time() - snapshot['checked'] > refresh_after:
+        snapshot['checked'] = time()  # So other runs don't start refreshing until this refresh is done or timed out
+        save_cache(_snapshot_name(url), url, snapshot)
+
+        try:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.Popen([sys.executable, '-m', 'workspace.config', url], stdin=devnull, stdout=devnull,
+                                 stderr=devnull, close_fds=True, start_new_session=True)
+        except Exception as e:
+            log.debug('Could not start background refresh of %s: %s', url, e)
+
+    return snapshot['content']
+
+
+def refresh_url_snapshot(url):
+    """
+      Download the URL to update its snapshot, using its ETag to skip downloading when it hasn't changed.
+
+      :param str url: URL to download
+      :return: The snapshot dict with url, content, etag, and checked time
+    """
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+
+    snapshot = load_cache(_snapshot_name(url), url) or {}
+    headers = {'If-None-Match': snapshot['etag']} if snapshot.get('etag') else {}
+
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=URL_TIMEOUT)
+        snapshot = {'content': response.read().decode('utf-8'), 'etag': response.headers.get('ETag')}
+    except HTTPError as e:
+        if e.code != 304 or 'content' not in snapshot:
+            raise
+    except Exception as e:
+        if 'content' not in snapshot:
+            raise e.__class__('An error occurred when getting content for %s: %s' % (url, e))
+        log.debug('Using previous snapshot of %s as it could not be refreshed: %s', url, e)
+
+    snapshot.update(url=url, checked=time())
+    save_cache(_snapshot_name(url), url, snapshot)
+
+    return snapshot
+
+
+config = WorkspaceConfig(USER_CONFIG_FILE, cache_duration=60)
 config.read(__doc__.replace('\n  ', '\n'))
 
 
 def product_groups():
     """ Returns a dict with product group name mapped to products """
     return dict((group, names.split()) for group, names in config.product_groups)
+
+
+if __name__ == '__main__':  # Used to refresh URL snapshots in the background
+    for url in sys.argv[1:]:
+        refresh_url_snapshot(url)
@@ -1,28 +1,146 @@
 from __future__ import absolute_import
 import argparse
+from collections.abc import MutableMapping
+from importlib import import_module
+from importlib.util import find_spec
 import logging
-from importlib.metadata import version
+import os
 import sys
 import textwrap
 
-from workspace.commands.bump import Bump
-from workspace.commands.checkout import Checkout
-from workspace.commands.clean import Clean
-from workspace.commands.commit import Commit
-from workspace.commands.diff import Diff
-from workspace.commands.log import Log
-from workspace.commands.merge import Merge
-from workspace.commands.publish import Publish
-from workspace.commands.push import Push
-from workspace.commands.update import Update
-from workspace.commands.status import Status
-from workspace.commands.setup import Setup
-from workspace.commands.test import Test
-from workspace.utils import log_exception
+from workspace import trace
+from workspace.commands import AbstractCommand
+from workspace.utils import load_cache, log_exception, save_cache
 
 
 log = logging.getLogger(__name__)
 
+#: Map of command name to "module:Class" of the command. The module is only imported when the command is used.
+#: Commands that start with "__" are hidden from the command listing.
+COMMANDS = {
+    '__complete': 'workspace.commands.complete:Complete',
+    'bump': 'workspace.commands.bump:Bump',
+    'checkout': 'workspace.commands.checkout:Checkout',
+    'clean': 'workspace.commands.clean:Clean',
+    'commit': 'workspace.commands.commit:Commit',
+    'deps': 'workspace.commands.deps:Deps',
+    'diff': 'workspace.commands.diff:Diff',
+    'doctor': 'workspace.commands.doctor:Doctor',
+    'log': 'workspace.commands.log:Log',
+    'merge': 'workspace.commands.merge:Merge',
+    'publish': 'workspace.commands.publish:Publish',
+    'push': 'workspace.commands.push:Push',
+    'setup': 'workspace.commands.setup:Setup',
+    'shell': 'workspace.commands.shell:Shell',
+    'status': 'workspace.commands.status:Status',
+    'test': 'workspace.commands.test:Test',
+    'update': 'workspace.commands.update:Update',
+}
+
+#: Map of alias to command name for commands in :data:`COMMANDS` so they can be found without importing them.
+#: It must match the command's alias attribute.
+COMMAND_ALIASES = {
+    'ci': 'commit',
+    'co': 'checkout',
+    'di': 'diff',
+    'st': 'status',
+    'up': 'update',
+}
+
+#: Types of arguments that can be cached by name in :func:`command_info`
+ARGUMENT_TYPES = {'int': int, 'float': float, 'str': str}
+
+#: Entry point group for commands provided by other packages, which are looked up only when a command is not
+#: found in :data:`COMMANDS`
+COMMAND_ENTRY_POINTS = 'workspace_tools.commands'
+
+
+class LazyCommands(MutableMapping):
+    """
+      Map of command name to command class where a command can be a class or "module:Class" that is imported on
+      first access. Iterating or looking up a missing name also loads commands from :data:`COMMAND_ENTRY_POINTS`.
+    """
+
+    def __init__(self, commands=None, aliases=None):
+        self._commands = dict(commands or {})
+        self._entry_points_loaded = False
+
+        if aliases is None:  # Use the alias attribute of commands that are classes and import others when resolving
+            self._aliases = dict((c.alias, name) for name, c in self._commands.items()
+                                 if not isinstance(c, str) and getattr(c, 'alias', None))
+            self._known = set(name for name, c in self._commands.items() if not isinstance(c, str))
+        else:
+            self._aliases = dict(aliases)
+            self._known = set(self._commands)  # Commands with aliases in self._aliases
+
+    def __getitem__(self, name):
+        if name not in self._commands:
+            self._load_entry_points()
+
+        command = self._commands[name]
+
+        if isinstance(command, str):
+            module, cls = command.split(':')
+            command = self._commands[name] = getattr(import_module(module), cls)
+
+        return command
+
+    def __setitem__(self, name, command):
+        self._commands[name] = command
+        self._known.discard(name)
+
+    def __delitem__(self, name):
+        del self._commands[name]
+        self._known.discard(name)
+
+    def __contains__(self, name):
+        if name not in self._commands:
+            self._load_entry_points()
+        return name in self._commands
+
+    def __iter__(self):
+        self._load_entry_points()
+        return iter(self._commands)
+
+    def __len__(self):
+        self._load_entry_points()
+        return len(self._commands)
+
+    def resolve(self, name_or_alias):
+        """ Name of the command for the given name or alias, or None if there is no such command """
+        if name_or_alias in self._commands:
+            return name_or_alias
+
+        name = self._aliases.get(name_or_alias)
+        if name in self._known:
+            return name
+
+        for name in self:
+            if name == name_or_alias or name not in self._known and getattr(self[name], 'alias', None) == name_or_alias:
+                return name
+
+    def spec(self, name):
+        """ "module:Class" of the command without importing it """
+        command = self._commands[name]
+        return command if isinstance(command, str) else '{}:{}'.format(command.__module__, command.__name__)
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+
+        try:
+            from importlib.metadata import entry_points  # Slow to import, so only when needed
+
+            eps = entry_points()
+            eps = eps.select(group=COMMAND_ENTRY_POINTS) if hasattr(eps, 'select') else eps.get(COMMAND_ENTRY_POINTS, [])
+        except Exception as e:
+            log.debug('Could not load commands from entry points: %s', e)
+            return
+
+        for ep in eps:
+            self._commands.setdefault(ep.name, ep.value)
+
 
 class Commander(object):
     """
@@ -43,11 +161,11 @@ class Commander(object):
     @classmethod
     def commands(cls):
         """
-          Map of command name to command classes.
-          Override commands to replace any command name with another class to customize the command.
+          Map of command name to command classes that are imported on first access.
+          Override commands to replace any command name with another class (or "module:Class") to customize the command.
+          A plain dict of command name to class can also be returned, and aliases then come from the classes.
         """
-        cs = [Bump, Checkout, Clean, Commit, Diff, Log, Merge, Publish, Push, Setup, Status, Test, Update]
-        return dict((c.name(), c) for c in cs)
+        return LazyCommands(COMMANDS, COMMAND_ALIASES)
 
     @classmethod
     def command(cls, name):
@@ -72,17 +190,27 @@ class Commander(object):
             self.parser.print_help()
             sys.exit()
 
-        if args.command not in [c.name() for c in list(self.commands().values()) if 'extra_args' in c.docs()[1]] and extra_args:
+        args.command = self._commands.resolve(args.command)
+
+        if extra_args and not self.command_parser_info(args.command)['extra_args']:
             log.error('Unrecognized arguments: %s', ' '.join(extra_args))
             sys.exit(1)
 
         if args.debug:
             logging.root.setLevel(logging.DEBUG)
 
-        with log_exception(exit=True, stack=args.debug):
-            args_dict = args.__dict__
-            args_dict['extra_args'] = extra_args
-            return self.run(args.command, **args_dict)
+        trace_file = args.__dict__.pop('trace')
+        if trace_file:
+            trace.start()
+
+        try:
+            with log_exception(exit=True, stack=args.debug):
+                args_dict = args.__dict__
+                args_dict['extra_args'] = extra_args
+                return self.run(args.command, **args_dict)
+        finally:
+            if trace_file:
+                trace.stop(trace_file)
 
     def run(self, name=None, **kwargs):
         """
@@ -94,9 +222,12 @@ class Commander(object):
         if not name:
             return self._run()
 
-        if name in self.commands():
+        command = self.command(name)
+
+        if command:
             kwargs['commander'] = self
-            return self.command(name)(**kwargs).run()
+            with trace.phase('wst ' + name):
+                return command(**kwargs).run()
         else:
             log.error('Command "%s" is not registered. Override Commander.commands() to add.', name)
             sys.exit(1)
@@ -111,6 +242,31 @@ class Commander(object):
                                               formatter_class=argparse.RawDescriptionHelpFormatter)
         self.parser.register('action', 'parsers', AliasedSubParsersAction)
 
+        self.parser.add_argument('-v', '--version', action=LazyVersionAction, version=self.version)
+        self.parser.add_argument('--debug', action='store_true', help='Turn on debug mode')
+        self.parser.add_argument('--trace', metavar='FILE',
+                                 help='Record subprocesses and phases of the command, and save them as Chrome trace '
+                                      'JSON to FILE (open in chrome://tracing or ui.perfetto.dev)')
+
+    def _selected_command(self, args):
+        """ Name of the command selected in the given command line args or None if there isn't one """
+        options_with_value = [a for action in self.parser._actions if action.nargs is None and action.option_strings
+                              for a in action.option_strings]
+        args = iter(args)
+
+        for arg in args:
+            if arg in options_with_value:
+                next(args, None)
+            elif arg.startswith('-'):
+                if arg in ('-h', '--help'):
+                    return
+            else:
+                return self._commands.resolve(arg)
+
+    def version(self):
+        """ Version of workspace-tools and the package set in cls.package_name """
+        from importlib.metadata import version  # Slow to import, so only when needed
+
         versions = []
         for pkg in [_f for _f in [getattr(self, 'package_name', None), 'workspace-tools'] if _f]:
             try:
@@ -118,42 +274,192 @@ class Commander(object):
             except Exception:
                 pass
 
-        self.parser.add_argument('-v', '--version', action='version', version='\n'.join(versions))
-        self.parser.add_argument('--debug', action='store_true', help='Turn on debug mode')
+        return '\n'.join(versions)
+
+    def commands_info(self):
+        """
+          Map of command name to info from :func:`command_info` to list commands without importing them.
 
-    def setup_parsers(self):
+          It is cached on disk and refreshed when the version or the source of any command changes.
         """
-          Sets up parsers for all commands
+        commands = _lazy_commands(self.commands())
+        specs = dict((name, commands.spec(name)) for name in commands)
+        key = {'version': self.version(), 'commands': dict((name, [spec, _source_mtime(spec)]) for name, spec in specs.items())}
+        cache_name = 'cli-{}.{}.json'.format(type(self).__module__, type(self).__name__)
+
+        info = load_cache(cache_name, key)
+
+        if info is None:
+            info = dict((name, command_info(commands[name])) for name in commands)
+            save_cache(cache_name, key, info)
+
+        return info
+
+    def command_parser_info(self, name):
+        """
+          Info from :func:`command_info` for the command to set up its parser, which is cached on disk per command and
+          refreshed when the source of the command changes, so the command is not imported or parsed on a cache hit.
+
+          :param str name: Name of the command
+        """
+        spec = self._commands.spec(name)
+        key = {'command': [spec, _source_mtime(spec)], 'base': _source_mtime(AbstractCommand.__module__)}
+        cache_name = os.path.join('cli', '{}.{}'.format(type(self).__module__, type(self).__name__), name + '.json')
+
+        info = load_cache(cache_name, key)
+
+        if info is None:
+            info = command_info(self._commands[name])
+            save_cache(cache_name, key, info)
+
+        return info
+
+    def setup_parsers(self, args=None):
+        """
+          Sets up the parser for the command selected in the given args so only that command is imported. When there
+          isn't one (e.g. for --help), parsers without arguments are set up for all commands from :meth:`commands_info`.
+
+          :param list args: Command line args. Defaults to sys.argv[1:]
         """
 
         self._setup_parser()
+        self._commands = _lazy_commands(self.commands())
 
         self.subparsers = self.parser.add_subparsers(title='sub-commands', help='List of sub-commands', dest='command')
         self.subparsers.remove_parser = lambda *args, **kwargs: _remove_parser(self.subparsers, *args, **kwargs)
 
-        for name, command in sorted(self.commands().items()):
-            doc, _ = command.docs()
-            help = list(filter(None, doc.split('\n')))[0]
-            aliases = [command.alias] if command.alias else None
+        selected = self._selected_command(sys.argv[1:] if args is None else args)
 
-            parser = self.subparsers.add_parser(name, aliases=aliases, description=textwrap.dedent(doc), help=help,
-                                                formatter_class=argparse.RawDescriptionHelpFormatter)
+        if not selected:
+            for name, info in sorted(self.commands_info().items()):
+                if name.startswith('__'):
+                    continue
+                self.subparsers.add_parser(name, aliases=[info['alias']] if info['alias'] else None,
+                                           description=info['description'], help=info['help'],
+                                           formatter_class=argparse.RawDescriptionHelpFormatter)
+            return
 
-            cmd_args = command.arguments()
+        info = self.command_parser_info(selected)
 
-            if isinstance(cmd_args, tuple):
-                normal_args, chain_args = cmd_args
-            else:
-                normal_args = cmd_args
-                chain_args = []
+        parser = self.subparsers.add_parser(selected, aliases=[info['alias']] if info['alias'] else None,
+                                            description=info['description'], help=info['help'],
+                                            formatter_class=argparse.RawDescriptionHelpFormatter)
+
+        if info['parser_arguments'] is None:  # Not cacheable, such as arguments with custom types or actions
+            normal_args, chain_args = _split_arguments(self._commands[selected].arguments())
+        else:
+            normal_args, chain_args = _parser_arguments(info['parser_arguments'])
+
+        for args, kwargs in normal_args:
+            parser.add_argument(*args, **kwargs)
+
+        if chain_args:
+            group = parser.add_argument_group('chaining options')
+            for args, kwargs in chain_args:
+                group.add_argument(*args, **kwargs)
+
+
+def command_info(command, with_arguments=True):
+    """
+      Info about the command that can be cached as JSON
+
+      :param command: Command class
+      :param bool with_arguments: Include info about the command's arguments
+      :return: Dict with help, description, alias, extra_args (if it accepts extra args), arguments (list of dict
+               with options, help, nargs, and choices of each argument), and parser_arguments (normal and chaining
+               arguments for add_argument, or None if they can not be cached as JSON)
+    """
+    doc, params = command.docs()
+    info = {
+        'help': list(filter(None, doc.split('\n')))[0].strip(),
+        'description': textwrap.dedent(doc),
+        'alias': command.alias,
+        'extra_args': 'extra_args' in params,
+    }
+
+    if with_arguments:
+        normal_args, chain_args = _split_arguments(command.arguments())
+        info['arguments'] = [{
+            'options': list(args),
+            'help': kwargs.get('help'),
+            'nargs': kwargs['nargs'] if 'nargs' in kwargs else
+            (0 if kwargs.get('action') in ('store_true', 'store_false', 'count', 'help', 'version') else None),
+            'choices': [str(c) for c in kwargs['choices']] if kwargs.get('choices') else None,
+        } for args, kwargs in normal_args + chain_args]
+        info['parser_arguments'] = _cacheable_arguments(normal_args, chain_args)
+
+    return info
+
+
+def _cacheable_arguments(normal_args, chain_args):
+    """ Arguments as [normal_args, chain_args] that can be cached as JSON, or None if they can not be """
+    types = dict((t, name) for name, t in ARGUMENT_TYPES.items())
+    cacheable = [[], []]
+
+    for arguments, cached in zip((normal_args, chain_args), cacheable):
+        for args, kwargs in arguments:
+            kwargs = dict(kwargs)
+            if 'type' in kwargs:
+                if kwargs['type'] not in types:
+                    return None
+                kwargs['type'] = types[kwargs['type']]
+
+            for value in list(args) + list(kwargs.values()):
+                for v in value if isinstance(value, (list, tuple)) else [value]:
+                    if v is not None and not isinstance(v, (str, int, float, bool)):
+                        return None
+
+            cached.append([list(args), kwargs])
+
+    return cacheable
+
+
+def _parser_arguments(cached_arguments):
+    """ Tuple of (normal_args, chain_args) from :func:`_cacheable_arguments` """
+    parser_arguments = [[], []]
+
+    for arguments, parsed in zip(cached_arguments, parser_arguments):
+        for args, kwargs in arguments:
+            if 'type' in kwargs:
+                kwargs = dict(kwargs, type=ARGUMENT_TYPES[kwargs['type']])
+            parsed.append((tuple(args), kwargs))
+
+    return tuple(parser_arguments)
+
+
+def _lazy_commands(commands):
+    """ :class:`LazyCommands` for the commands returned by :meth:`Commander.commands`, which can be a plain dict """
+    return commands if isinstance(commands, LazyCommands) else LazyCommands(commands)
+
+
+def _split_arguments(cmd_args):
+    """ Split :meth:`AbstractCommand.arguments` into a tuple of (normal_args, chain_args) """
+    if isinstance(cmd_args, tuple):
+        return list(cmd_args[0]), list(cmd_args[1])
+
+    return list(cmd_args), []
+
+
+def _source_mtime(spec):
+    """ Modified time of the source file of the command's module, or None if it can't be found """
+    try:
+        return os.stat(find_spec(spec.split(':')[0]).origin).st_mtime
+    except Exception:
+        return None
+
+
+class LazyVersionAction(argparse.Action):
+    """ Like argparse's version action, but the version is a callable that is only called when it is requested """
 
-            for args, kwargs in normal_args:
-                parser.add_argument(*args, **kwargs)
+    def __init__(self, option_strings, version=None, dest=argparse.SUPPRESS, default=argparse.SUPPRESS,
+                 help="show program's version number and exit"):
+        super(LazyVersionAction, self).__init__(option_strings=option_strings, dest=dest, default=default, nargs=0,
+                                                help=help)
+        self.version = version
 
-            if chain_args:
-                group = parser.add_argument_group('chaining options')
-                for args, kwargs in chain_args:
-                    group.add_argument(*args, **kwargs)
+    def __call__(self, parser, namespace, values, option_string=None):
+        print(self.version())
+        parser.exit()
 
 
 # Copied from https://gist.github.com/sampsyo/471779
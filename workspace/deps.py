@@ -0,0 +1,165 @@
+"""
+Dependency graph of products in the workspace, built from their requirement files and setup metadata.
+
+The graph is cached in the cache dir by the signature of the files it is built from, so it is only rebuilt when a
+product is added / removed or its requirements change.
+"""
+from __future__ import absolute_import
+from collections import deque
+import hashlib
+import logging
+import os
+import re
+
+from workspace.config import config
+from workspace.envs import canonical_name, normalize_requirements, requirement_name
+from workspace.scm import product_name, repos
+from workspace.utils import file_signature, load_cache, save_cache
+
+log = logging.getLogger(__name__)
+
+#: Files in the product root (in addition to requirement files) that dependencies are read from
+SETUP_FILES = ['setup.py', 'pyproject.toml']
+
+SETUP_NAME_RE = re.compile(r'''\bname\s*=\s*['"]([^'"]+)['"]''')
+SETUP_REQUIRES_RE = re.compile(r'''\binstall_requires\s*=\s*\[([^\]]*)\]''', re.DOTALL)
+STRING_RE = re.compile(r'''['"]([^'"]+)['"]''')
+
+
+class DependencyGraph(object):
+    """ Dependencies between products with lookups in both directions """
+
+    def __init__(self, dependencies):
+        """
+        :param dict dependencies: Map of product name to list of product names that it depends on
+        """
+        self.dependencies = dict((name, sorted(deps)) for name, deps in dependencies.items())
+        self._dependents = {}
+
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                self._dependents.setdefault(dep, []).append(name)
+
+    def _levels(self, name, edges, depth=None):
+        """ Products reachable from name via edges grouped by their distance from name (1 level per list) """
+        levels = []
+        seen = set([name])
+        queue = deque([(name, 0)])
+
+        while queue:
+            current, level = queue.popleft()
+            if depth and level >= depth:
+                continue
+
+            for next_name in sorted(edges.get(current, [])):
+                if next_name not in seen:
+                    seen.add(next_name)
+                    if len(levels) <= level:
+                        levels.append([])
+                    levels[level].append(next_name)
+                    queue.append((next_name, level + 1))
+
+        return levels
+
+    def dependents(self, name, depth=None):
+        """
+        Products that depend on the product directly or transitively.
+
+        :param str name: Product name
+        :param int depth: Number of levels to include, e.g. 1 for direct dependents only. Defaults to all levels.
+        :return: List of lists of product names, one list per level starting with direct dependents.
+        """
+        return self._levels(name, self._dependents, depth)
+
+    def dependencies_of(self, name, depth=None):
+        """ Products that the product depends on directly or transitively, like :meth:`dependents` """
+        return self._levels(name, self.dependencies, depth)
+
+
+def setup_requirements(path):
+    """ Distribution name (or None) and requirements in setup.py / pyproject.toml of the product at path """
+    name = None
+    requirements = []
+
+    setup_py = os.path.join(path, 'setup.py')
+    if os.path.exists(setup_py):
+        with open(setup_py) as fp:
+            content = fp.read()
+        match = SETUP_NAME_RE.search(content)
+        name = match and match.group(1)
+        for install_requires in SETUP_REQUIRES_RE.findall(content):
+            requirements.extend(STRING_RE.findall(install_requires))
+
+    pyproject = os.path.join(path, 'pyproject.toml')
+    if os.path.exists(pyproject):
+        try:
+            import tomllib
+            with open(pyproject, 'rb') as fp:
+                project = tomllib.load(fp).get('project', {})
+            name = project.get('name', name)
+            requirements.extend(project.get('dependencies', []))
+        except Exception as e:  # No tomllib (Python < 3.11) or invalid
+            log.debug('Could not read dependencies from %s: %s', pyproject, e)
+
+    return name, requirements
+
+
+def product_requirements(path):
+    """
+    Distribution name and names of requirements of the product from its requirement files and setup metadata.
+
+    :param str path: Path to the product
+    :return: Tuple of (canonical distribution name, sorted list of canonical requirement names)
+    """
+    requirements = []
+
+    for req_file in config.bump.requirement_files.split():
+        req_path = os.path.join(path, req_file)
+        if os.path.exists(req_path):
+            with open(req_path) as fp:
+                requirements.extend(normalize_requirements(fp.read(), path))
+
+    name, setup_reqs = setup_requirements(path)
+    requirements.extend(normalize_requirements('\n'.join(setup_reqs)))
+
+    names = set(requirement_name(r) for r in requirements)
+    names.discard(None)
+
+    return canonical_name(name or product_name(path)), sorted(names)
+
+
+def _graph_files(workspace_repos):
+    """ Files that the graph is built from """
+    return [os.path.join(repo, f) for repo in workspace_repos for f in config.bump.requirement_files.split() + SETUP_FILES]
+
+
+def workspace_graph(workspace):
+    """
+    Dependency graph of the products checked out in the workspace
+
+    :param str workspace: Path to the workspace
+    :rtype: DependencyGraph
+    """
+    workspace_repos = sorted(repos(workspace))
+    signature = file_signature([workspace] + _graph_files(workspace_repos))
+    cache_name = os.path.join('deps', hashlib.sha1(workspace.encode('utf-8')).hexdigest() + '.json')
+    key = signature and [config.bump.requirement_files, workspace_repos, signature]
+
+    dependencies = key and load_cache(cache_name, key)
+
+    if dependencies is None:
+        products = {}
+        for repo in workspace_repos:
+            products[product_name(repo)] = product_requirements(repo)
+
+        product_names = dict((dist_name, name) for name, (dist_name, _) in products.items())
+        product_names.update((canonical_name(name), name) for name in products)
+
+        dependencies = {}
+        for name, (_, requirements) in products.items():
+            dependencies[name] = sorted(set(product_names[r] for r in requirements if r in product_names) - {name})
+
+        if key:
+            save_cache(cache_name, key, dependencies)
+
+    return DependencyGraph(dependencies)
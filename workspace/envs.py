@@ -0,0 +1,807 @@
+"""
+Management of test environments (tox envdirs).
+
+Each envdir stores a fingerprint of everything its installation depends on: normalized requirements, the tox config of
+the env, dependencies in setup.py / pyproject.toml and the interpreter. An env needs to be redeveloped exactly when its
+fingerprint changes, so switching branches with identical requirements does not trigger a redevelop. When only the
+requirements changed, :func:`incremental_changes` diffs them against the installed distributions so the env can be
+updated with pip (run like tox does, see :func:`install_command`) instead of a full tox run. A snapshot of each env is
+kept after tox creates it, so recreating it with the same fingerprint is a clone of the snapshot (see
+:func:`restore_snapshot`) instead of a full tox run.
+Identical files across envs are hard linked by :func:`dedupe_envs` to save disk space.
+"""
+from __future__ import absolute_import
+from fnmatch import fnmatch
+from glob import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import sqlite3
+import stat
+from urllib.parse import unquote
+
+from workspace.config import config
+from workspace.scm import product_name
+from workspace.utils import cache_path
+
+
+log = logging.getLogger(__name__)
+
+#: Name of the file in the envdir that stores the fingerprint
+FINGERPRINT_FILE = '.wst-fingerprint.json'
+
+#: Keys in tox config that do not affect what is installed in the env, are fingerprinted as requirements (deps), or
+#: are defaults set by :class:`ToxIni` for its location (tox_ini, path) that appear in every section.
+TOX_KEYS_IGNORED = ('commands', 'envlist', 'description', 'deps', 'tox_ini', 'path')
+
+#: Files that were used to check if an env is outdated by mtime before fingerprints
+LEGACY_REQUIREMENT_FILES = ['requirements.txt', 'pinned.txt', 'tox.ini']
+
+#: Dir in the cache dir for the env snapshots
+SNAPSHOTS_DIR = 'envs'
+
+#: Name of the file in the snapshot dir that stores the paths the snapshot was taken from
+SNAPSHOT_SOURCE_FILE = 'source.json'
+
+#: Files (relative to envdir) that may contain the envdir or product path, which are relocated when cloning an env
+RELOCATED_FILES = ('*', 'bin/*', 'lib*/python*/site-packages/*', 'lib*/python*/site-packages/*.dist-info/direct_url.json')
+
+#: Index of file hashes in the cache dir for :func:`dedupe_envs`
+DEDUPE_INDEX_FILE = 'dedupe-index.sqlite'
+
+#: Parts of the fingerprint that can be updated incrementally with pip instead of a full tox run
+INCREMENTAL_PARTS = ('requirements', 'setup')
+
+#: Install command of tox envs when it is not set
+DEFAULT_INSTALL_COMMAND = 'python -m pip install {opts} {packages}'
+
+VERSION_RE = re.compile(r'''^\s*version\s*=\s*['"][^'"]*['"]\s*,?\s*$''', re.MULTILINE)
+NAME_RE = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+
+def normalize_requirements(content, path=None, seen=None):
+    """
+    Normalize requirements content so formatting, comments, and order do not matter.
+    Nested requirement files (-r / -c) are included when path is given.
+
+    :param str content: Requirements content
+    :param str path: Dir that nested requirement files are relative to
+    :param set seen: Nested files already included, to avoid loops
+    :return: Sorted list of unique requirement lines
+    """
+    seen = set() if seen is None else seen
+    requirements = set()
+
+    for line in content.replace('\\\n', ' ').split('\n'):
+        line = re.sub(r'(^|\s)#.*', '', line).strip()
+        if not line:
+            continue
+
+        nested = re.match(r'^-[rc]\s*(\S+)$|^--(?:requirement|constraint)[=\s]\s*(\S+)$', line)
+        if nested and path:
+            nested_path = os.path.join(path, nested.group(1) or nested.group(2))
+            if nested_path not in seen and os.path.exists(nested_path):
+                seen.add(nested_path)
+                with open(nested_path) as fp:
+                    requirements.update(normalize_requirements(fp.read(), os.path.dirname(nested_path), seen))
+                continue
+
+        requirements.add(re.sub(r'\s+', '', line).lower())
+
+    return sorted(requirements)
+
+
+def _hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _read(path):
+    try:
+        with open(path) as fp:
+            return fp.read()
+    except (IOError, OSError):
+        return None
+
+
+def tox_config(tox, env):
+    """ Tox config that affects what is installed in the env as a dict of section to dict of key/values """
+    sections = {}
+
+    for section in ('tox', tox.envsection(), tox.envsection(env)):
+        if section in tox:
+            sections[section] = dict((k, str(v)) for k, v in tox.items(section) if k not in TOX_KEYS_IGNORED)
+
+    return sections
+
+
+def setup_dependencies(path):
+    """
+    Dependency related content of setup.py and pyproject.toml in path. For setup.py, that is everything but the
+    version line as it can not be reliably parsed without running it.
+    """
+    dependencies = {}
+
+    setup_py = _read(os.path.join(path, 'setup.py'))
+    if setup_py is not None:
+        dependencies['setup.py'] = VERSION_RE.sub('', setup_py)
+
+    pyproject = _read(os.path.join(path, 'pyproject.toml'))
+    if pyproject is not None:
+        try:
+            import tomllib
+            data = tomllib.loads(pyproject)
+            project = data.get('project', {})
+            dependencies['pyproject.toml'] = {
+                'build-system': data.get('build-system', {}).get('requires', []),
+                'dependencies': project.get('dependencies', []),
+                'optional-dependencies': project.get('optional-dependencies', {}),
+                'dynamic': project.get('dynamic', []),
+            }
+        except Exception:  # No tomllib (Python < 3.11) or invalid
+            dependencies['pyproject.toml'] = VERSION_RE.sub('', pyproject)
+
+    return dependencies
+
+
+def interpreter(tox, env):
+    """ Path, mtime and size of the interpreter that tox would use for the env, which changes when it is upgraded """
+    basepython = tox.get(tox.envsection(env), 'basepython') or tox.get(tox.envsection(), 'basepython') or 'python3'
+    path = shutil.which(str(basepython))
+
+    if not path:
+        return basepython
+
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return [path, stat.st_mtime, stat.st_size]
+
+
+def fingerprint(tox, env):
+    """
+    Fingerprint of what the env's installation depends on.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env
+    :return: Dict with "fingerprint" (the overall hash), "parts" (dict of part name to its hash) where parts are
+             "interpreter", "tox", "setup", and "requirements", and "requirements" (list of normalized requirements).
+    """
+    requirements, tox_deps = _requirements(tox, env)
+
+    parts = {
+        'interpreter': _hash(interpreter(tox, env)),
+        'tox': _hash(tox_config(tox, env)),
+        'setup': _hash(setup_dependencies(tox.path)),
+        'requirements': _hash([requirements, tox_deps]),
+    }
+
+    all_requirements = sorted(set(tox_deps).union(*[reqs for _, reqs in requirements]))
+
+    return {'fingerprint': _hash(parts), 'parts': parts, 'requirements': all_requirements}
+
+
+def _requirements(tox, env):
+    """ Tuple of ([requirement file, normalized requirements], normalized tox deps) for the env """
+    requirements = []
+    for req_file in config.bump.requirement_files.split():
+        content = _read(os.path.join(tox.path, req_file))
+        if content is not None:
+            requirements.append([req_file, normalize_requirements(content, tox.path)])
+
+    tox_deps = normalize_requirements(str(tox.get(tox.envsection(env), 'deps') or tox.get(tox.envsection(), 'deps') or ''),
+                                      tox.path)
+
+    return requirements, tox_deps
+
+
+def saved_fingerprint(envdir):
+    """ Fingerprint saved in the envdir or None if there isn't one """
+    try:
+        with open(os.path.join(envdir, FINGERPRINT_FILE)) as fp:
+            return json.load(fp)
+    except Exception:
+        return None
+
+
+def save_fingerprint(tox, env):
+    """ Save the env's current fingerprint in its envdir, such as after it has been redeveloped. """
+    envdir = tox.envdir(env)
+
+    if os.path.isdir(envdir):
+        with open(os.path.join(envdir, FINGERPRINT_FILE), 'w') as fp:
+            json.dump(fingerprint(tox, env), fp)
+
+
+def _legacy_outdated(tox, envdir):
+    """ Check if the env is outdated by mtimes of requirement files, for envs created before fingerprints """
+    req_mtime = 0
+    for req_file in LEGACY_REQUIREMENT_FILES:
+        req_path = os.path.join(tox.path, req_file)
+        if os.path.exists(req_path):
+            req_mtime = max(req_mtime, os.stat(req_path).st_mtime)
+    return req_mtime > os.stat(envdir).st_mtime
+
+
+def outdated_parts(tox, env):
+    """
+    Parts of the env's fingerprint that changed since it was saved.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env
+    :return: List of part names that changed (see :func:`fingerprint`), all parts if the env does not exist,
+             or an empty list if it is up to date.
+    """
+    envdir = tox.envdir(env)
+    current = fingerprint(tox, env)
+
+    if not os.path.exists(envdir):
+        return sorted(current['parts'])
+
+    saved = saved_fingerprint(envdir)
+
+    if not saved:
+        if _legacy_outdated(tox, envdir):
+            return sorted(current['parts'])
+
+        log.debug('Adopting %s with a fingerprint as it is up to date by mtime', envdir)
+        save_fingerprint(tox, env)
+        return []
+
+    if saved.get('fingerprint') == current['fingerprint']:
+        return []
+
+    return sorted(p for p, h in current['parts'].items() if saved.get('parts', {}).get(p) != h)
+
+
+def needs_redevelop(tox, env):
+    """ Check if the env needs to be redeveloped as its fingerprint changed or it does not exist """
+    return bool(outdated_parts(tox, env))
+
+
+def canonical_name(name):
+    """ Canonical form of a distribution name for comparison, e.g. "Foo_Bar" => "foo-bar" """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _egg_info_version(egg_info):
+    """ Version from the PKG-INFO of the egg-info dir (or file) """
+    pkg_info = _read(os.path.join(egg_info, 'PKG-INFO') if os.path.isdir(egg_info) else egg_info) or ''
+    match = re.search(r'^Version:\s*(\S+)', pkg_info, re.MULTILINE)
+    return match.group(1) if match else ''
+
+
+def _egg_link_path(egg_link):
+    """ Path of the project that the egg-link (from "setup.py develop") points to """
+    lines = (_read(egg_link) or '').split('\n')
+    return os.path.normpath(os.path.join(os.path.dirname(egg_link), lines[0].strip())) if lines[0].strip() else None
+
+
+def _distribution_files(envdir):
+    """ Tuples of (canonical name, version, metadata path, editable) for distributions installed in the env """
+    for site_packages in glob(os.path.join(envdir, 'lib*', 'python*', 'site-packages')):
+        for dist_info in glob(os.path.join(site_packages, '*.dist-info')):
+            name, _, version = os.path.basename(dist_info)[:-len('.dist-info')].partition('-')
+            direct_url = _read(os.path.join(dist_info, 'direct_url.json')) or ''
+            yield canonical_name(name), version, dist_info, bool(re.search(r'"editable"\s*:\s*true', direct_url))
+
+        for egg_info in glob(os.path.join(site_packages, '*.egg-info')):  # E.g. foo-1.0-py3.9.egg-info
+            name, _, version = os.path.basename(egg_info)[:-len('.egg-info')].partition('-')
+            yield canonical_name(name), version.split('-')[0] or _egg_info_version(egg_info), egg_info, False
+
+        for egg_link in glob(os.path.join(site_packages, '*.egg-link')):
+            path = _egg_link_path(egg_link)
+            egg_infos = glob(os.path.join(path, '*.egg-info')) if path else []
+            name = os.path.basename(egg_link)[:-len('.egg-link')]
+            yield (canonical_name(name), _egg_info_version(egg_infos[0]) if egg_infos else '',
+                   egg_infos[0] if egg_infos else None, True)
+
+
+def installed_distributions(envdir):
+    """
+    Distributions installed in the env, read from the dist-info / egg-info dirs and egg-links (from "setup.py develop")
+    in its site-packages without running its python.
+
+    :param str envdir: Path to the env
+    :return: Dict of canonical name to version
+    """
+    return dict((name, version) for name, version, _, _ in _distribution_files(envdir))
+
+
+def editable_distributions(envdir):
+    """ Canonical names of distributions installed in editable / develop mode in the env """
+    return set(name for name, _, _, editable in _distribution_files(envdir) if editable)
+
+
+def _distribution_requirements(metadata_path):
+    """ Canonical names of the (non-extra) requirements of the distribution from its dist-info / egg-info """
+    if not metadata_path:
+        return set()
+
+    if metadata_path.endswith('.dist-info'):
+        metadata = _read(os.path.join(metadata_path, 'METADATA')) or ''
+        requirements = [r for r in re.findall(r'^Requires-Dist:\s*(.+)$', metadata, re.MULTILINE) if 'extra ==' not in r]
+    else:
+        requires = (_read(os.path.join(metadata_path, 'requires.txt')) or '') if os.path.isdir(metadata_path) else ''
+        requirements = requires.split('\n[')[0].split('\n')  # Extras are in [sections] after the main requirements
+
+    return set(requirement_name(r.strip()) for r in requirements if r.strip()) - {None}
+
+
+def required_distributions(envdir, excluded=()):
+    """
+    Canonical names of distributions that are required by distributions installed in the env.
+
+    :param str envdir: Path to the env
+    :param excluded: Names of distributions to ignore the requirements of, such as those that will be uninstalled
+    """
+    return set(r for name, _, metadata_path, _ in _distribution_files(envdir) if name not in excluded
+               for r in _distribution_requirements(metadata_path))
+
+
+def editable_paths(envdir):
+    """
+    Paths of distributions installed in editable / develop mode in the env from their egg-link, .pth and
+    direct_url.json files, without running its python.
+
+    :param str envdir: Path to the env
+    :return: Sorted list of paths
+    """
+    paths = set()
+
+    for site_packages in glob(os.path.join(envdir, 'lib*', 'python*', 'site-packages')):
+        for link_file in glob(os.path.join(site_packages, '*.egg-link')) + glob(os.path.join(site_packages, '*.pth')):
+            for line in (_read(link_file) or '').split('\n'):
+                line = line.strip()
+                if line.startswith('/') and os.path.isdir(line):
+                    paths.add(os.path.normpath(line))
+
+        for direct_url_file in glob(os.path.join(site_packages, '*.dist-info', 'direct_url.json')):
+            try:
+                direct_url = json.loads(_read(direct_url_file))
+                if direct_url.get('dir_info', {}).get('editable') and direct_url['url'].startswith('file://'):
+                    paths.add(os.path.normpath(unquote(direct_url['url'][len('file://'):])))
+            except Exception:
+                continue
+
+    return sorted(paths)
+
+
+def requirement_name(requirement):
+    """ Canonical distribution name of the normalized requirement or None if it is not a plain requirement """
+    if requirement.startswith('-') or '://' in requirement:
+        return None
+
+    match = NAME_RE.match(requirement)
+    return canonical_name(match.group(1)) if match else None
+
+
+def _satisfied(requirement, distributions):
+    """
+    Check if the normalized requirement is satisfied by the installed distributions.
+
+    :return: True or False, or None if it can not be checked, such as options, URLs or requirements with markers.
+    """
+    if requirement.startswith('-') or ';' in requirement or '@' in requirement or '://' in requirement:
+        return None
+
+    try:
+        import pkg_resources  # Slow to import, so only when needed
+        req = pkg_resources.Requirement.parse(requirement)
+    except Exception:
+        return None
+
+    version = distributions.get(canonical_name(req.project_name))
+    return version is not None and req.specifier.contains(version, prereleases=True)
+
+
+def incremental_changes(tox, env, parts):
+    """
+    Changes to bring the env up to date with pip instead of a full tox run, which is only possible when the env has
+    a saved fingerprint and only its requirements or setup dependencies changed.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env
+    :param list parts: Outdated parts from :func:`outdated_parts`
+    :return: Tuple of (args for "pip install", names for "pip uninstall") or None if a full tox run is needed.
+    """
+    envdir = tox.envdir(env)
+    saved = saved_fingerprint(envdir)
+
+    if not parts or not saved or 'requirements' not in saved or set(parts) - set(INCREMENTAL_PARTS):
+        return None
+
+    usedevelop = str(tox.get(tox.envsection(env), 'usedevelop') or tox.get(tox.envsection(), 'usedevelop') or '')
+    if 'setup' in parts and usedevelop.lower() != 'true':
+        return None
+
+    distributions = installed_distributions(envdir)
+    editable = editable_distributions(envdir)
+    old_requirements = set(saved['requirements'])
+    new_requirements = fingerprint(tox, env)['requirements']
+
+    install = []
+    for requirement in new_requirements:
+        if requirement in old_requirements:
+            continue  # Only changed lines are checked
+
+        if requirement.startswith('-') and not requirement.startswith(('-e', '--editable')):
+            return None  # Changed pip options, such as index url, may affect everything
+
+        if requirement_name(requirement) in editable:
+            continue  # Installed from a checkout, which should not be replaced by a release
+
+        if not _satisfied(requirement, distributions):
+            install.append(requirement)
+
+    if 'setup' in parts:
+        install.extend(['-e', tox.path])
+
+    new_names = set(requirement_name(r) for r in new_requirements)
+    removed_names = set(requirement_name(r) for r in old_requirements.difference(new_requirements))
+    uninstall = set(n for n in removed_names - new_names if n in distributions and n not in editable)
+
+    # Keep dropped requirements that are still required by other distributions
+    uninstall -= required_distributions(envdir, excluded=uninstall)
+
+    return install, sorted(uninstall)
+
+
+def _env_setting(tox, env, key):
+    return tox.get(tox.envsection(env), key) or tox.get(tox.envsection(), key)
+
+
+def _expand_env_vars(tox, env, value, extra_vars={}):
+    """
+    Expand substitutions in the value of tox config for the env, as ToxIni only knows about the product.
+
+    :return: Expanded value, or None if it has substitutions that only tox knows about, such as {env:NAME}
+    """
+    envdir = tox.envdir(env)
+    env_vars = dict({'envname': env, 'envdir': envdir, 'envbindir': tox.bindir(env),
+                     'envpython': tox.bindir(env, 'python'), 'envtmpdir': os.path.join(envdir, 'tmp'),
+                     'envlogdir': os.path.join(envdir, 'log'), 'toxinidir': tox.inidir, 'toxworkdir': tox.workdir,
+                     'homedir': tox.homedir}, **extra_vars)
+
+    if '{' in tox.VAR_RE.sub(lambda m: '' if m.group(1) in env_vars else m.group(0), value):
+        return None
+
+    return tox.expand_vars(value, env_vars)
+
+
+def env_variables(tox, env):
+    """
+    Environment variables that tox sets for commands in the env (virtualenv and setenv), such as PIP_* variables for
+    the index or constraints.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env
+    :return: Dict of environment variables, or None if setenv has values that can not be expanded outside of tox
+    """
+    variables = {'VIRTUAL_ENV': tox.envdir(env), 'PATH': os.pathsep.join([tox.bindir(env), os.environ.get('PATH', '')])}
+
+    for line in str(_env_setting(tox, env, 'setenv') or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if '=' not in line:  # Such as "file|.env"
+            return None
+
+        name, value = [part.strip() for part in line.split('=', 1)]
+        value = _expand_env_vars(tox, env, value)
+        if value is None:
+            return None
+
+        variables[name] = value
+
+    return variables
+
+
+def install_command(tox, env, packages):
+    """
+    Command to install packages into the env the same way tox does with the env's install_command.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env
+    :param list packages: Args for packages to install
+    :return: Command as a list, or None if it can not be expanded outside of tox or deps use index servers
+    """
+    if _env_setting(tox, env, 'indexserver') or tox.get('tox', 'indexserver'):
+        return None
+
+    command = str(_env_setting(tox, env, 'install_command') or DEFAULT_INSTALL_COMMAND).replace('\\\n', ' ')
+    command = _expand_env_vars(tox, env, command, {'opts': '{opts}', 'packages': '{packages}'})
+    if command is None:
+        return None
+
+    cmd = []
+    for arg in shlex.split(command):
+        if arg == '{packages}':
+            cmd.extend(packages)
+        elif arg != '{opts}':
+            cmd.append(arg)
+
+    if cmd and os.path.exists(tox.bindir(env, cmd[0])):
+        cmd[0] = tox.bindir(env, cmd[0])
+
+    return cmd
+
+
+def snapshot_dir(tox, env):
+    """ Dir in the cache dir for the snapshot of the env, which is shared by checkouts of the same product """
+    return cache_path(SNAPSHOTS_DIR, product_name(tox.path), env)
+
+
+def _relocated(rel_path):
+    return any(fnmatch(rel_path, pattern) and rel_path.count('/') == pattern.count('/') for pattern in RELOCATED_FILES)
+
+
+def _copy(path, target, relocate_re=None, relocations=None):
+    """ Copy path to target, replacing paths using relocate_re / relocations in text files """
+    shutil.copy2(path, target)
+
+    if relocate_re:
+        with open(path, 'rb') as fp:
+            content = fp.read()
+
+        if b'\0' not in content and relocate_re.search(content):
+            with open(target, 'wb') as fp:
+                fp.write(relocate_re.sub(lambda m: relocations[m.group(0)], content))
+
+
+#: ioctl request to clone a file as a copy-on-write reflink on Linux (e.g. btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def _clone_file(path, target):
+    """
+    Copy path to target as a reflink where the file system supports it, which shares data blocks until either file
+    is modified, or as a full copy otherwise. Unlike hard links, the files never share an inode.
+    """
+    try:
+        import fcntl
+
+        with open(path, 'rb') as source_fp, open(target, 'wb') as target_fp:
+            fcntl.ioctl(target_fp.fileno(), FICLONE, source_fp.fileno())
+        shutil.copystat(path, target)
+
+    except (ImportError, IOError, OSError):  # Not supported, such as on ext4 / across file systems
+        shutil.copy2(path, target)
+
+
+def clone_env(envdir, target, relocations=None):
+    """
+    Clone the env by copying its files (as reflinks where supported, see :func:`_clone_file`), so the clone does not
+    share inodes with the env and is not changed when files in the env are modified in place. Files that may contain
+    paths (see :attr:`RELOCATED_FILES`) are relocated.
+
+    :param str envdir: Env to clone
+    :param str target: Dir to clone into. It must not exist.
+    :param dict relocations: Map of old path to new path to replace in the copied files.
+    """
+    relocations = dict((old.encode(), new.encode()) for old, new in (relocations or {}).items() if old != new)
+    relocate_re = relocations and re.compile(b'|'.join(re.escape(p) for p in sorted(relocations, key=len, reverse=True)))
+
+    for root, dirs, files in os.walk(envdir):
+        target_root = os.path.normpath(os.path.join(target, os.path.relpath(root, envdir)))
+        os.makedirs(target_root)
+
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, envdir).replace(os.sep, '/')
+
+            if os.path.islink(path):  # os.walk does not follow linked dirs, so they are linked as is too
+                os.symlink(os.readlink(path), os.path.join(target_root, name))
+            elif name in dirs:
+                continue
+            elif _relocated(rel_path):
+                _copy(path, os.path.join(target_root, name), relocate_re, relocations)
+            else:
+                _clone_file(path, os.path.join(target_root, name))
+
+
+def _replace_dir(source, target):
+    """ Replace target dir with source dir, which should be on the same file system """
+    old = '{}.wst-old-{}'.format(target, os.getpid())
+
+    if os.path.exists(target):
+        os.rename(target, old)
+
+    os.rename(source, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def save_snapshot(tox, env):
+    """ Save a snapshot of the env (with its fingerprint) in the cache dir to recreate it from later """
+    envdir = tox.envdir(env)
+    target = snapshot_dir(tox, env)
+    tmp_dir = '{}.wst-tmp-{}'.format(target, os.getpid())
+
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        clone_env(envdir, os.path.join(tmp_dir, env))
+
+        with open(os.path.join(tmp_dir, SNAPSHOT_SOURCE_FILE), 'w') as fp:
+            json.dump({'envdir': envdir, 'path': tox.path}, fp)
+
+        _replace_dir(tmp_dir, target)
+
+    except Exception as e:
+        log.debug('Could not save snapshot of %s: %s', envdir, e)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def has_snapshot(tox, env):
+    """ Check if there is a snapshot of the env with the same fingerprint as the env would have now """
+    saved = saved_fingerprint(os.path.join(snapshot_dir(tox, env), env))
+    return bool(saved) and saved.get('fingerprint') == fingerprint(tox, env)['fingerprint']
+
+
+def restore_snapshot(tox, env):
+    """
+    Recreate the env by cloning its snapshot, relocating paths if the snapshot was taken from another checkout.
+
+    :return: True if restored or False if there isn't a snapshot with the same fingerprint
+    """
+    if not has_snapshot(tox, env):
+        return False
+
+    snapshot = snapshot_dir(tox, env)
+    envdir = tox.envdir(env)
+    tmp_dir = '{}.wst-tmp-{}'.format(envdir, os.getpid())
+
+    try:
+        with open(os.path.join(snapshot, SNAPSHOT_SOURCE_FILE)) as fp:
+            source = json.load(fp)
+
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        clone_env(os.path.join(snapshot, env), tmp_dir, {source['envdir']: envdir, source['path']: tox.path})
+        _replace_dir(tmp_dir, envdir)
+        return True
+
+    except Exception as e:
+        log.debug('Could not restore %s from snapshot: %s', envdir, e)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+
+def known_envdirs(workspace=None):
+    """
+    Envs that wst knows about: envs in ~/.virtualenvs (used by the tox.ini template from "wst setup") and .tox dirs of
+    products in the workspace. Env snapshots are not included as they should stay independent copies.
+
+    :param str workspace: Path to the workspace to include envs of its products
+    :return: Sorted list of envdirs
+    """
+    patterns = [os.path.join(os.path.expanduser('~'), '.virtualenvs', '*')]
+    if workspace:
+        patterns.append(os.path.join(workspace, '*', '.tox', '*'))
+
+    return sorted(d for pattern in patterns for d in glob(pattern)
+                  if os.path.exists(os.path.join(d, 'pyvenv.cfg')) or os.path.exists(os.path.join(d, 'bin', 'python')))
+
+
+def _dedupe_index():
+    path = cache_path(DEDUPE_INDEX_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    index = sqlite3.connect(path, timeout=60)
+    index.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dev INTEGER, ino INTEGER, size INTEGER, '
+                  'mtime INTEGER, mode INTEGER, hash TEXT)')
+    index.execute('CREATE INDEX IF NOT EXISTS files_hash ON files (hash, size, dev, mode)')
+    return index
+
+
+def _file_hash(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _stat_key(file_stat):
+    return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_mode)
+
+
+def _env_files(envdir):
+    """ Regular files in the env that can be hard linked, i.e. except those that may be modified in place """
+    for root, _, files in os.walk(envdir):
+        for name in files:
+            path = os.path.join(root, name)
+            if not _relocated(os.path.relpath(path, envdir).replace(os.sep, '/')):
+                yield path
+
+
+def dedupe_envs(envdirs, prune=False):
+    """
+    Hard link identical files across envs. File hashes are kept in an index in the cache dir, so only files that
+    are new or changed since they were indexed are hashed. Env snapshots are never linked (see :func:`clone_env`).
+
+    :param list envdirs: Envs to dedupe. Their files are also linked to identical files in envs indexed before.
+    :param bool prune: Remove files that are not in envdirs from the index, such as when all known envs are given.
+    :return: Tuple of (number of files linked, bytes saved)
+    """
+    linked = saved = 0
+    seen = set()
+    snapshots_dir = cache_path(SNAPSHOTS_DIR) + os.sep
+    index = _dedupe_index()
+
+    try:
+        for envdir in envdirs:
+            if os.path.abspath(envdir).startswith(snapshots_dir):
+                continue
+
+            for path in _env_files(envdir):
+                try:
+                    file_stat = os.lstat(path)
+                except OSError:
+                    continue
+
+                if not stat.S_ISREG(file_stat.st_mode) or not file_stat.st_size:
+                    continue
+
+                seen.add(path)
+                row = index.execute('SELECT dev, ino, size, mtime, mode FROM files WHERE path = ?', (path,)).fetchone()
+                if row and tuple(row) == _stat_key(file_stat):
+                    continue  # Unchanged since it was indexed
+
+                try:
+                    file_hash = _file_hash(path)
+                except (IOError, OSError):
+                    continue
+
+                candidates = index.execute('SELECT path, dev, ino, size, mtime, mode FROM files '
+                                           'WHERE hash = ? AND size = ? AND dev = ? AND mode = ? AND path != ?',
+                                           (file_hash, file_stat.st_size, file_stat.st_dev, file_stat.st_mode, path))
+
+                for other_path, *other_key in candidates.fetchall():
+                    try:
+                        other_stat = os.lstat(other_path)
+                    except OSError:
+                        other_stat = None
+
+                    if (not other_stat or _stat_key(other_stat) != tuple(other_key)  # Changed since it was indexed
+                            or other_path.startswith(snapshots_dir)):
+                        index.execute('DELETE FROM files WHERE path = ?', (other_path,))
+                        continue
+
+                    if other_stat.st_ino != file_stat.st_ino and _link_file(other_path, path):
+                        linked += 1
+                        saved += file_stat.st_size
+                        file_stat = other_stat
+                    break
+
+                index.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (path,) + _stat_key(file_stat) + (file_hash,))
+
+        if prune:
+            for path, in index.execute('SELECT path FROM files').fetchall():
+                if path not in seen:
+                    index.execute('DELETE FROM files WHERE path = ?', (path,))
+
+        index.commit()
+
+    finally:
+        index.close()
+
+    return linked, saved
+
+
+def _link_file(source, path):
+    """ Replace path with a hard link to source """
+    tmp_path = '{}.wst-link-{}'.format(path, os.getpid())
+
+    try:
+        os.link(source, tmp_path)
+        os.replace(tmp_path, path)
+        return True
+
+    except OSError as e:
+        log.debug('Could not link %s to %s: %s', path, source, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
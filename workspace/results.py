@@ -0,0 +1,211 @@
+"""
+Cache of successful test results by content, so tests are not re-run for the same code, env, and command, such as when
+"wst commit -t" runs tests that just passed.
+
+The key of a result is a hash of the working tree content of the product and of workspace products installed in
+editable mode in the env, the env's fingerprint, and the test command.
+
+Failed tests of each product and env are tracked to run them first, and results of runs are read from the JUnit XML
+written by pytest to summarize them.
+"""
+from __future__ import absolute_import
+from glob import glob
+import hashlib
+import json
+import logging
+import os
+import re
+from time import time
+from xml.etree import ElementTree
+
+from workspace.envs import editable_paths, saved_fingerprint
+from workspace.scm import product_name, repo_path, working_tree_hash
+from workspace.utils import cache_path, load_cache, save_cache
+
+log = logging.getLogger(__name__)
+
+#: Dir in the cache dir for test results
+RESULTS_DIR = 'test-results'
+RESULTS_VERSION = 1
+
+#: Number of xdist workers in a pytest command, which does not affect results but varies with free CPUs
+WORKERS_RE = re.compile(r'(^|\s)(-n\s*|--numprocesses[=\s]\s*)\S+')
+
+
+def result_key(repo, envdir, command):
+    """
+    Key for the result of running the test command in the env for the repo.
+
+    :param str repo: Path to the product repo
+    :param str envdir: Path to the env
+    :param str command: Test command, including any pytest args. The number of xdist workers is ignored.
+    :return: Key (str) or None if the result can not be cached, such as when the env has no fingerprint.
+    """
+    fingerprint = saved_fingerprint(envdir)
+    if not fingerprint:
+        return None
+
+    try:
+        repos = [repo] + sorted(set(repo_path(p) for p in editable_paths(envdir)) - {None, repo})
+        trees = [(os.path.basename(r), working_tree_hash(r)) for r in repos]
+    except Exception as e:
+        log.debug('Could not get working tree hash for %s: %s', repo, e)
+        return None
+
+    data = [RESULTS_VERSION, trees, fingerprint['fingerprint'], WORKERS_RE.sub('', command)]
+    return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+
+def _result_name(key):
+    return os.path.join(RESULTS_DIR, key[:2], key + '.json')
+
+
+def cached_result(key):
+    """
+    Result saved by :func:`save_result` for the key.
+
+    :return: Dict with "output" (None if it was not captured) and "time" (when it ran), or None if there isn't one.
+    """
+    return load_cache(_result_name(key), key) if key else None
+
+
+def save_result(key, output=None):
+    """
+    Save a successful result for the key.
+
+    :param str key: Key from :func:`result_key`
+    :param str output: Test output if it was captured
+    """
+    if key:
+        save_cache(_result_name(key), key, {'output': output if isinstance(output, str) else None, 'time': time()})
+
+
+def remove_old_results(days):
+    """
+    Remove results saved more than the given number of days ago.
+
+    :param int days: Number of days
+    :return: Number of results removed
+    """
+    keep_time = time() - days * 86400
+    removed = 0
+
+    for result_file in glob(cache_path(RESULTS_DIR, '*', '*.json')):
+        if os.stat(result_file).st_mtime < keep_time:
+            os.remove(result_file)
+            removed += 1
+
+    return removed
+
+
+#: Dir in the cache dir for the failed tests of each product and env
+FAILURES_DIR = 'test-failures'
+
+#: Path of pytest's cache of failed tests in the product root
+PYTEST_LASTFAILED = os.path.join('.pytest_cache', 'v', 'cache', 'lastfailed')
+
+
+def _failures_name(name, env):
+    return os.path.join(FAILURES_DIR, name, env + '.json')
+
+
+def failures(name, env):
+    """
+    Node IDs of tests that failed in the last run of the env for the product, as recorded by :func:`record_failures`
+
+    :return: List of node IDs, or None if no run was recorded.
+    """
+    return load_cache(_failures_name(name, env), RESULTS_VERSION)
+
+
+def has_failures(name):
+    """ Check if tests failed in the last run of any env for the product """
+    return any(load_cache(f, RESULTS_VERSION) for f in glob(cache_path(_failures_name(name, '*'))))
+
+
+def restore_failures(repo, env):
+    """
+    Restore failed tests of the env into pytest's cache in the repo, which is shared by all envs, so pytest's
+    --failed-first runs them first.
+
+    :return: True if there are failed tests restored
+    """
+    env_failures = failures(product_name(repo), env)
+
+    if env_failures is not None:
+        lastfailed = os.path.join(repo, PYTEST_LASTFAILED)
+        try:
+            os.makedirs(os.path.dirname(lastfailed), exist_ok=True)
+            with open(lastfailed, 'w') as fp:
+                json.dump(dict((node_id, True) for node_id in env_failures), fp)
+        except Exception as e:
+            log.debug('Could not restore failed tests into %s: %s', lastfailed, e)
+            return False
+
+    return bool(env_failures)
+
+
+def record_failures(repo, env, since):
+    """
+    Record failed tests of the env from pytest's cache in the repo if pytest updated it since the given time.
+
+    :param str repo: Path to the product repo
+    :param str env: Name of the tox env
+    :param float since: Time before failed tests were restored for the run
+    """
+    lastfailed = os.path.join(repo, PYTEST_LASTFAILED)
+
+    try:
+        if os.stat(lastfailed).st_mtime < since:
+            return
+        with open(lastfailed) as fp:
+            env_failures = sorted(json.load(fp))
+    except Exception:
+        return
+
+    save_cache(_failures_name(product_name(repo), env), RESULTS_VERSION, env_failures)
+
+
+def junit_results(junit_xml):
+    """
+    Results from the JUnit XML file written by pytest (--junitxml), which is parsed incrementally so memory use does
+    not grow with the number of tests.
+
+    :param str junit_xml: Path to the JUnit XML file
+    :return: Dict with the number of "passed", "failed", "errors" and "skipped" tests, "time" in seconds, and "failures"
+             with the "classname::name" of tests that failed or errored, or None if the file does not exist or can not
+             be parsed, such as when pytest did not finish.
+    """
+    results = {'passed': 0, 'failed': 0, 'errors': 0, 'skipped': 0, 'time': 0.0, 'failures': []}
+
+    try:
+        for _, elem in ElementTree.iterparse(junit_xml):
+            if elem.tag == 'testcase':
+                outcomes = set(child.tag for child in elem)
+
+                if 'failure' in outcomes or 'error' in outcomes:
+                    results['failed' if 'failure' in outcomes else 'errors'] += 1
+                    results['failures'].append('{}::{}'.format(elem.get('classname'), elem.get('name')))
+                elif 'skipped' in outcomes:
+                    results['skipped'] += 1
+                else:
+                    results['passed'] += 1
+
+                elem.clear()
+
+            elif elem.tag == 'testsuite':
+                results['time'] += float(elem.get('time') or 0)
+                elem.clear()
+
+    except (IOError, ElementTree.ParseError, ValueError) as e:
+        log.debug('Could not read test results from %s: %s', junit_xml, e)
+        return None
+
+    return results
+
+
+def junit_summary(results):
+    """ Summary line of the results from :func:`junit_results` in pytest's format, e.g. "1 failed, 2 passed in 0.12s" """
+    counts = ['{} {}'.format(results[outcome], 'error' if outcome == 'errors' and results[outcome] == 1 else outcome)
+              for outcome in ('failed', 'passed', 'skipped', 'errors') if results[outcome]]
+    return '{} in {:.2f}s'.format(', '.join(counts) or 'no tests ran', results['time'])
@@ -1,15 +1,15 @@
 from __future__ import absolute_import
+import hashlib
 import logging
 import os
 import re
 import sys
 
 import click
-import requests
 from utils.process import run, silent_run
 
 from workspace.config import config
-from workspace.utils import parent_path_with_dir, parent_path_with_file, shortest_id
+from workspace.utils import file_signature, memoize_by, parent_path_with_dir, parent_path_with_file, shortest_id
 
 
 log = logging.getLogger(__name__)
@@ -217,6 +217,25 @@ def all_remotes(repo=None):
         return remotes
 
 
+def _config_signature(repo=None, *args, **kwargs):
+    """ Signature of the repo's config for :func:`memoize_by` """
+    path = repo_path(repo)
+    if path:
+        signature = file_signature([os.path.join(path, '.git', 'config')])
+        return signature and (path, signature)
+
+
+def _refs_signature(repo=None, *args, **kwargs):
+    """ Signature of the repo's config, HEAD and refs for :func:`memoize_by` """
+    path = repo_path(repo)
+    if path:
+        git_dir = os.path.join(path, '.git')
+        ref_dirs = [root for root, _, _ in os.walk(os.path.join(git_dir, 'refs'))]
+        signature = file_signature([os.path.join(git_dir, f) for f in ('config', 'HEAD', 'packed-refs')] + ref_dirs)
+        return signature and (path, ref_dirs, signature)
+
+
+@memoize_by(_config_signature)
 def _all_remotes(repo=None):
     """ Returns all remotes. """
     remotes_output = silent_run('git remote', cwd=repo, return_output=True)
@@ -270,6 +289,7 @@ def remote_tracking_branch(repo=None):
         return remote_output
 
 
+@memoize_by(_refs_signature)
 def all_branches(repo=None, remotes=False, verbose=False):
     """ Returns all branches. The first element is the current branch. """
     cmd = ['git', 'branch']
@@ -409,6 +429,37 @@ def diff_repo(path=None, branch=None, context=None, return_output=False, name_on
     return run(cmd, cwd=path, return_output=return_output)
 
 
+def working_tree_hash(repo=None):
+    """
+    Hash of the working tree content, including uncommitted changes and untracked files that are not ignored.
+    Nothing is written to the repo: unchanged files use their blob IDs in the index, and only modified and untracked
+    files are hashed (without writing them to the object store).
+
+    :param str repo: Path to the repo. Defaults to current repo.
+    :return: Hash that is the same for the same content
+    """
+    repo = repo or repo_path()
+
+    blobs = {}
+    for line in silent_run(['git', 'ls-files', '-s', '-z'], cwd=repo, return_output=True).split('\0'):
+        if line:
+            info, path = line.split('\t', 1)
+            blobs[path] = info.split()[1]
+
+    changed = silent_run(['git', 'ls-files', '-m', '-d', '-o', '--exclude-standard', '-z'], cwd=repo, return_output=True)
+    changed = sorted(set(p for p in changed.split('\0') if p))
+    for path in changed:
+        blobs.pop(path, None)
+
+    changed = [p for p in changed if os.path.isfile(os.path.join(repo, p))]
+    for i in range(0, len(changed), 1000):  # Chunked to stay under ARG_MAX
+        paths = changed[i:i + 1000]
+        output = silent_run(['git', 'hash-object', '--'] + paths, cwd=repo, return_output=True)
+        blobs.update(zip(paths, output.split()))
+
+    return hashlib.sha1('\n'.join('{} {}'.format(p, b) for p, b in sorted(blobs.items())).encode('utf-8')).hexdigest()
+
+
 def commit_changes(msg):
     """ Commits any modified or new files with given message. Raises on error """
     silent_run(['git', 'commit', '-am', msg])
@@ -439,6 +490,8 @@ def checkout_product(product_url, checkout_path):
 
     if re.match(r'[\w-]+$', product_url):
         try:
+            import requests  # Slow to import, so only when needed
+
             logging.getLogger('requests').setLevel(logging.WARN)
             response = requests.get(config.checkout.search_api_url, params={'q': product_url}, timeout=10)
             response.raise_for_status()
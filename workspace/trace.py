@@ -0,0 +1,229 @@
+"""
+Tracing of subprocesses and phases of a wst run.
+
+Every subprocess spawned while tracing is recorded with its argv, cwd, repo, start/end time, exit code and bytes of
+output along with phases (commands and per-repo tasks in :func:`workspace.utils.parallel_call`). The result is saved
+as Chrome trace JSON that can be opened in chrome://tracing or https://ui.perfetto.dev
+"""
+from __future__ import absolute_import
+from contextlib import contextmanager
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from time import time
+
+
+log = logging.getLogger(__name__)
+
+_Popen = subprocess.Popen
+_tracer = None
+
+#: Modules that bind Popen on import, such as GitPython, and need to be patched separately if already imported
+POPEN_MODULES = {'git.cmd': ['Popen', 'safer_popen']}
+
+
+class Tracer(object):
+    """ Collects trace events for the current process """
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, name, start, end, cat, **args):
+        self.events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int(start * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': args
+        })
+
+    def save(self, path):
+        """ Save events as Chrome trace JSON to the given path """
+        from workspace.scm import product_name, repo_path
+
+        repos = {}
+        for event in self.events:
+            cwd = event['args'].get('cwd')
+            if cwd and 'repo' not in event['args']:
+                if cwd not in repos:
+                    repo = repo_path(cwd)
+                    repos[cwd] = repo and product_name(repo)
+                event['args']['repo'] = repos[cwd]
+
+        main_pid = os.getpid()
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                     'args': {'name': 'wst' if pid == main_pid else 'wst worker'}}
+                    for pid in sorted(set(e['pid'] for e in self.events) | {main_pid})]
+
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': metadata + sorted(self.events, key=lambda e: e['ts']),
+                       'displayTimeUnit': 'ms'}, fp)
+
+
+class _TracedPopen(_Popen):
+    """ Popen that records the process in the active tracer once it exits """
+
+    def __init__(self, args, *popenargs, **kwargs):
+        self._trace_start = time()
+        self._trace_recorded = False
+        self._trace_communicating = False
+        self._trace_bytes = 0
+        self._trace_cwd = kwargs.get('cwd') or os.getcwd()
+
+        super(_TracedPopen, self).__init__(args, *popenargs, **kwargs)
+
+        if self.stdout is not None:
+            self.stdout = _CountingReader(self.stdout, self)
+
+    def communicate(self, *args, **kwargs):
+        self._trace_communicating = True
+        try:
+            stdout, stderr = super(_TracedPopen, self).communicate(*args, **kwargs)
+        finally:
+            self._trace_communicating = False
+        self._trace_bytes = max(self._trace_bytes, len(stdout or b'') + len(stderr or b''))
+        self._trace_finish()
+        return stdout, stderr
+
+    def poll(self):
+        returncode = super(_TracedPopen, self).poll()
+        if returncode is not None:
+            self._trace_finish()
+        return returncode
+
+    def wait(self, *args, **kwargs):
+        returncode = super(_TracedPopen, self).wait(*args, **kwargs)
+        self._trace_finish()
+        return returncode
+
+    def _trace_finish(self):
+        if self._trace_recorded or self._trace_communicating or not _tracer:
+            return
+        self._trace_recorded = True
+
+        argv = self.args.split() if isinstance(self.args, (str, bytes)) else [str(a) for a in self.args]
+        name = ' '.join([os.path.basename(str(argv[0]))] + argv[1:2]) if argv else 'subprocess'
+
+        _tracer.add(name, self._trace_start, time(), 'subprocess', argv=argv, cwd=str(self._trace_cwd),
+                    exit_code=self.returncode, output_bytes=self._trace_bytes)
+
+
+class _CountingReader(object):
+    """ Wraps a process's stdout to count the bytes read from it """
+
+    def __init__(self, stream, process):
+        self._stream = stream
+        self._process = process
+
+    def _count(self, data):
+        self._process._trace_bytes += len(data)
+        return data
+
+    def read(self, *args):
+        return self._count(self._stream.read(*args))
+
+    def readline(self, *args):
+        return self._count(self._stream.readline(*args))
+
+    def __iter__(self):
+        for line in self._stream:
+            yield self._count(line)
+
+    def __getattr__(self, attr):
+        return getattr(self._stream, attr)
+
+
+class _TracedResult(object):
+    """ Result of a call made in a pool worker along with the events recorded during the call """
+
+    def __init__(self, result, events):
+        self.result = result
+        self.events = events
+
+
+def start():
+    """ Start tracing for the current process """
+    global _tracer
+
+    _tracer = Tracer()
+    _patch_popen(_TracedPopen)
+
+
+def stop(path=None):
+    """
+    Stop tracing and optionally save the trace.
+
+    :param str path: Path to save Chrome trace JSON to
+    """
+    global _tracer
+
+    _patch_popen(_Popen)
+
+    if _tracer and path:
+        _tracer.save(path)
+        log.debug('Saved %d trace events to %s', len(_tracer.events), path)
+
+    _tracer = None
+
+
+def _patch_popen(popen):
+    subprocess.Popen = popen
+    for name, attrs in POPEN_MODULES.items():
+        for attr in attrs:
+            if getattr(sys.modules.get(name), attr, None) in (_Popen, _TracedPopen):
+                setattr(sys.modules[name], attr, popen)
+
+
+def is_active():
+    return _tracer is not None
+
+
+def events():
+    """ List of events recorded so far """
+    return _tracer.events if _tracer else []
+
+
+@contextmanager
+def phase(name, **args):
+    """ Record the enclosed block as a phase when tracing is active """
+    if not _tracer:
+        yield
+        return
+
+    start_time = time()
+    try:
+        yield
+    finally:
+        if _tracer:
+            _tracer.add(name, start_time, time(), 'phase', **args)
+
+
+def traced_call(call, *args):
+    """ Make the call in a pool worker and return its result along with the events recorded during the call """
+    if not _tracer:  # Worker was spawned instead of forked
+        start()
+
+    mark = len(_tracer.events)
+    name = getattr(call, '__name__', 'task')
+
+    with phase('{} {}'.format(name, args[0]) if args else name):
+        result = call(*args)
+
+    return _TracedResult(result, _tracer.events[mark:])
+
+
+def collect(result):
+    """ Collect events from the result of :func:`traced_call` and return the call's result """
+    if isinstance(result, _TracedResult):
+        if _tracer:
+            _tracer.events.extend(result.events)
+        result.events = []
+        return result.result
+
+    return result
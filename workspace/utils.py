@@ -1,11 +1,18 @@
 from contextlib import contextmanager
+from copy import copy
+from functools import partial, wraps
+import json
 import logging
 import os
 import signal
+import subprocess
 import sys
 import tempfile
+from time import sleep, time
 from utils.process import run
 
+from workspace import trace
+
 
 log = logging.getLogger(__name__)
 
@@ -81,6 +88,118 @@ def parent_path_with(check, path=None):
     return parent_path_with(check, os.path.dirname(path))
 
 
+def cache_path(*paths):
+    """
+    Path in the cache dir for workspace-tools, which is $XDG_CACHE_HOME/workspace-tools or ~/.cache/workspace-tools
+
+    :param paths: Path components to join to the cache dir
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'workspace-tools', *paths)
+
+
+def load_cache(name, key):
+    """
+    Load data saved by :func:`save_cache`
+
+    :param str name: Name of the cache file in :func:`cache_path`
+    :param key: JSON serializable key that must match the key the data was saved with
+    :return: Cached data or None if it does not exist or the key does not match
+    """
+    try:
+        with open(cache_path(name)) as fp:
+            cache = json.load(fp)
+        if cache.get('key') == json.loads(json.dumps(key)):
+            return cache['data']
+    except Exception as e:
+        log.debug('Could not load cache %s: %s', name, e)
+
+
+def save_cache(name, key, data):
+    """
+    Save data to a cache file atomically so concurrent runs never read a partial file. Errors are only logged as the
+    cache is an optimization.
+
+    :param str name: Name of the cache file in :func:`cache_path`
+    :param key: JSON serializable key to check when the data is loaded, such as version or mtimes of the source
+    :param data: JSON serializable data to save
+    """
+    path = cache_path(name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + os.path.basename(name))
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'key': key, 'data': data}, fp)
+        os.rename(tmp_path, path)
+    except Exception as e:
+        log.debug('Could not save cache %s: %s', name, e)
+
+
+#: Files modified within this many seconds are not trusted to change their signature on the next change as file
+#: system timestamps can be coarse, so :func:`file_signature` returns None for them.
+RACY_SECONDS = 1
+
+
+def file_signature(paths):
+    """
+    Signature of the given files or dirs based on their mtime and size that changes when any of them changes.
+    Missing paths are included as None.
+
+    :param list paths: Paths to files or dirs
+    :return: List of (mtime, size) for each path, or None if any of them changed too recently to be trusted.
+    """
+    signature = []
+    now = time()
+
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append(None)
+            continue
+
+        if now - stat.st_mtime < RACY_SECONDS:
+            return None
+
+        signature.append((stat.st_mtime_ns, stat.st_size))
+
+    return signature
+
+
+def memoize_by(signature):
+    """
+    Decorator to memoize the function's result for its args for as long as signature(*args, **kwargs) stays the same.
+    The signature is checked on every call and the result is not memoized if it is None. This keeps results warm in
+    long running processes, like "wst shell", while staying correct when files change.
+
+    :param callable signature: Called with the function's args to get a signature of what the result depends on,
+                               such as :func:`file_signature` of files it reads.
+    """
+    def decorator(func):
+        results = {}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            current = signature(*args, **kwargs)
+
+            if current is not None and key in results and results[key][0] == current:
+                return copy(results[key][1])
+
+            result = func(*args, **kwargs)
+            if current is None:
+                results.pop(key, None)
+            else:
+                results[key] = (current, copy(result))
+
+            return result
+
+        wrapper.cache_clear = results.clear
+        return wrapper
+
+    return decorator
+
+
 @contextmanager
 def log_exception(title=None, exit=False, call=None, stack=False):
     """
@@ -126,6 +245,11 @@ def parallel_call(call, args, callback=None, workers=10, show_progress=None, pro
     def to_tuple(a):
         return a if isinstance(a, (list, tuple, set)) else [a]
 
+    if trace.is_active():
+        call = partial(trace.traced_call, call)
+        if callback:
+            callback = partial(_traced_callback, callback)
+
     try:
         async_results = [(arg, pool.apply_async(call, to_tuple(arg), callback=callback)) for arg in args]
 
@@ -135,7 +259,7 @@ def parallel_call(call, args, callback=None, workers=10, show_progress=None, pro
                 if arg not in results:
                     try:
                         # This allows processes to be interrupted by CTRL+C
-                        results[arg] = result.get(1)
+                        results[arg] = trace.collect(result.get(1))
                     except TimeoutError:
                         pass
                     except Exception as e:
@@ -160,6 +284,112 @@ def parallel_call(call, args, callback=None, workers=10, show_progress=None, pro
         sys.exit()
 
 
+#: Max number of bytes of the output tail returned by :func:`run_to_file`
+OUTPUT_TAIL_BYTES = 64 * 1024
+
+
+def run_to_file(cmd, output_file, tail_bytes=OUTPUT_TAIL_BYTES, **subprocess_args):
+    """
+    Run the command with its output (stdout and stderr) appended to the file as it is produced, so memory use does not
+    grow with the output.
+
+    :param str|list cmd: Command to run
+    :param str output_file: Path to the file to append the output to
+    :param int tail_bytes: Max number of bytes of the output tail to return. It starts at a line when cut.
+    :param dict subprocess_args: Additional args to pass to subprocess
+    :return: Tuple of (tail of the output from this run, True if the command exited with 0)
+    """
+    log.debug('Running: %s > %s', cmd if isinstance(cmd, str) else ' '.join(cmd), output_file)
+
+    with open(output_file, 'ab') as fp:
+        start = fp.tell()
+        try:
+            success = subprocess.call(cmd, stdout=fp, stderr=subprocess.STDOUT, **subprocess_args) == 0
+        except OSError as e:
+            fp.write('{}\n'.format(e).encode('utf-8'))
+            success = False
+
+    return file_tail(output_file, tail_bytes, start), success
+
+
+def file_tail(path, tail_bytes=OUTPUT_TAIL_BYTES, start=0):
+    """
+    Tail of the text file, which starts at a line when cut.
+
+    :param str path: Path to the file
+    :param int tail_bytes: Max number of bytes of the tail
+    :param int start: Position in the file to start from at the earliest
+    :return: Tail of the file or empty string if it does not exist
+    """
+    try:
+        tail_start = os.path.getsize(path) - tail_bytes
+        with open(path, 'rb') as fp:
+            fp.seek(max(start, tail_start))
+            tail = fp.read()
+    except (IOError, OSError):
+        return ''
+
+    if tail_start > start and b'\n' in tail:
+        tail = tail.split(b'\n', 1)[1]
+
+    return tail.decode('utf-8', 'replace')
+
+
+#: Dir in the cache dir with a lock file for each CPU token for :func:`cpu_tokens`
+CPU_TOKENS_DIR = 'cpu-tokens'
+
+
+@contextmanager
+def cpu_tokens(wanted, budget=None, share=1, poll_interval=0.1):
+    """
+    Context manager that acquires CPU tokens from a budget shared by all wst processes, such as parallel test runs, to
+    avoid running more busy processes than CPUs. Tokens are held by file locks, so they are handed back when the
+    context exits or the process dies.
+
+    :param int wanted: Maximum number of tokens wanted
+    :param int budget: Total number of tokens. Defaults to number of CPUs.
+    :param int share: Number of processes (including this one) that are starting and share the tokens that are free
+                      now, so this gets its part of them (rounded up) and the rest are left for the others.
+    :param float poll_interval: Seconds to wait between attempts when no tokens are available
+    :return: Number of tokens acquired, which is between 1 and wanted, waiting for at least 1 to be available.
+    """
+    import fcntl
+
+    budget = budget or os.cpu_count() or 1
+    token_dir = cache_path(CPU_TOKENS_DIR)
+    os.makedirs(token_dir, exist_ok=True)
+    held = []
+
+    try:
+        while not held:
+            for token in range(budget):
+                fp = open(os.path.join(token_dir, str(token)), 'a')
+                try:
+                    fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    held.append(fp)
+                except (IOError, OSError):
+                    fp.close()
+
+            # Hand back the free tokens that are not ours to take
+            keep = min(wanted, -(-len(held) // max(share, 1)))
+            for fp in held[keep:]:
+                fp.close()
+            held = held[:keep]
+
+            if not held:
+                sleep(poll_interval)
+
+        yield len(held)
+
+    finally:
+        for fp in held:
+            fp.close()
+
+
+def _traced_callback(callback, result):
+    return callback(trace.collect(result))
+
+
 def show_status(message):
     """
       :param str message: Status message to show. If not, then status bar will be cleared.
@@ -0,0 +1,186 @@
+"""
+Wheelhouse shared by all product envs in the cache dir.
+
+After an env is developed, wheels are built into the wheelhouse with the env's pip for the distributions installed in
+it that do not have one yet, so sdists and C extensions are built once for all products. Pip is then pointed to the
+wheelhouse with find-links, and the index is skipped entirely (--no-index) when the same requirements were fully built
+for the same interpreter before and they are all pinned (or "wheelhouse_offline" is set), which also makes rebuilding
+envs work offline. Otherwise, the index is still checked for new releases of unpinned requirements. Wheels that have
+not been used are removed by "wst clean".
+"""
+from __future__ import absolute_import
+from glob import glob
+import hashlib
+import logging
+import os
+import re
+from time import time
+
+from utils_core.process import run
+
+from workspace.config import config
+from workspace.deps import setup_requirements
+from workspace.envs import (canonical_name, editable_distributions, fingerprint, installed_distributions,
+                            normalize_requirements, requirement_name)
+from workspace.scm import product_name
+from workspace.utils import cache_path
+
+log = logging.getLogger(__name__)
+
+#: Dir in the cache dir for the wheelhouse
+WHEELHOUSE_DIR = 'wheelhouse'
+
+#: Dir in the wheelhouse with a marker file for each set of requirements that was fully built
+COMPLETE_DIR = '.complete'
+
+PINNED_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*(\[[^\]]*\])?\s*===?\s*[^\s*,;]+$')
+
+
+def wheelhouse_path(*paths):
+    """ Path to the wheelhouse or paths in it """
+    return cache_path(WHEELHOUSE_DIR, *paths)
+
+
+def _complete_marker(tox, env):
+    parts = fingerprint(tox, env)['parts']
+    key = '{interpreter}:{setup}:{requirements}'.format(**parts)
+    return wheelhouse_path(COMPLETE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def is_complete(tox, env):
+    """ Check if wheels for everything the env installs were built into the wheelhouse for its interpreter """
+    return os.path.exists(_complete_marker(tox, env))
+
+
+def is_pinned(tox, env):
+    """
+    Check if every requirement of the env (from requirement files, tox deps and setup.py / pyproject.toml) has an exact
+    version pinned by itself or by another requirement line (e.g. in pinned.txt), so the index has nothing newer to offer.
+    """
+    requirements = fingerprint(tox, env)['requirements'] + normalize_requirements('\n'.join(setup_requirements(tox.path)[1]))
+    pinned = set(requirement_name(r) for r in requirements if PINNED_RE.match(r))
+
+    for requirement in requirements:
+        if requirement.startswith('-') and not requirement.startswith(('-e', '--editable')):
+            continue  # Pip options
+        if requirement_name(requirement) not in pinned:
+            return False
+
+    return True
+
+
+def pip_environ(tox, envs):
+    """
+    Environment variables for pip to install from the wheelhouse, such as when tox develops the envs. The index is only
+    skipped when the wheelhouse is complete for the envs and their requirements are pinned (see :func:`is_pinned`), or
+    when "wheelhouse_offline" is set, so unpinned requirements still get new releases.
+
+    :param ToxIni tox: Tox config for the product
+    :param list envs: Names of the tox envs that will be developed
+    :return: Dict of environment variables
+    """
+    environ = {'PIP_FIND_LINKS': wheelhouse_path()}
+
+    if envs and all(is_complete(tox, env) and (config.test.wheelhouse_offline or is_pinned(tox, env)) for env in envs):
+        environ['PIP_NO_INDEX'] = '1'
+
+    return environ
+
+
+def _wheel_name_version(wheel):
+    name, version = os.path.basename(wheel).split('-')[:2]
+    return canonical_name(name), version
+
+
+def _python_tags(envdir):
+    """ Python tags of wheels that can be installed in the env, e.g. {'py3', 'py39', 'cp39'} """
+    pythons = glob(os.path.join(envdir, 'lib*', 'python*.*'))
+    if not pythons:
+        return set()
+
+    major, minor = os.path.basename(pythons[0])[len('python'):].split('.')[:2]
+    return {'py' + major, 'py' + major + minor, 'cp' + major + minor}
+
+
+def missing_wheels(tox, env):
+    """
+    Distributions installed in the env that do not have a wheel in the wheelhouse for the env's python yet, excluding
+    the product and editable installs.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env, which must be developed
+    :return: List of "name==version" requirements
+    """
+    envdir = tox.envdir(env)
+    python_tags = _python_tags(envdir)
+    wheels = set()
+
+    for wheel in glob(wheelhouse_path('*.whl')):
+        if python_tags.intersection(os.path.basename(wheel).split('-')[-3].split('.')):
+            wheels.add(_wheel_name_version(wheel))
+
+    excluded = editable_distributions(envdir) | {canonical_name(product_name(tox.path))}
+
+    return ['{}=={}'.format(name, version) for name, version in sorted(installed_distributions(envdir).items())
+            if version and name not in excluded and (name, version) not in wheels]
+
+
+def build_wheels(tox, env, silent=True):
+    """
+    Build wheels for the distributions installed in the env (see :func:`missing_wheels`) into the wheelhouse with the
+    env's pip, unless they were built already. Only wheels that are missing are built, so it is cheap after an
+    incremental update of the env.
+
+    :param ToxIni tox: Tox config for the product
+    :param str env: Name of the tox env, which must be developed
+    :param bool silent: Hide pip output
+    :return: True if the wheels were built (or were already), otherwise False
+    """
+    marker = _complete_marker(tox, env)
+    if os.path.exists(marker):
+        return True
+
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    requirements = missing_wheels(tox, env)
+
+    if requirements:
+        built = run([tox.bindir(env, 'pip'), 'wheel', '-q', '--no-deps', '--wheel-dir', wheelhouse_path()] + requirements,
+                    cwd=tox.path, raises=False, silent=silent)
+        if not built:
+            return False
+
+    open(marker, 'w').close()
+
+    return True
+
+
+def mark_used(envdir):
+    """ Mark wheels of the distributions installed in the env as used now by updating their mtime """
+    distributions = installed_distributions(envdir)
+
+    for wheel in glob(wheelhouse_path('*.whl')):
+        name, version = _wheel_name_version(wheel)
+        if distributions.get(name) == version:
+            os.utime(wheel, None)
+
+
+def remove_unused_wheels(days):
+    """
+    Remove wheels that have not been used for the given number of days.
+
+    :param int days: Number of days
+    :return: List of wheel file names that were removed
+    """
+    keep_time = time() - days * 86400
+    removed = []
+
+    for wheel in glob(wheelhouse_path('*.whl')):
+        if os.stat(wheel).st_mtime < keep_time:
+            os.remove(wheel)
+            removed.append(os.path.basename(wheel))
+
+    if removed:  # Requirements may no longer be fully built
+        for marker in glob(wheelhouse_path(COMPLETE_DIR, '*')):
+            os.remove(marker)
+
+    return removed